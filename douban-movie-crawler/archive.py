@@ -0,0 +1,149 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from utils import logger
+
+class PageArchive:
+    """按内容寻址的原始页面归档
+
+    页面HTML经zlib压缩后追加写入段文件(segment-XXXXX.dat)，内容相同的页面只存一份；
+    SQLite索引记录 URL+抓取时间 -> 内容摘要 -> 段文件偏移，读取时对段文件做内存映射随机访问
+    """
+    SEGMENT_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, root, segment_size=None):
+        self.root = root
+        self.segment_size = segment_size or self.SEGMENT_SIZE
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._maps = {}
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                raw_length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pages_url_fetched_at ON pages (url, fetched_at);
+        ''')
+        row = self._db.execute('SELECT MAX(segment) FROM blobs').fetchone()
+        self._segment = row[0] or 0
+
+    def _segment_path(self, segment):
+        return os.path.join(self.root, f'segment-{segment:05d}.dat')
+
+    def put(self, url, html, fetched_at=None):
+        """归档一次抓取结果，返回内容摘要"""
+        raw = html.encode('utf-8')
+        digest = hashlib.sha1(raw).hexdigest()
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            if not self._db.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+                data = zlib.compress(raw, 6)
+                path = self._segment_path(self._segment)
+                if os.path.exists(path) and os.path.getsize(path) + len(data) > self.segment_size:
+                    self._segment += 1
+                    path = self._segment_path(self._segment)
+                with open(path, 'ab') as f:
+                    offset = f.tell()
+                    f.write(data)
+                self._db.execute(
+                    'INSERT INTO blobs (digest, segment, offset, length, raw_length) VALUES (?, ?, ?, ?, ?)',
+                    (digest, self._segment, offset, len(data), len(raw))
+                )
+            self._db.execute(
+                'INSERT INTO pages (url, fetched_at, digest) VALUES (?, ?, ?)',
+                (url, fetched_at, digest)
+            )
+            self._db.commit()
+        return digest
+
+    def read(self, digest):
+        """按内容摘要读取页面"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT segment, offset, length FROM blobs WHERE digest = ?', (digest,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(digest)
+            segment, offset, length = row
+            data = self._map(segment, offset + length)[offset:offset + length]
+        return zlib.decompress(data).decode('utf-8')
+
+    def get(self, url, before=None):
+        """读取URL最近一次(或指定时间之前最近一次)的抓取结果，不存在时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest FROM pages WHERE url = ? AND fetched_at <= ? ORDER BY fetched_at DESC LIMIT 1',
+                (url, time.time() if before is None else before)
+            ).fetchone()
+        return self.read(row[0]) if row else None
+
+    def iter_latest(self):
+        """按抓取时间顺序遍历每个URL最近一次的抓取结果，产出 (url, fetched_at, html)"""
+        with self._lock:
+            rows = self._db.execute('''
+                SELECT url, MAX(fetched_at), digest FROM pages GROUP BY url ORDER BY MAX(fetched_at)
+            ''').fetchall()
+        for url, fetched_at, digest in rows:
+            yield url, fetched_at, self.read(digest)
+
+    def _map(self, segment, min_size):
+        """返回段文件的内存映射，文件追加后映射长度不足时重新映射"""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < min_size:
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+class ArchivingFetcher:
+    """抓取后端包装：把成功抓取的页面写入归档"""
+    def __init__(self, fetcher, archive):
+        self.fetcher = fetcher
+        self.archive = archive
+
+    @property
+    def name(self):
+        return self.fetcher.name
+
+    def fetch(self, url, headers=None):
+        # 延迟导入，避免回放模式加载抓取依赖
+        from fetcher import looks_blocked
+
+        result = self.fetcher.fetch(url, headers)
+        if result.status == 200 and not looks_blocked(result):
+            try:
+                self.archive.put(url, result.html)
+            except Exception as e:
+                logger.warning(f"归档页面失败 {url}: {e}")
+        return result
+
+    def close(self):
+        self.fetcher.close()
+        self.archive.close()
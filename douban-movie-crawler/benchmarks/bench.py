@@ -0,0 +1,274 @@
+"""解析与入库性能基准
+
+使用benchmarks/fixtures下保存的Top250列表页和电影详情页，测量parser.py各解析函数
+以及main.save_movie/main.save_relations入库路径的吞吐(页/秒)和峰值内存，
+入库使用进程内SQLite，不需要MySQL和网络。另在子进程中测量命令行启动耗时
+(main.py --help、只导入解析器)，超过--startup-budget-ms时视为退化。
+样本页面比线上页面小得多，详情页解析另用填充了内联脚本、侧栏和页脚的放大页面
+(见inflate_detail_page)另测一次。
+峰值内存由tracemalloc统计，只包含Python对象，不包含lxml在C层分配的文档树。
+
+用法:
+    python benchmarks/bench.py --output result.json
+    python benchmarks/bench.py --compare baseline.json --threshold 0.1
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, 'fixtures')
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# 基准测试不读取真实环境，为config.py中的必填项提供占位值
+for _key, _value in {
+    'DB_HOST': 'localhost', 'DB_PORT': '3306', 'DB_USER': 'bench', 'DB_PASSWORD': '',
+    'DB_NAME': 'bench', 'DB_CHARSET': 'utf8mb4', 'BASE_URL': 'https://movie.douban.com/top250',
+    'CRAWL_MODE': 'full', 'SLEEP_MIN': '0', 'SLEEP_MAX': '0', 'RETRY_TIMES': '1',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from bs4 import BeautifulSoup
+from sqlalchemy import event
+import database
+import main
+import parser as movie_parser
+from utils import logger
+
+def load_fixtures():
+    """读取列表页和详情页样本，返回 (列表页HTML列表, [(movie_id, 详情页HTML)])"""
+    list_pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, 'top250_list*.html'))):
+        with open(path, encoding='utf-8') as f:
+            list_pages.append(f.read())
+    detail_pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, 'detail_*.html'))):
+        movie_id = int(os.path.basename(path)[len('detail_'):-len('.html')])
+        with open(path, encoding='utf-8') as f:
+            detail_pages.append((movie_id, f.read()))
+    return list_pages, detail_pages
+
+def inflate_detail_page(html, head_kb=120, aside_kb=40, tail_kb=80):
+    """把样本详情页放大到线上页面的大小：head中加入内联脚本，div#content的侧栏中加入推荐条目，
+    页脚后加入统计脚本，解析出的字段不变"""
+    line = 'window._t && _t.push(["_trackEvent", "subject", "view"]);\n'
+    def script(kb):
+        return '<script>\n' + line * (kb * 1024 // len(line)) + '</script>\n'
+    item = '<dl><dt><a href="https://www.douban.com/doulist/1/"><img src="https://img.example/1.jpg"></a></dt><dd><a href="https://www.douban.com/doulist/1/">片单</a></dd></dl>\n'
+    aside = '<div class="aside">' + item * (aside_kb * 1024 // len(item))
+    return (html.replace('</head>', script(head_kb) + '</head>', 1)
+                .replace('<div class="aside">', aside, 1)
+                .replace('</body>', script(tail_kb) + '</body>', 1))
+
+def legacy_detail(html, movie_id):
+    """用BeautifulSoup版本的解析函数得到与parse_detail_page相同结构的结果"""
+    soup = BeautifulSoup(html, 'html.parser')
+    cover_img = soup.select_one('#mainpic img')
+    return {
+        'movie_info': movie_parser.parse_movie_info(soup),
+        'cover_url': cover_img.get('src') if cover_img else '',
+        'relations': movie_parser.parse_relations(soup, movie_id)
+    }
+
+def check_parity(detail_pages):
+    """校验单次遍历解析器(样本页和放大页)与兼容函数在样本上的输出完全一致"""
+    results = {}
+    for movie_id, html in detail_pages:
+        record = movie_parser.parse_detail_page(html, movie_id)
+        large = movie_parser.parse_detail_page(inflate_detail_page(html), movie_id)
+        # 兼容函数不提取页面中的电影链接
+        links = record.pop('links') == large.pop('links')
+        results[str(movie_id)] = links and record == large == legacy_detail(html, movie_id)
+    return results
+
+def measure(func, pages, min_time):
+    """重复执行func直到累计耗时超过min_time秒，返回吞吐、单页耗时和单轮峰值内存"""
+    func()  # 预热
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_pages = rounds * pages
+    return {
+        'pages': total_pages,
+        'seconds': round(elapsed, 4),
+        'pages_per_sec': round(total_pages / elapsed, 2),
+        'ms_per_page': round(elapsed * 1000 / total_pages, 4),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+
+def parser_benchmarks(list_pages, detail_pages, min_time):
+    results = {}
+    soups = [(movie_id, BeautifulSoup(html, 'html.parser')) for movie_id, html in detail_pages]
+
+    results['list.soup_select_items'] = measure(
+        lambda: [BeautifulSoup(html, 'html.parser').select('div.item') for html in list_pages],
+        len(list_pages), min_time)
+    results['list.parse_list_page'] = measure(
+        lambda: [movie_parser.parse_list_page(html) for html in list_pages],
+        len(list_pages), min_time)
+    results['detail.soup_build'] = measure(
+        lambda: [BeautifulSoup(html, 'html.parser') for _, html in detail_pages],
+        len(detail_pages), min_time)
+    for name in ('parse_movie_info', 'parse_directors', 'parse_writers', 'parse_actors', 'parse_genres'):
+        func = getattr(movie_parser, name)
+        results[f'detail.{name}'] = measure(lambda func=func: [func(soup) for _, soup in soups], len(soups), min_time)
+    results['detail.parse_reviews'] = measure(
+        lambda: [movie_parser.parse_reviews(soup, movie_id) for movie_id, soup in soups],
+        len(soups), min_time)
+    results['detail.legacy_full'] = measure(
+        lambda: [legacy_detail(html, movie_id) for movie_id, html in detail_pages],
+        len(detail_pages), min_time)
+    large_pages = [(movie_id, inflate_detail_page(html)) for movie_id, html in detail_pages]
+    for suffix, pages in (('', detail_pages), ('_large', large_pages)):
+        results[f'detail.parse_detail_page{suffix}'] = measure(
+            lambda pages=pages: [movie_parser.parse_detail_page(html, movie_id) for movie_id, html in pages],
+            len(pages), min_time)
+    return results
+
+def persistence_benchmarks(detail_pages, min_time):
+    """在内存SQLite上测量入库路径，并统计每部电影执行的SQL语句数"""
+    engine = database.bind_engine('sqlite://')
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(1))
+    db_handler = database.DatabaseHandler()
+    db_handler.create_tables()
+
+    records = []
+    soups = []
+    for movie_id, html in detail_pages:
+        record = movie_parser.parse_detail_page(html, movie_id)
+        record['movie_id'] = movie_id
+        record['url'] = f"https://movie.douban.com/subject/{movie_id}/"
+        records.append(record)
+        soups.append((movie_id, BeautifulSoup(html, 'html.parser')))
+
+    # 每轮使用新的电影ID，测量的是新增电影而非重复写入
+    next_id = [10 ** 9]
+    def save_records():
+        for record in records:
+            next_id[0] += 1
+            main.save_movie(db_handler, dict(record, movie_id=next_id[0]))
+
+    def save_relations():
+        for _, soup in soups:
+            next_id[0] += 1
+            main.save_relations(db_handler, next_id[0], soup)
+
+    results = {}
+    for name, func in (('persist.save_movie', save_records), ('persist.save_relations', save_relations)):
+        statements.clear()
+        result = measure(func, len(detail_pages), min_time)
+        result['statements_per_page'] = round(len(statements) / (result['pages'] + 2 * len(detail_pages)), 2)
+        results[name] = result
+    db_handler.close()
+    return results
+
+# 启动耗时测量项：子进程中执行的命令
+STARTUP_COMMANDS = {
+    'startup.main_help': ['main.py', '--help'],
+    'startup.import_parser': ['-c', 'import parser'],
+}
+
+def startup_benchmarks(rounds):
+    """在全新子进程中多次执行命令，返回各命令耗时的中位数和最大值(毫秒)"""
+    project_dir = os.path.dirname(BENCH_DIR)
+    results = {}
+    for name, command in STARTUP_COMMANDS.items():
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + command, cwd=project_dir, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            'rounds': rounds,
+            'median_ms': round(statistics.median(timings), 1),
+            'max_ms': round(max(timings), 1)
+        }
+    return results
+
+def compare(results, baseline, threshold):
+    """与基线结果比较吞吐，返回退化超过threshold的指标"""
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous:
+            continue
+        ratio = current['pages_per_sec'] / previous['pages_per_sec']
+        flag = '退化' if ratio < 1 - threshold else ''
+        print(f"{name:32s} {previous['pages_per_sec']:>12.2f} -> {current['pages_per_sec']:>12.2f} 页/秒  x{ratio:.2f} {flag}", file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main_cli():
+    arg_parser = argparse.ArgumentParser(description='解析与入库性能基准')
+    arg_parser.add_argument('--min-time', type=float, default=1.0, help='每项基准的最短测量时间(秒)')
+    arg_parser.add_argument('--output', default=None, help='结果JSON写入的文件，默认输出到标准输出')
+    arg_parser.add_argument('--compare', default=None, help='用于对比的基线结果JSON')
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help='吞吐下降超过该比例视为退化(默认0.1)')
+    arg_parser.add_argument('--startup-rounds', type=int, default=5, help='每条启动命令的执行次数(默认5，0为跳过)')
+    arg_parser.add_argument('--startup-budget-ms', type=float, default=300,
+                            help='启动耗时中位数上限(毫秒，默认300)，超过视为退化')
+    args = arg_parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    list_pages, detail_pages = load_fixtures()
+
+    benchmarks = parser_benchmarks(list_pages, detail_pages, args.min_time)
+    benchmarks.update(persistence_benchmarks(detail_pages, args.min_time))
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fixtures': {'list_pages': len(list_pages), 'detail_pages': len(detail_pages)}
+        },
+        'parity': check_parity(detail_pages),
+        'benchmarks': benchmarks,
+        'startup': startup_benchmarks(args.startup_rounds) if args.startup_rounds > 0 else {}
+    }
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    exit_code = 0
+    if not all(results['parity'].values()):
+        print("单次遍历解析结果与兼容函数不一致", file=sys.stderr)
+        exit_code = 1
+    for name, result in results['startup'].items():
+        if result['median_ms'] > args.startup_budget_ms:
+            print(f"{name} 启动耗时 {result['median_ms']}ms 超过上限 {args.startup_budget_ms:.0f}ms", file=sys.stderr)
+            exit_code = 1
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            if compare(results, json.load(f), args.threshold):
+                exit_code = 1
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
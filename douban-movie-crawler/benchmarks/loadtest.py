@@ -0,0 +1,177 @@
+"""端到端压测：启动本地模拟站点(mock_douban.py)，用SQLite代替MySQL运行完整的爬虫流程
+
+爬虫以http-only后端、不休眠、可配置的请求速率上限抓取模拟站点，结束后输出:
+电影吞吐(部/秒)、页面请求延迟p50/p99(爬虫侧按指标直方图分桶估算，模拟站点侧为精确值)、
+每部电影的SQL语句数，以及模拟站点注入的错误、403和验证码次数。`--` 之后的参数原样传给main.py。
+指定--proxy-block-rates时为每一项启动一个替身代理(按该比例返回403)，爬虫通过出口身份池经由这些代理抓取，
+--rate为每个出口各自的速率上限，结果中附带各出口的请求数、健康分和替身代理的统计。
+模拟站点与爬虫在同一进程中运行，CPU核数少时爬虫侧延迟包含两者争用GIL的等待。
+
+用法:
+    python benchmarks/loadtest.py --catalogue 250 --workers 8 --latency-ms 50
+    python benchmarks/loadtest.py --error-rate 0.05 --block-rate 0.02 --output result.json
+    python benchmarks/loadtest.py --catalogue 5000 -- --discover --discover-budget 1000
+    python benchmarks/loadtest.py --proxy-block-rates 0,0,0.3 --rate 20
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from mock_douban import MockCatalogue, MockDoubanServer
+
+def percentile(values, q):
+    """精确分位数，values为空时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+def configure_env(base_url, args):
+    """压测环境覆盖真实配置：抓取地址必须指向模拟站点，不休眠，拦截冷却和失败重试的等待缩短"""
+    os.environ.update({
+        'BASE_URL': f'{base_url}/top250', 'CRAWL_MODE': 'full', 'SLEEP_MIN': '0', 'SLEEP_MAX': '0',
+        'RATE_INITIAL': str(args.rate), 'RATE_MAX': str(args.rate), 'RATE_BURST': str(max(1, args.workers)),
+        'BLOCK_COOLDOWN': str(args.block_cooldown), 'RETRY_TIMES': str(args.retry_times),
+        'RETRY_BASE_DELAY': str(args.retry_delay), 'FRONTIER_BACKEND': 'sqlite',
+        'ARCHIVE_DIR': '', 'SEEN_BLOOM_PATH': '', 'METRICS_PORT': '0', 'METRICS_SUMMARY_PATH': '',
+    })
+    # config.py中的必填项，不会实际连接MySQL
+    for key, value in {
+        'DB_HOST': 'localhost', 'DB_PORT': '3306', 'DB_USER': 'loadtest', 'DB_PASSWORD': '',
+        'DB_NAME': 'loadtest', 'DB_CHARSET': 'utf8mb4',
+    }.items():
+        os.environ.setdefault(key, value)
+
+def run_crawler(workdir, args, crawler_args, proxies=()):
+    """在当前进程中运行main.main()，返回耗时(秒)"""
+    # 延迟导入，环境变量设置完成后再加载配置
+    import database
+    import main
+    database.bind_engine(f"sqlite:///{os.path.join(workdir, 'loadtest.db')}")
+    argv = sys.argv
+    sys.argv = [
+        'main.py', '--backend', 'http-only', '--workers', str(args.workers), '--parse-workers', str(args.parse_workers),
+        '--frontier', os.path.join(workdir, 'frontier.db'), '--fresh', '--proxies', ','.join(proxies)
+    ] + crawler_args
+    start = time.perf_counter()
+    try:
+        main.main()
+    finally:
+        sys.argv = argv
+    return time.perf_counter() - start
+
+def collect(elapsed, server, proxy_servers=()):
+    """汇总爬虫指标和模拟站点(含替身代理)统计"""
+    import metrics
+    saved = metrics.MOVIES.summary().get('result=saved', 0)
+    requests = server.stats['requests'] + sum(proxy.stats['requests'] for proxy in proxy_servers)
+    statements = sum(metrics.DB_STATEMENTS.summary().values())
+    save_statements = metrics.STATEMENTS_PER_MOVIE.summary().get('_', {})
+    fetch_latency = {
+        'p50_ms': ms(metrics.FETCH_SECONDS.quantile(0.5, backend='http')),
+        'p99_ms': ms(metrics.FETCH_SECONDS.quantile(0.99, backend='http')),
+        'max_ms': ms(metrics.FETCH_SECONDS.summary().get('backend=http', {}).get('max')),
+    }
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'movies_saved': saved,
+        'movies_per_sec': round(saved / elapsed, 2) if elapsed else 0,
+        'requests': requests,
+        'requests_per_sec': round(requests / elapsed, 2) if elapsed else 0,
+        'fetch_latency': fetch_latency,
+        'server_latency': server_latency([server, *proxy_servers]),
+        'db_statements_per_movie': round(statements / saved, 2) if saved else None,
+        'save_statements_per_movie': save_statements.get('avg'),
+        'movies': metrics.MOVIES.summary(),
+        'server': dict(server.stats),
+        'errors': metrics.ERRORS.summary(),
+        'retries': metrics.RETRIES.summary(),
+        'identities': {
+            'requests': metrics.IDENTITY_REQUESTS.summary(),
+            'health': {key: round(value, 3) for key, value in metrics.IDENTITY_HEALTH.summary().items()},
+        } if proxy_servers else None,
+        'proxies': {proxy.base_url: dict(proxy.stats, block_rate=proxy.block_rate) for proxy in proxy_servers} or None,
+    }
+
+def server_latency(servers):
+    latencies = [latency for server in servers for latency in server.latencies]
+    return {
+        'p50_ms': ms(percentile(latencies, 0.5)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='对本地模拟站点运行完整爬虫的端到端压测')
+    arg_parser.add_argument('--catalogue', type=int, default=250, help='模拟站点的电影条目数量(默认250)')
+    arg_parser.add_argument('--latency-ms', type=float, default=20, help='模拟站点每个请求的响应延迟(毫秒，默认20)')
+    arg_parser.add_argument('--jitter-ms', type=float, default=10, help='响应延迟的随机波动(毫秒，默认10)')
+    arg_parser.add_argument('--error-rate', type=float, default=0, help='返回500的请求比例')
+    arg_parser.add_argument('--block-rate', type=float, default=0, help='返回403的请求比例')
+    arg_parser.add_argument('--captcha-rate', type=float, default=0, help='返回验证码页面的请求比例')
+    arg_parser.add_argument('--seed', type=int, default=0, help='模拟站点的随机种子')
+    arg_parser.add_argument('--workers', type=int, default=8, help='爬虫抓取详情页的worker数量(默认8)')
+    arg_parser.add_argument('--parse-workers', type=int, default=0, help='爬虫解析详情页的进程数(默认0)')
+    arg_parser.add_argument('--rate', type=float, default=1000, help='爬虫请求速率上限(次/秒，默认1000)')
+    arg_parser.add_argument('--block-cooldown', type=float, default=1, help='被拦截后的冷却时间(秒，默认1)')
+    arg_parser.add_argument('--retry-times', type=int, default=3, help='页面失败后的最多尝试次数(默认3)')
+    arg_parser.add_argument('--proxy-block-rates', default='', help='逗号分隔，每一项启动一个按该比例返回403的替身代理')
+    arg_parser.add_argument('--retry-delay', type=float, default=0.2, help='失败重试的基础退避时间(秒，默认0.2)')
+    arg_parser.add_argument('--output', help='把结果写入JSON文件')
+    arg_parser.add_argument('--keep', action='store_true', help='保留SQLite数据库和抓取队列文件')
+    arg_parser.add_argument('--verbose', action='store_true', help='输出爬虫的INFO日志')
+    args, crawler_args = arg_parser.parse_known_args()
+    if crawler_args[:1] == ['--']:
+        crawler_args = crawler_args[1:]
+
+    # 先于main.setup_logging配置根日志，日志只输出到终端，不写crawler.log
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    server = MockDoubanServer(
+        MockCatalogue(args.catalogue, args.seed), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, block_rate=args.block_rate, captcha_rate=args.captcha_rate, seed=args.seed
+    ).start()
+    proxy_servers = [
+        MockDoubanServer(
+            server.catalogue, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+            block_rate=float(rate), captcha_rate=args.captcha_rate, seed=args.seed + i + 1
+        ).start()
+        for i, rate in enumerate(args.proxy_block_rates.split(',')) if rate.strip()
+    ]
+    workdir = tempfile.mkdtemp(prefix='douban-loadtest-')
+    try:
+        configure_env(server.base_url, args)
+        elapsed = run_crawler(workdir, args, crawler_args, [proxy.base_url for proxy in proxy_servers])
+        result = collect(elapsed, server, proxy_servers)
+    finally:
+        server.stop()
+        for proxy in proxy_servers:
+            proxy.stop()
+        if args.keep:
+            print(f"数据库和抓取队列保存在 {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'keep', 'verbose')}
+    result['config']['crawler_args'] = crawler_args
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""本地模拟豆瓣电影站点，用于压测和故障注入
+
+按parser.py解析的页面结构生成Top250列表页、电影详情页和短评分页，内容由电影ID确定性生成，
+不访问真实网站。可配置电影条目数量、响应延迟、5xx错误率以及403和验证码页的注入比例；
+详情页带ETag，条件请求命中时返回304。
+同一个服务也可作为出口身份池的本地替身代理：代理请求中的绝对地址按路径直接应答，
+页面中的链接使用请求的Host，各替身代理可配置不同的故障比例。
+
+用法:
+    python benchmarks/mock_douban.py --port 8800 --catalogue 5000 --latency-ms 50 --error-rate 0.01
+    BASE_URL=http://127.0.0.1:8800/top250 python main.py --backend http-only
+    python benchmarks/mock_douban.py --port 8801 --block-rate 0.3   # 替身代理
+    BASE_URL=http://127.0.0.1:8800/top250 python main.py --backend http-only --proxies direct,http://127.0.0.1:8801
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# 模拟电影ID从该值开始连续编号，按编号顺序即为Top250排名
+FIRST_MOVIE_ID = 2000000
+PAGE_SIZE = 25
+GENRES = ['剧情', '喜剧', '动作', '爱情', '科幻', '动画', '悬疑', '惊悚', '犯罪', '冒险', '奇幻', '家庭']
+COUNTRIES = ['中国大陆', '美国', '日本', '法国', '英国', '韩国', '意大利', '德国']
+LANGUAGES = ['汉语普通话', '英语', '日语', '法语', '韩语', '意大利语', '德语']
+RATING_TITLES = ['很差', '较差', '还行', '推荐', '力荐']
+# 验证码页面，包含fetcher.BLOCK_MARKERS中的特征
+CAPTCHA_PAGE = '<html><body><p>检测到有异常请求从你的 IP 发出</p><form><input name="captcha-solution"></form></body></html>'
+
+DETAIL_PATTERN = re.compile(r'^/subject/(\d+)/?$')
+COMMENTS_PATTERN = re.compile(r'^/subject/(\d+)/comments/?$')
+
+class MockCatalogue:
+    """模拟的电影条目：catalogue_size部电影，前250部(或全部)组成Top250"""
+    def __init__(self, size=250, seed=0, reviews_per_movie=60):
+        self.size = size
+        self.seed = seed
+        self.reviews_per_movie = reviews_per_movie
+
+    def __contains__(self, movie_id):
+        return FIRST_MOVIE_ID <= movie_id < FIRST_MOVIE_ID + self.size
+
+    def movie(self, movie_id):
+        """按电影ID确定性生成电影数据"""
+        rng = random.Random(self.seed * 1000003 + movie_id)
+        index = movie_id - FIRST_MOVIE_ID
+        people = lambda count: [(1000000 + rng.randrange(50000), f'影人{rng.randrange(50000)}') for _ in range(count)]
+        return {
+            'movie_id': movie_id,
+            'rank': index + 1,
+            'title': f'模拟电影{index + 1}',
+            'year': 1950 + rng.randrange(75),
+            'release_date': date(1950, 1, 1) + timedelta(days=rng.randrange(27000)),
+            'directors': people(rng.randint(1, 2)),
+            'writers': people(rng.randint(1, 3)),
+            'actors': people(rng.randint(3, 10)),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'country': rng.choice(COUNTRIES),
+            'language': rng.choice(LANGUAGES),
+            'runtime': rng.randint(80, 180),
+            'rating': round(9.7 - index * 3.0 / max(1, self.size), 1),
+            'votes': rng.randint(1000, 3000000),
+            'summary': '　　' + '剧情简介' * rng.randint(20, 80),
+            'recommendations': [
+                FIRST_MOVIE_ID + rng.randrange(self.size) for _ in range(min(10, self.size))
+            ],
+            'review_count': rng.randint(0, self.reviews_per_movie),
+        }
+
+    def reviews(self, movie_id, start, limit):
+        """短评分页，返回 (短评列表, 是否还有下一页)"""
+        total = self.movie(movie_id)['review_count']
+        reviews = []
+        for offset in range(start, min(total, start + limit)):
+            rng = random.Random(movie_id * 7919 + offset)
+            reviews.append({
+                'review_id': movie_id * 1000 + offset,
+                'user_name': f'用户{rng.randrange(100000)}',
+                'rating': rng.randint(1, 5),
+                'content': '短评内容' * rng.randint(2, 30),
+                'publish_date': datetime(2010, 1, 1) + timedelta(seconds=rng.randrange(400000000)),
+            })
+        return reviews, start + limit < total
+
+def render_list_page(catalogue, start, base_url=''):
+    """Top250列表页，详情页链接与真实页面一样为base_url开头的绝对地址"""
+    top = min(250, catalogue.size)
+    items = []
+    for movie_id in range(FIRST_MOVIE_ID + start, FIRST_MOVIE_ID + min(top, start + PAGE_SIZE)):
+        movie = catalogue.movie(movie_id)
+        items.append(f'''
+        <li>
+            <div class="item">
+                <div class="pic">
+                    <em class="">{movie['rank']}</em>
+                    <a href="{base_url}/subject/{movie_id}/"><img width="100" alt="{movie['title']}" src="/img/{movie_id}.webp" class=""></a>
+                </div>
+                <div class="info">
+                    <div class="hd">
+                        <a href="{base_url}/subject/{movie_id}/" class=""><span class="title">{movie['title']}</span></a>
+                    </div>
+                    <div class="bd">
+                        <p class="">{movie['year']}&nbsp;/&nbsp;{movie['country']}&nbsp;/&nbsp;{' '.join(movie['genres'])}</p>
+                        <div class="star">
+                            <span class="rating5-t"></span>
+                            <span class="rating_num" property="v:average">{movie['rating']}</span>
+                            <span property="v:best" content="10.0"></span>
+                            <span>{movie['votes']}人评价</span>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </li>''')
+    next_link = ''
+    if start + PAGE_SIZE < top:
+        next_link = f'<span class="next"><a href="?start={start + PAGE_SIZE}&amp;filter=">后页&gt;</a></span>'
+    return f'''<!DOCTYPE html>
+<html lang="zh-CN"><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"><title>豆瓣电影 Top 250</title></head>
+<body><div id="wrapper"><div id="content"><h1>豆瓣电影 Top 250</h1>
+<div class="grid-16-8 clearfix"><div class="article"><ol class="grid_view">{''.join(items)}
+</ol><div class="paginator">{next_link}<span class="count">(共{top}条)</span></div></div></div></div></div></body></html>'''
+
+def _people_links(people, base_url, rel=None):
+    rel_attr = f' rel="{rel}"' if rel else ''
+    return ' / '.join(f'<a href="{base_url}/celebrity/{person_id}/"{rel_attr}>{escape(name)}</a>' for person_id, name in people)
+
+def _comment_items(reviews):
+    items = []
+    for review in reviews:
+        items.append(f'''
+<div class="comment-item " data-cid="{review['review_id']}">
+    <div class="comment">
+        <h3>
+            <span class="comment-info">
+                <a href="/people/u{review['review_id']}/" class="">{escape(review['user_name'])}</a>
+                <span>看过</span>
+                <span class="allstar{review['rating']}0 rating" title="{RATING_TITLES[review['rating'] - 1]}"></span>
+                <span class="comment-time " title="{review['publish_date']:%Y-%m-%d %H:%M:%S}">{review['publish_date']:%Y-%m-%d}</span>
+            </span>
+        </h3>
+        <p class=" comment-content"><span class="short">{escape(review['content'])}</span></p>
+    </div>
+</div>''')
+    return ''.join(items)
+
+def render_detail_page(catalogue, movie_id, base_url=''):
+    """电影详情页"""
+    movie = catalogue.movie(movie_id)
+    genres = ' / '.join(f'<span property="v:genre">{genre}</span>' for genre in movie['genres'])
+    # 推荐链接使用相对地址，parser.canonical_movie_id只识别豆瓣域名和相对地址
+    recommendations = ''.join(
+        f'<dl class=""><dd><a href="/subject/{other}/?from=subject-page" class="">模拟电影{other - FIRST_MOVIE_ID + 1}</a></dd></dl>'
+        for other in movie['recommendations']
+    )
+    hot_reviews, _ = catalogue.reviews(movie_id, 0, 5)
+    return f'''<!DOCTYPE html>
+<html lang="zh-CN"><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"><title>{movie['title']} (豆瓣)</title>
+<script type="text/javascript">var _config = {{"movie": {movie_id}}};</script></head>
+<body><div id="wrapper"><div id="content">
+    <h1><span property="v:itemreviewed">{movie['title']}</span> <span class="year">({movie['year']})</span></h1>
+    <div class="grid-16-8 clearfix"><div class="article">
+<div id="mainpic" class=""><a class="nbgnbg" href="/subject/{movie_id}/photos?type=R"><img src="/img/p{movie_id}.webp" rel="v:image" /></a></div>
+<div id="info">
+        <span ><span class='pl'>导演</span>: <span class='attrs'>{_people_links(movie['directors'], base_url, 'v:directedBy')}</span></span><br/>
+        <span ><span class='pl'>编剧</span>: <span class='attrs'>{_people_links(movie['writers'], base_url)}</span></span><br/>
+        <span class="actor"><span class='pl'>主演</span>: <span class='attrs'>{_people_links(movie['actors'], base_url, 'v:starring')}</span></span><br/>
+        <span class="pl">类型:</span> {genres}<br/>
+        <span class="pl">制片国家/地区:</span> {movie['country']}<br/>
+        <span class="pl">语言:</span> {movie['language']}<br/>
+        <span class="pl">上映日期:</span> <span property="v:initialReleaseDate" content="{movie['release_date']:%Y-%m-%d}({movie['country']})">{movie['release_date']:%Y-%m-%d}</span><br/>
+        <span class="pl">片长:</span> <span property="v:runtime" content="{movie['runtime']}">{movie['runtime']}分钟</span><br/>
+        <span class="pl">又名:</span> Mock Movie {movie_id}<br/>
+        <span class="pl">IMDb:</span> tt{movie_id:07d}<br>
+</div>
+<div id="interest_sectl"><div class="rating_self clearfix" typeof="v:Rating">
+    <strong class="ll rating_num" property="v:average">{movie['rating']}</strong>
+    <div class="rating_sum"><a href="comments" class="rating_people"><span property="v:votes">{movie['votes']}</span>人评价</a></div>
+</div></div>
+<div class="related-info"><div class="indent" id="link-report-intra"><span property="v:summary" class="">{movie['summary']}</span></div></div>
+<div id="recommendations" class=""><h2><i class="">喜欢这部电影的人也喜欢</i></h2><div class="recommendations-bd">{recommendations}</div></div>
+<div id="comments-section"><div class="mod-bd"><div id="hot-comments" class="tab">{_comment_items(hot_reviews)}</div></div></div>
+    </div><div class="aside"><p>侧栏</p></div></div>
+</div></div>
+<div id="footer">&copy; mock</div></body></html>'''
+
+def render_comments_page(catalogue, movie_id, start, limit):
+    """短评分页"""
+    reviews, has_next = catalogue.reviews(movie_id, start, limit)
+    next_link = f'<a href="?start={start + limit}&amp;limit={limit}&amp;status=P&amp;sort=time" class="next">后页 &gt;</a>' if has_next else ''
+    return f'''<!DOCTYPE html>
+<html lang="zh-CN"><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8"></head>
+<body><div id="content"><div id="comments" class="mod-bd">{_comment_items(reviews)}</div>
+<div id="paginator" class="center">{next_link}</div></div></body></html>'''
+
+class MockDoubanServer:
+    """在后台线程中运行的模拟站点
+
+    每个请求先等待latency_ms(±jitter_ms)毫秒，再按比例注入故障：error_rate返回500，
+    block_rate返回403，captcha_rate返回带验证码特征的200页面。stats记录请求数和注入的故障数，
+    latencies记录每个请求的服务端处理耗时(秒)
+    """
+    def __init__(self, catalogue, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, block_rate=0.0, captcha_rate=0.0, seed=0):
+        self.catalogue = catalogue
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.captcha_rate = captcha_rate
+        self.stats = {'requests': 0, 'list': 0, 'detail': 0, 'comments': 0, 'not_modified': 0,
+                      'not_found': 0, 'errors': 0, 'blocked': 0, 'captcha': 0}
+        self.latencies = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-douban', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _fault(self):
+        """按配置的比例决定本次请求注入的故障，返回 error/blocked/captcha 或None"""
+        with self._lock:
+            roll = self._rng.random()
+        for name, rate in (('errors', self.error_rate), ('blocked', self.block_rate), ('captcha', self.captcha_rate)):
+            if roll < rate:
+                return name
+            roll -= rate
+        return None
+
+    def _delay(self):
+        delay = self.latency_ms
+        if self.jitter_ms:
+            with self._lock:
+                delay += self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def handle(self, path, query, headers, base_url=None):
+        """返回 (状态码, 响应头, 正文)，base_url为页面中绝对链接使用的站点地址"""
+        base_url = base_url or self.base_url
+        self._count('requests')
+        self._delay()
+        fault = self._fault()
+        if fault:
+            self._count(fault)
+            if fault == 'errors':
+                return 500, {}, '<html><body>500 Internal Server Error</body></html>'
+            if fault == 'blocked':
+                return 403, {}, '<html><body>403 Forbidden</body></html>'
+            return 200, {}, CAPTCHA_PAGE
+
+        if path.rstrip('/') == '/top250':
+            self._count('list')
+            start = int(query.get('start', ['0'])[0] or 0)
+            return 200, {}, render_list_page(self.catalogue, start, base_url)
+        match = DETAIL_PATTERN.match(path)
+        if match and int(match.group(1)) in self.catalogue:
+            movie_id = int(match.group(1))
+            etag = f'"mock-{self.catalogue.seed}-{movie_id}"'
+            if headers.get('If-None-Match') == etag:
+                self._count('not_modified')
+                return 304, {'ETag': etag}, ''
+            self._count('detail')
+            return 200, {'ETag': etag}, render_detail_page(self.catalogue, movie_id, base_url)
+        match = COMMENTS_PATTERN.match(path)
+        if match and int(match.group(1)) in self.catalogue:
+            self._count('comments')
+            start = int(query.get('start', ['0'])[0] or 0)
+            limit = int(query.get('limit', ['20'])[0] or 20)
+            return 200, {}, render_comments_page(self.catalogue, int(match.group(1)), start, limit)
+        self._count('not_found')
+        return 404, {}, '<html><body>404 Not Found</body></html>'
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 支持keep-alive，与真实站点一样复用连接
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                start = time.perf_counter()
+                # 作为替身代理时请求行是绝对地址，只取路径
+                parts = urlsplit(self.path)
+                host = self.headers.get('Host')
+                status, headers, body = server.handle(
+                    parts.path, parse_qs(parts.query), self.headers, f'http://{host}' if host else None
+                )
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.latencies.append(time.perf_counter() - start)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='本地模拟豆瓣电影站点')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8800)
+    arg_parser.add_argument('--catalogue', type=int, default=250, help='电影条目数量(默认250)')
+    arg_parser.add_argument('--latency-ms', type=float, default=0, help='每个请求的响应延迟(毫秒)')
+    arg_parser.add_argument('--jitter-ms', type=float, default=0, help='响应延迟的随机波动(毫秒)')
+    arg_parser.add_argument('--error-rate', type=float, default=0, help='返回500的请求比例')
+    arg_parser.add_argument('--block-rate', type=float, default=0, help='返回403的请求比例')
+    arg_parser.add_argument('--captcha-rate', type=float, default=0, help='返回验证码页面的请求比例')
+    arg_parser.add_argument('--seed', type=int, default=0, help='随机种子，决定生成的内容和故障注入序列')
+    args = arg_parser.parse_args()
+
+    server = MockDoubanServer(
+        MockCatalogue(args.catalogue, args.seed), args.host, args.port, args.latency_ms, args.jitter_ms,
+        args.error_rate, args.block_rate, args.captcha_rate, args.seed
+    ).start()
+    print(f"模拟站点已启动: {server.base_url}/top250 (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
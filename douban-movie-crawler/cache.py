@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from database import Session
+from config import CRAWL_CONFIG
+from utils import logger
+
+class LRUCache:
+    """线程安全的定长LRU缓存，记录命中和未命中次数"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self._data)
+        
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+            
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+class EntityIdCache:
+    """豆瓣人物/类型ID -> 本地自增ID 的进程级缓存
+    
+    事务中新解析到的ID先暂存在会话上，提交成功后才写入缓存，
+    回滚时丢弃，避免缓存指向未落库的自增ID
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._caches = {}
+        self._lock = threading.Lock()
+        
+    def _cache_for(self, model):
+        with self._lock:
+            if model.__tablename__ not in self._caches:
+                self._caches[model.__tablename__] = LRUCache(self.maxsize)
+            return self._caches[model.__tablename__]
+            
+    def lookup(self, model, keys):
+        """返回 (已缓存的映射, 未命中的键列表)"""
+        cache = self._cache_for(model)
+        found, missing = {}, []
+        for key in keys:
+            local_id = cache.get(key)
+            if local_id is None:
+                missing.append(key)
+            else:
+                found[key] = local_id
+        return found, missing
+        
+    def update(self, model, id_map):
+        cache = self._cache_for(model)
+        for key, local_id in id_map.items():
+            cache.put(key, local_id)
+            
+    def stage(self, session, model, id_map):
+        """暂存事务中解析到的ID，提交后生效"""
+        session.info.setdefault('staged_entity_ids', []).append((model, id_map))
+        
+    def warm_up(self, session, entity_specs):
+        """启动时用一次投影查询预加载每类实体的ID映射"""
+        for model, key_attr in entity_specs:
+            key_column = getattr(model, key_attr)
+            rows = (
+                session.query(key_column, model.id)
+                .filter(model.deleted_at == None)
+                .order_by(model.id.desc())
+                .limit(self.maxsize)
+                .all()
+            )
+            self.update(model, dict(reversed(rows)))
+            logger.info(f"预加载 {model.__tablename__} 缓存 {len(rows)} 条")
+        session.commit()
+        
+    def stats(self):
+        """各实体缓存的大小与命中统计"""
+        stats = {}
+        with self._lock:
+            caches = dict(self._caches)
+        for name, cache in caches.items():
+            total = cache.hits + cache.misses
+            stats[name] = {
+                'size': len(cache),
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'hit_rate': round(cache.hits / total, 4) if total else 0.0
+            }
+        return stats
+
+entity_id_cache = EntityIdCache(CRAWL_CONFIG['entity_cache_size'])
+
+@event.listens_for(Session, 'after_commit')
+def _apply_staged_entity_ids(session):
+    for model, id_map in session.info.pop('staged_entity_ids', []):
+        entity_id_cache.update(model, id_map)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_staged_entity_ids(session, previous_transaction):
+    session.info.pop('staged_entity_ids', None)
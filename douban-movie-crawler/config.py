@@ -1,27 +1,101 @@
 import os
 import logging
-from dotenv import load_dotenv
+import threading
+from collections.abc import Mapping
 
-# 加载.env文件中的环境变量
-load_dotenv()
+_env_loaded = False
+
+def load_env():
+    """加载.env文件中的环境变量，只在第一次读取配置时执行"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+def require_env(name):
+    """读取必填的环境变量，缺失时给出明确提示"""
+    value = os.getenv(name)
+    if value is None:
+        raise RuntimeError(f"缺少环境变量 {name}，请在.env或环境中配置")
+    return value
+
+class LazyConfig(Mapping):
+    """延迟加载的配置字典：第一次读取时才加载.env并解析环境变量，
+    只用到部分功能的命令不会因为其他模块的配置缺失而失败"""
+    def __init__(self, loader):
+        self._loader = loader
+        self._data = None
+        self._lock = threading.Lock()
+        
+    def _load(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    load_env()
+                    self._data = self._loader()
+        return self._data
+        
+    def __getitem__(self, key):
+        return self._load()[key]
+        
+    def __iter__(self):
+        return iter(self._load())
+        
+    def __len__(self):
+        return len(self._load())
 
 # 数据库配置
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST'),
-    'port': int(os.getenv('DB_PORT')),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME'),
-    'charset': os.getenv('DB_CHARSET')
-}
+DB_CONFIG = LazyConfig(lambda: {
+    'host': require_env('DB_HOST'),
+    'port': int(require_env('DB_PORT')),
+    'user': require_env('DB_USER'),
+    'password': os.getenv('DB_PASSWORD', ''),
+    'database': require_env('DB_NAME'),
+    'charset': os.getenv('DB_CHARSET', 'utf8mb4')
+})
 
 # 爬取配置
-CRAWL_CONFIG = {
-    'base_url': os.getenv('BASE_URL'),
-    'mode': os.getenv('CRAWL_MODE'),
-    'sleep_min': float(os.getenv('SLEEP_MIN')),
-    'sleep_max': float(os.getenv('SLEEP_MAX')),
-    'retry_times': int(os.getenv('RETRY_TIMES')),
+CRAWL_CONFIG = LazyConfig(lambda: {
+    'base_url': os.getenv('BASE_URL', 'https://movie.douban.com/top250'),
+    'mode': os.getenv('CRAWL_MODE', 'incremental'),
+    'sleep_min': float(os.getenv('SLEEP_MIN', 1)),
+    'sleep_max': float(os.getenv('SLEEP_MAX', 3)),
+    'retry_times': int(os.getenv('RETRY_TIMES', 3)),
+    'workers': int(os.getenv('WORKERS', 1)),
+    # 详情页解析进程数，0为在解析线程内解析；流水线各阶段队列长度，0为按抓取worker数推算
+    'parse_workers': int(os.getenv('PARSE_WORKERS', 0)),
+    'pipeline_queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', 0)),
+    # 发现模式：每次运行最多新加入的电影数、从Top250出发的最大链接深度
+    'discovery_budget': int(os.getenv('DISCOVERY_BUDGET', 10000)),
+    'discovery_max_depth': int(os.getenv('DISCOVERY_MAX_DEPTH', 3)),
+    # 自适应限速(次/秒)，未配置初始值和上限时按SLEEP_MIN/SLEEP_MAX推算
+    'rate_initial': float(os.getenv('RATE_INITIAL', 0)),
+    'rate_min': float(os.getenv('RATE_MIN', 0.05)),
+    'rate_max': float(os.getenv('RATE_MAX', 0)),
+    'rate_burst': int(os.getenv('RATE_BURST', 1)),
+    'rate_target_latency': float(os.getenv('RATE_TARGET_LATENCY', 2)),
+    'block_cooldown': float(os.getenv('BLOCK_COOLDOWN', 60)),
+    'fetch_backend': os.getenv('FETCH_BACKEND', 'http'),
+    # 出口身份池：逗号分隔的代理地址，direct表示直连；每个身份按上面的RATE_*配置独立限速
+    'proxy_pool': [proxy.strip() for proxy in os.getenv('PROXY_POOL', '').split(',') if proxy.strip()],
+    'identity_health_half_life': float(os.getenv('IDENTITY_HEALTH_HALF_LIFE', 300)),
+    'entity_cache_size': int(os.getenv('ENTITY_CACHE_SIZE', 100000)),
+    'entity_cache_warm': os.getenv('ENTITY_CACHE_WARM') == 'True',
+    'writer_queue_size': int(os.getenv('WRITER_QUEUE_SIZE', 100)),
+    'commit_batch_size': int(os.getenv('COMMIT_BATCH_SIZE', 20)),
+    'commit_interval': float(os.getenv('COMMIT_INTERVAL', 5)),
+    'seen_bloom_path': os.getenv('SEEN_BLOOM_PATH'),
+    'archive_dir': os.getenv('ARCHIVE_DIR'),
+    'frontier_path': os.getenv('FRONTIER_PATH'),
+    'frontier_backend': os.getenv('FRONTIER_BACKEND', 'sqlite'),
+    'lease_seconds': int(os.getenv('LEASE_SECONDS', 600)),
+    'retry_base_delay': float(os.getenv('RETRY_BASE_DELAY', 30)),
+    'worker_id': os.getenv('WORKER_ID'),
+    'review_batch_size': int(os.getenv('REVIEW_BATCH_SIZE', 500)),
+    'review_max_per_movie': int(os.getenv('REVIEW_MAX_PER_MOVIE', 0)),
+    'metrics_port': int(os.getenv('METRICS_PORT', 0)) or None,
+    'metrics_summary_path': os.getenv('METRICS_SUMMARY_PATH'),
     'user_agent_pool': [
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36',
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/116.0',
@@ -34,7 +108,7 @@ CRAWL_CONFIG = {
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/110.0',
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
     ]
-}
+})
 
 # 日志配置
 LOG_CONFIG = {
@@ -44,7 +118,17 @@ LOG_CONFIG = {
 }
 
 # Chrome驱动配置
-DRIVER_CONFIG = {
+DRIVER_CONFIG = LazyConfig(lambda: {
     'executable_path': os.getenv('DRIVER_EXECUTABLE_PATH'),
-    'headless': os.getenv('HEADLESS') == 'True'
-}
\ No newline at end of file
+    'headless': os.getenv('HEADLESS') == 'True',
+    # 精简模式：不加载图片/音视频/字体，DOM就绪即返回
+    'lean': os.getenv('DRIVER_LEAN', 'True') == 'True',
+    'page_load_timeout': float(os.getenv('DRIVER_PAGE_LOAD_TIMEOUT', 30)),
+    'script_timeout': float(os.getenv('DRIVER_SCRIPT_TIMEOUT', 30)),
+    # 只允许访问以下域名，其他第三方请求(统计、广告等)直接解析失败
+    'block_third_party': os.getenv('DRIVER_BLOCK_THIRD_PARTY') == 'True',
+    'allowed_hosts': os.getenv('DRIVER_ALLOWED_HOSTS', 'douban.com,doubanio.com').split(','),
+    # 浏览器处理的页面数或内存(MB)超过阈值后重建，0表示不限制
+    'max_pages': int(os.getenv('DRIVER_MAX_PAGES', 200)),
+    'max_memory_mb': int(os.getenv('DRIVER_MAX_MEMORY_MB', 1024))
+})
\ No newline at end of file
@@ -1,18 +1,49 @@
 import logging
+import threading
 
-from sqlalchemy import create_engine, Column, String, Integer, DECIMAL, Date, DateTime, Text, BIGINT
+from sqlalchemy import create_engine, Column, String, Integer, Float, DECIMAL, Date, DateTime, Text, BIGINT, Index
+from sqlalchemy import inspect, select, update, delete, func, and_, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 from config import DB_CONFIG
-
-# 创建数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
-)
+import metrics
 
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+
+class _LazySessionmaker(sessionmaker):
+    """第一次创建会话时才创建数据库引擎"""
+    def __call__(self, **local_kw):
+        if self.kw.get('bind') is None and 'bind' not in local_kw:
+            get_engine()
+        return super().__call__(**local_kw)
+
+Session = _LazySessionmaker()
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """返回模块级数据库引擎，第一次调用时按DB_CONFIG创建MySQL引擎"""
+    with _engine_lock:
+        if 'engine' not in globals():
+            bind_engine(
+                f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
+            )
+    return engine
+
+def bind_engine(url, **kwargs):
+    """把模块级引擎和会话工厂切换到指定数据库，如基准测试使用的SQLite"""
+    global engine
+    metrics.instrument_sqlalchemy()
+    engine = create_engine(url, **kwargs)
+    Session.configure(bind=engine)
+    return engine
+
+def __getattr__(name):
+    # database.engine 在第一次访问时创建
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class DatabaseHandler:
     def __init__(self):
@@ -24,21 +55,107 @@ class DatabaseHandler:
         
     def create_tables(self):
         """创建所有数据表"""
-        Base.metadata.create_all(engine)
+        Base.metadata.create_all(get_engine())
+        
+    def missing_indexes(self):
+        """返回模型中定义但数据库中尚不存在的索引"""
+        inspector = inspect(self.session.get_bind())
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            existing |= {constraint['name'] for constraint in inspector.get_unique_constraints(table.name)}
+            missing.extend(index for index in table.indexes if index.name not in existing)
+        return missing
+        
+    def missing_columns(self):
+        """返回模型中定义但数据库表中尚不存在的字段"""
+        inspector = inspect(self.session.get_bind())
+        missing = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            missing.extend(column for column in table.columns if column.name not in existing)
+        return missing
+        
+    def migrate_schema(self):
+        """为已有数据库补建新增字段、唯一索引和查询索引，返回新建的字段和索引名
+        
+        建唯一索引前先清理重复数据：保留自增ID最小的一行，
+        实体表的重复行会先把关联表中的引用改指向保留行再删除
+        """
+        bind = self.session.get_bind()
+        created = []
+        for column in self.missing_columns():
+            with bind.begin() as conn:
+                column_ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column_ddl}"))
+            logging.info(f"已新增字段 {column.table.name}.{column.name}")
+            created.append(f"{column.table.name}.{column.name}")
+            
+        missing = self.missing_indexes()
+        # 先处理实体表，再处理关联表，保证关联表去重时引用已合并
+        missing.sort(key=lambda index: index.table.name in RELATION_TABLES)
+        for index in missing:
+            with bind.begin() as conn:
+                if index.unique:
+                    removed = _deduplicate(conn, index.table, list(index.columns))
+                    if removed:
+                        logging.warning(f"表 {index.table.name} 清理了 {removed} 条重复数据")
+                index.create(bind=conn)
+            logging.info(f"已创建索引 {index.table.name}.{index.name}")
+            created.append(f"{index.table.name}.{index.name}")
+        return created
+        
+    def iter_movie_ids(self, batch_size=10000):
+        """按升序流式读取未删除电影的ID，只取movie_id列并使用服务端游标"""
+        stmt = (
+            select(Movie.movie_id)
+            .where(Movie.deleted_at == None)
+            .order_by(Movie.movie_id)
+            .execution_options(yield_per=batch_size)
+        )
+        with self.session.get_bind().connect() as conn:
+            for movie_id in conn.execute(stmt).scalars():
+                yield movie_id
+                
+    def get_movie_fingerprints(self, movie_ids):
+        """批量读取电影的变更检测指纹，返回 movie_id -> {page_hash, content_hash, etag, last_modified}"""
+        if not movie_ids:
+            return {}
+        rows = self.session.execute(
+            select(Movie.movie_id, Movie.page_hash, Movie.content_hash, Movie.etag, Movie.last_modified)
+            .where(Movie.movie_id.in_(list(movie_ids)), Movie.deleted_at == None)
+        ).all()
+        self.session.commit()
+        return {
+            row.movie_id: {
+                'page_hash': row.page_hash,
+                'content_hash': row.content_hash,
+                'etag': row.etag,
+                'last_modified': row.last_modified
+            }
+            for row in rows
+        }
         
     def get_existing_movie_ids(self):
         """获取数据库中已存在的电影ID"""
         try:
-            existing_movies = self.session.query(Movie).filter(Movie.deleted_at == None).all()
-            return [movie.movie_id for movie in existing_movies]
+            return set(self.iter_movie_ids())
         except Exception as e:
             logging.error(f"获取已有电影ID失败: {e}")
-            return []
+            return set()
 
 # 定义电影表
 class Movie(Base):
     __tablename__ = 'movies'
-    __table_args__ = {'comment': '豆瓣电影信息表'}
+    __table_args__ = (
+        Index('uk_movie_id', 'movie_id', unique=True),
+        Index('idx_deleted_at_movie_id', 'deleted_at', 'movie_id'),
+        {'comment': '豆瓣电影信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='电影自增ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
     title = Column(String(255), nullable=False, default='', comment='电影标题')
@@ -48,11 +165,16 @@ class Movie(Base):
     runtime = Column(BIGINT, nullable=False, default=0, comment='电影时长')
     rating = Column(DECIMAL(3, 1), nullable=False, default=0.00, comment='电影评分')
     rating_count = Column(Integer, nullable=False, default=0, comment='评分人数')
+    top250_rank = Column(Integer, nullable=False, default=0, server_default='0', comment='Top250排名，0为未知')
     cover_url = Column(String(255), nullable=False, default='', comment='电影封面URL')
     summary = Column(Text, nullable=True, comment='电影简介')
     url = Column(String(255), nullable=False, default='', comment='电影详情页URL')
     imdb = Column(String(50), nullable=False, default='', comment='IMDb编号')
     aka = Column(String(255), nullable=False, default='', comment='又名')
+    page_hash = Column(String(40), nullable=False, default='', server_default='', comment='详情页原始HTML摘要')
+    content_hash = Column(String(40), nullable=False, default='', server_default='', comment='解析字段摘要')
+    etag = Column(String(255), nullable=False, default='', server_default='', comment='详情页ETag')
+    last_modified = Column(String(64), nullable=False, default='', server_default='', comment='详情页Last-Modified')
     created_at = Column(DateTime, nullable=True, comment='创建时间')
     updated_at = Column(DateTime, nullable=True, comment='更新时间')
     deleted_at = Column(DateTime, nullable=True, comment='删除时间')
@@ -60,7 +182,10 @@ class Movie(Base):
 # 定义导演表
 class Director(Base):
     __tablename__ = 'directors'
-    __table_args__ = {'comment': '电影导演信息表'}
+    __table_args__ = (
+        Index('uk_director_id', 'director_id', unique=True),
+        {'comment': '电影导演信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='导演自增ID')
     director_id = Column(Integer, nullable=False, default=0, comment='豆瓣导演ID')
     name = Column(String(255), nullable=False, default='', comment='导演姓名')
@@ -71,7 +196,11 @@ class Director(Base):
 # 定义电影与导演关联表
 class MovieDirectorRelation(Base):
     __tablename__ = 'movie_director_relation'
-    __table_args__ = {'comment': '电影与导演关联表'}
+    __table_args__ = (
+        Index('uk_movie_director', 'movie_id', 'director_id', unique=True),
+        Index('idx_director_id_deleted_at', 'director_id', 'deleted_at'),
+        {'comment': '电影与导演关联表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='关联表自增ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
     director_id = Column(Integer, nullable=False, default=0, comment='豆瓣导演ID')
@@ -82,7 +211,10 @@ class MovieDirectorRelation(Base):
 # 定义编剧表
 class Writer(Base):
     __tablename__ = 'writers'
-    __table_args__ = {'comment': '电影编剧信息表'}
+    __table_args__ = (
+        Index('uk_writer_id', 'writer_id', unique=True),
+        {'comment': '电影编剧信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='编剧自增ID')
     writer_id = Column(Integer, nullable=False, default=0, comment='豆瓣编剧ID')
     name = Column(String(255), nullable=False, default='', comment='编剧姓名')
@@ -93,7 +225,11 @@ class Writer(Base):
 # 定义电影与编剧关联表
 class MovieWriterRelation(Base):
     __tablename__ = 'movie_writer_relation'
-    __table_args__ = {'comment': '电影与编剧关联表'}
+    __table_args__ = (
+        Index('uk_movie_writer', 'movie_id', 'writer_id', unique=True),
+        Index('idx_writer_id_deleted_at', 'writer_id', 'deleted_at'),
+        {'comment': '电影与编剧关联表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='关联表自增ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
     writer_id = Column(Integer, nullable=False, default=0, comment='豆瓣编剧ID')
@@ -104,7 +240,10 @@ class MovieWriterRelation(Base):
 # 定义演员表
 class Actor(Base):
     __tablename__ = 'actors'
-    __table_args__ = {'comment': '电影演员信息表'}
+    __table_args__ = (
+        Index('uk_actor_id', 'actor_id', unique=True),
+        {'comment': '电影演员信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='演员自增ID')
     actor_id = Column(Integer, nullable=False, default=0, comment='豆瓣演员ID')
     name = Column(String(255), nullable=False, default='', comment='演员姓名')
@@ -115,7 +254,11 @@ class Actor(Base):
 # 定义电影与演员关联表
 class MovieActorRelation(Base):
     __tablename__ = 'movie_actor_relation'
-    __table_args__ = {'comment': '电影与演员关联表'}
+    __table_args__ = (
+        Index('uk_movie_actor', 'movie_id', 'actor_id', unique=True),
+        Index('idx_actor_id_deleted_at', 'actor_id', 'deleted_at'),
+        {'comment': '电影与演员关联表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='关联表自增ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
     actor_id = Column(Integer, nullable=False, default=0, comment='豆瓣演员ID')
@@ -126,7 +269,10 @@ class MovieActorRelation(Base):
 # 定义电影类型表
 class Genre(Base):
     __tablename__ = 'genres'
-    __table_args__ = {'comment': '电影类型信息表'}
+    __table_args__ = (
+        Index('uk_genre_id', 'genre_id', unique=True),
+        {'comment': '电影类型信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='电影类型自增ID')
     genre_id = Column(String(50), nullable=False, default='', comment='电影类型ID')
     genre_name = Column(String(255), nullable=False, default='', comment='电影类型名称')
@@ -137,7 +283,11 @@ class Genre(Base):
 # 定义电影与类型关联表
 class MovieGenreRelation(Base):
     __tablename__ = 'movie_genre_relation'
-    __table_args__ = {'comment': '电影与类型关联表'}
+    __table_args__ = (
+        Index('uk_movie_genre', 'movie_id', 'genre_id', unique=True),
+        Index('idx_genre_id_deleted_at', 'genre_id', 'deleted_at'),
+        {'comment': '电影与类型关联表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='关联表自增ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
     genre_id = Column(String(50), nullable=False, default='', comment='电影类型ID')
@@ -148,7 +298,11 @@ class MovieGenreRelation(Base):
 # 定义评论表
 class Review(Base):
     __tablename__ = 'reviews'
-    __table_args__ = {'comment': '电影评论信息表'}
+    __table_args__ = (
+        Index('uk_review_id', 'review_id', unique=True),
+        Index('idx_movie_id_deleted_at', 'movie_id', 'deleted_at'),
+        {'comment': '电影评论信息表'}
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='评论自增ID')
     review_id = Column(String(50), nullable=False, default='', comment='豆瓣评论ID')
     movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
@@ -159,4 +313,120 @@ class Review(Base):
     created_at = Column(DateTime, nullable=True, comment='创建时间')
     updated_at = Column(DateTime, nullable=True, comment='更新时间')
     deleted_at = Column(DateTime, nullable=True, comment='删除时间')
-    
\ No newline at end of file
+
+# 定义短评抓取进度表
+class ReviewCrawlProgress(Base):
+    __tablename__ = 'review_crawl_progress'
+    __table_args__ = (
+        Index('uk_progress_movie_id', 'movie_id', unique=True),
+        {'comment': '短评抓取进度表'}
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='进度自增ID')
+    movie_id = Column(Integer, nullable=False, default=0, comment='豆瓣电影ID')
+    next_start = Column(Integer, nullable=False, default=0, comment='下一页短评的起始偏移')
+    fetched_count = Column(Integer, nullable=False, default=0, comment='已抓取短评数')
+    finished_at = Column(DateTime, nullable=True, comment='翻页结束时间')
+    newest_publish_date = Column(DateTime, nullable=True, comment='已抓取短评中最新的发布时间，增量刷新抓到此处为止')
+    created_at = Column(DateTime, nullable=True, comment='创建时间')
+    updated_at = Column(DateTime, nullable=True, comment='更新时间')
+
+# 定义分布式抓取队列表
+class CrawlTask(Base):
+    __tablename__ = 'crawl_frontier'
+    __table_args__ = (
+        Index('uk_url', 'url', unique=True),
+        Index('idx_kind_state_next_eligible_at', 'kind', 'state', 'next_eligible_at'),
+        Index('idx_kind_state_priority_page', 'kind', 'state', 'priority', 'page'),
+        {'comment': '分布式抓取队列表'}
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True, comment='任务自增ID')
+    url = Column(String(255), nullable=False, default='', comment='页面URL')
+    kind = Column(String(20), nullable=False, default='', comment='页面类型(list/detail)')
+    movie_id = Column(Integer, nullable=True, comment='豆瓣电影ID')
+    page = Column(Integer, nullable=True, comment='列表页页码')
+    state = Column(String(20), nullable=False, default='pending', comment='任务状态')
+    attempts = Column(Integer, nullable=False, default=0, comment='已尝试次数')
+    next_eligible_at = Column(DateTime, nullable=False, default=datetime(1970, 1, 1), comment='下次可领取时间')
+    lease_owner = Column(String(255), nullable=False, default='', comment='持有租约的worker')
+    lease_expires_at = Column(DateTime, nullable=True, comment='租约到期时间')
+    last_error = Column(String(500), nullable=False, default='', comment='最近一次失败原因')
+    priority = Column(Float, nullable=False, default=0, server_default='0', comment='优先级，数值越小越先领取')
+    depth = Column(Integer, nullable=False, default=0, server_default='0', comment='发现深度，种子任务为0')
+    top250_rank = Column(Integer, nullable=True, comment='列表页上的Top250排名，发现的电影为空')
+    created_at = Column(DateTime, nullable=True, comment='创建时间')
+    updated_at = Column(DateTime, nullable=True, comment='更新时间')
+
+# 关联表名及实体表与其关联表的对应关系
+RELATION_TABLES = {
+    'movie_director_relation', 'movie_writer_relation',
+    'movie_actor_relation', 'movie_genre_relation',
+}
+ENTITY_RELATIONS = {
+    'directors': (MovieDirectorRelation, 'director_id'),
+    'writers': (MovieWriterRelation, 'writer_id'),
+    'actors': (MovieActorRelation, 'actor_id'),
+    'genres': (MovieGenreRelation, 'genre_id'),
+}
+
+def upsert(session, model, rows, update_columns):
+    """批量写入，唯一键冲突时只更新update_columns中的字段
+    
+    MySQL使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite/PostgreSQL使用 ON CONFLICT，
+    update_columns为空时冲突行保持不变
+    """
+    if not rows:
+        return
+    from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+    table = model.__table__
+    conflict_columns = [column.name for column in _unique_index(table).columns]
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        values = {name: stmt.inserted[name] for name in update_columns}
+        if not values:
+            # 用自身赋值实现冲突时不更新
+            values = {conflict_columns[0]: table.c[conflict_columns[0]]}
+        stmt = stmt.on_duplicate_key_update(values)
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={name: stmt.excluded[name] for name in update_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    else:
+        raise NotImplementedError(f"不支持的数据库类型: {dialect}")
+    session.execute(stmt, rows)
+
+def _unique_index(table):
+    """返回表上用于判定重复的唯一索引"""
+    for index in table.indexes:
+        if index.unique:
+            return index
+    raise ValueError(f"表 {table.name} 没有定义唯一索引")
+
+def _deduplicate(conn, table, columns):
+    """删除唯一键重复的数据，返回删除的行数"""
+    duplicates = conn.execute(
+        select(*columns, func.min(table.c.id)).group_by(*columns).having(func.count() > 1)
+    ).all()
+    removed = 0
+    for *key, keep_id in duplicates:
+        condition = and_(*(column == value for column, value in zip(columns, key)))
+        dup_ids = conn.execute(select(table.c.id).where(condition, table.c.id != keep_id)).scalars().all()
+        if table.name in ENTITY_RELATIONS:
+            relation_model, relation_column = ENTITY_RELATIONS[table.name]
+            column = relation_model.__table__.c[relation_column]
+            # 关联表的类型ID列是字符串
+            cast = str if isinstance(column.type, String) else int
+            conn.execute(
+                update(relation_model.__table__)
+                .where(column.in_([cast(dup_id) for dup_id in dup_ids]))
+                .values({relation_column: cast(keep_id)})
+            )
+        conn.execute(delete(table).where(table.c.id.in_(dup_ids)))
+        removed += len(dup_ids)
+    return removed
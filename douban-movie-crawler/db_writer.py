@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+from database import DatabaseHandler
+from config import CRAWL_CONFIG
+from utils import logger
+import metrics
+
+# 通知写库线程退出、立即提交当前批次的哨兵
+_STOP = object()
+_FLUSH = object()
+
+class DBWriter(threading.Thread):
+    """后台写库线程
+    
+    抓取线程把解析好的记录放入有界队列，写库线程每攒够batch_size条
+    或距上次提交超过interval秒就合并提交一次。队列满时submit阻塞，
+    对抓取形成背压；close时把剩余记录全部提交后退出。
+    每条记录提交成功后调用on_saved(record)，最终失败时调用on_failed(record, exception)
+    """
+    def __init__(self, save_func, queue_size=None, batch_size=None, interval=None, on_saved=None, on_failed=None):
+        super().__init__(name='db-writer', daemon=True)
+        self.save_func = save_func
+        self.on_saved = on_saved
+        self.on_failed = on_failed
+        self.batch_size = batch_size or CRAWL_CONFIG['commit_batch_size']
+        self.interval = interval or CRAWL_CONFIG['commit_interval']
+        self.queue = queue.Queue(maxsize=queue_size or CRAWL_CONFIG['writer_queue_size'])
+        self.saved_count = 0
+        
+    def submit(self, record):
+        """提交一条待保存记录，队列满时阻塞"""
+        if not self.is_alive():
+            raise RuntimeError("写库线程未运行")
+        self.queue.put(record)
+        
+    def flush(self):
+        """让写库线程立即提交当前批次，不必等到提交时限(不等待提交完成)"""
+        if self.is_alive():
+            self.queue.put(_FLUSH)
+            
+    def close(self):
+        """提交剩余记录并等待写库线程退出"""
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+            
+    def run(self):
+        db_handler = DatabaseHandler()
+        batch = []
+        deadline = None
+        try:
+            while True:
+                # 批次为空时一直等待，否则最多等到本批次的提交时限
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                try:
+                    record = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    record = None
+                if record is _STOP:
+                    break
+                if record is _FLUSH:
+                    self._flush(db_handler, batch)
+                    batch = []
+                    continue
+                if record is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.interval
+                    batch.append(record)
+                if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                    self._flush(db_handler, batch)
+                    batch = []
+            self._flush(db_handler, batch)
+        finally:
+            db_handler.close()
+            
+    def _flush(self, db_handler, batch):
+        """合并提交一批记录，失败时回滚并逐条重试以隔离出错的记录
+
+        回调只在提交成功或最终失败后调用，回调出错不影响已提交的记录
+        """
+        if not batch:
+            return
+        try:
+            for record in batch:
+                self.save_func(db_handler, record, commit=False)
+            with metrics.COMMIT_SECONDS.time():
+                db_handler.session.commit()
+        except Exception as e:
+            db_handler.session.rollback()
+            logger.warning(f"批量提交 {len(batch)} 部电影失败: {e}，改为逐条提交")
+        else:
+            metrics.MOVIES_PER_COMMIT.observe(len(batch))
+            self._saved(batch)
+            return
+        for record in batch:
+            try:
+                self.save_func(db_handler, record)
+            except Exception as e:
+                logger.error(f"处理电影 {record['url']} 失败: {e}")
+                metrics.MOVIES.inc(result='failed')
+                metrics.ERRORS.inc(stage='save')
+                self._callback(self.on_failed, record, e)
+            else:
+                self._saved([record])
+
+    def _saved(self, records):
+        self.saved_count += len(records)
+        metrics.MOVIES.inc(len(records), result='saved')
+        for record in records:
+            logger.info(f"成功保存电影 {record['movie_id']}: {record['movie_info'].get('title', '未知标题')}")
+            self._callback(self.on_saved, record)
+
+    def _callback(self, func, record, *args):
+        """调用on_saved/on_failed，出错只记录日志，不影响其他记录和写库线程"""
+        if not func:
+            return
+        try:
+            func(record, *args)
+        except Exception as e:
+            logger.error(f"电影 {record['url']} 的回调失败: {e}")
+            metrics.ERRORS.inc(stage='writer_callback')
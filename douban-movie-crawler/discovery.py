@@ -0,0 +1,56 @@
+import math
+import threading
+from seen import SeenIndex
+from utils import logger
+import metrics
+
+class DiscoveryScheduler:
+    """发现模式：把详情页中链接到的其他电影加入抓取队列，逐步扩展到Top250之外
+
+    链接已由解析器规范化为豆瓣电影ID。已入库(seen_movie_ids)或本次运行已调度过的ID直接跳过，
+    后者存放在紧凑的SeenIndex中；上次运行已加入队列的URL由抓取队列按URL去重。
+    新任务的深度为来源页面深度+1，超过max_depth不再调度；优先级为深度减去来源电影评分人数的
+    对数/10，同一深度内来自热门电影的链接先抓取。本次运行最多新加入budget个任务
+    """
+    def __init__(self, frontier, seen_movie_ids, url_for, budget, max_depth):
+        self.frontier = frontier
+        self.seen_movie_ids = seen_movie_ids
+        self.url_for = url_for
+        self.budget = budget
+        self.max_depth = max_depth
+        self.scheduled = 0
+        self._discovered = SeenIndex()
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.scheduled >= self.budget
+
+    def priority(self, depth, parent_votes):
+        # 评分人数的对数不超过1，深度始终优先
+        return depth - min(1.0, math.log10(parent_votes + 1) / 10)
+
+    def schedule(self, task, record):
+        """把一条解析结果中的电影链接加入抓取队列，返回新加入的任务数"""
+        depth = task.depth + 1
+        if depth > self.max_depth or self.exhausted:
+            return 0
+        priority = self.priority(depth, record['movie_info'].get('rating_count') or 0)
+        added = 0
+        for movie_id in record.get('links', ()):
+            with self._lock:
+                if self.exhausted:
+                    break
+                if movie_id in self.seen_movie_ids or movie_id in self._discovered:
+                    continue
+                self._discovered.add(movie_id)
+            if self.frontier.add(self.url_for(movie_id), 'detail', movie_id=movie_id, priority=priority, depth=depth):
+                with self._lock:
+                    self.scheduled += 1
+                    added += 1
+                    if self.exhausted:
+                        logger.info(f"发现预算 {self.budget} 已用完，不再加入新发现的电影")
+        if added:
+            metrics.DISCOVERED.inc(added)
+            logger.debug(f"电影 {task.movie_id} 的页面中发现 {added} 部新电影(深度 {depth})")
+        return added
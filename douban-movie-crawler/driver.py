@@ -1,27 +1,217 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from utils import get_random_user_agent, retry
+from utils import get_random_user_agent, retry, logger
 from config import DRIVER_CONFIG
 
-@retry(tries=3, delay=2)
-def create_driver():
-    """创建浏览器驱动实例"""
+# 精简模式下通过CDP屏蔽的资源：图片、音视频、字体
+BLOCKED_RESOURCE_PATTERNS = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+]
+
+@retry(tries=3, delay=2, exceptions=(WebDriverException, OSError))
+def create_driver(lean=None):
+    """创建浏览器驱动实例
+
+    lean为True(默认取DRIVER_CONFIG['lean'])时使用精简配置：不加载图片、音视频和字体，
+    页面加载策略为eager(DOM就绪即返回)，可选只允许访问豆瓣域名
+    """
+    lean = DRIVER_CONFIG['lean'] if lean is None else lean
     chrome_options = Options()
-    
+
     # 设置随机User-Agent
     chrome_options.add_argument(f'user-agent={get_random_user_agent()}')
-        
+
     # 无头模式
     if DRIVER_CONFIG['headless']:
         chrome_options.add_argument('--headless')
         chrome_options.add_argument('--disable-gpu')
         chrome_options.add_argument('--no-sandbox')
-        
+
     # 其他优化选项
-    chrome_options.add_argument('--window-size=1920,1080')
     chrome_options.add_argument('--disable-dev-shm-usage')
-    
+    if lean:
+        chrome_options.add_argument('--window-size=1280,800')
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--mute-audio')
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })
+        chrome_options.page_load_strategy = 'eager'
+        if DRIVER_CONFIG['block_third_party']:
+            # 非白名单域名一律解析失败，浏览器不会发出这些请求
+            excludes = ', '.join(f'EXCLUDE {host}, EXCLUDE *.{host}' for host in DRIVER_CONFIG['allowed_hosts'])
+            chrome_options.add_argument(f'--host-resolver-rules=MAP * ~NOTFOUND, {excludes}')
+    else:
+        chrome_options.add_argument('--window-size=1920,1080')
+
     service = Service(DRIVER_CONFIG['executable_path'])
-    return webdriver.Chrome(service=service, options=chrome_options)
-    
\ No newline at end of file
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    driver.set_page_load_timeout(DRIVER_CONFIG['page_load_timeout'])
+    driver.set_script_timeout(DRIVER_CONFIG['script_timeout'])
+    if lean:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCE_PATTERNS})
+        except WebDriverException as e:
+            logger.warning(f"设置资源屏蔽失败: {e}")
+    return driver
+
+def driver_memory_mb(driver):
+    """浏览器进程树(chromedriver及其所有子进程)的常驻内存(MB)，无法获取时返回None
+
+    通过/proc统计，仅支持Linux
+    """
+    try:
+        root = driver.service.process.pid
+    except AttributeError:
+        return None
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # comm字段可能包含空格，从最后一个')'之后开始切分
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss_pages[pid] = int(fields[21])
+    if root not in rss_pages:
+        return None
+    total = 0
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class DriverPool:
+    """可复用的浏览器驱动池，按需创建，最多同时存在size个实例
+
+    每个驱动处理max_pages个页面或浏览器内存超过max_memory_mb后在归还时关闭，
+    下次借出时重新创建，保证长时间运行时内存不持续增长；驱动出错时同样重建
+    """
+    def __init__(self, size=1, max_pages=None, max_memory_mb=None):
+        self.size = max(1, size)
+        self.max_pages = DRIVER_CONFIG['max_pages'] if max_pages is None else max_pages
+        self.max_memory_mb = DRIVER_CONFIG['max_memory_mb'] if max_memory_mb is None else max_memory_mb
+        self.recycled = 0
+        self._idle = queue.Queue()
+        self._drivers = []
+        self._pages = {}
+        self._creating = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """借出一个驱动，用完后自动归还"""
+        driver = self._get()
+        broken = False
+        try:
+            yield driver
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self._release(driver, broken)
+
+    def _get(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._create()
+                if driver is None:
+                    # 已达上限，等待其他线程归还
+                    driver = self._idle.get()
+            # None表示有驱动被回收，重新尝试创建
+            if driver is not None:
+                return driver
+
+    def _create(self):
+        """未达上限时创建新驱动，否则返回None
+
+        在锁内预占名额，启动浏览器(耗时数秒)在锁外进行，失败时归还名额
+        """
+        with self._lock:
+            if len(self._drivers) + self._creating >= self.size:
+                return None
+            self._creating += 1
+        try:
+            driver = create_driver()
+        except Exception:
+            with self._lock:
+                self._creating -= 1
+            # 唤醒等待中的线程，由其重新尝试创建
+            self._idle.put(None)
+            raise
+        with self._lock:
+            self._creating -= 1
+            self._drivers.append(driver)
+            self._pages[id(driver)] = 0
+            logger.info(f"创建浏览器驱动 {len(self._drivers)}/{self.size}")
+        return driver
+
+    def _release(self, driver, broken=False):
+        """归还驱动，达到回收条件时关闭并腾出名额；驱动池已关闭时直接关闭驱动"""
+        with self._lock:
+            pages = self._pages.get(id(driver))
+            if pages is not None:
+                pages = self._pages[id(driver)] = pages + 1
+        if pages is None:
+            self._quit(driver)
+            return
+        reason = None
+        if broken:
+            reason = '驱动异常'
+        elif self.max_pages and pages >= self.max_pages:
+            reason = f'已处理 {pages} 个页面'
+        elif self.max_memory_mb:
+            memory = driver_memory_mb(driver)
+            if memory is not None and memory > self.max_memory_mb:
+                reason = f'内存占用 {memory:.0f}MB'
+        if reason is None:
+            self._idle.put(driver)
+            return
+
+        logger.info(f"回收浏览器驱动({reason})")
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+            self._pages.pop(id(driver), None)
+            self.recycled += 1
+        self._quit(driver)
+        # 唤醒等待中的线程，由其重新创建驱动
+        self._idle.put(None)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"关闭浏览器驱动失败: {e}")
+
+    def quit(self):
+        """关闭池中所有驱动"""
+        with self._lock:
+            for driver in self._drivers:
+                self._quit(driver)
+            self._drivers = []
+            self._pages = {}
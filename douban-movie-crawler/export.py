@@ -0,0 +1,220 @@
+"""导出爬取数据集供分析使用
+
+各表通过服务端游标按固定大小分块流式读取，每块写成一个分区文件
+<导出目录>/<格式>/<表名>/part-NNNNN.<格式>(Parquet和/或JSONL)，
+内存占用只与分块大小有关。电影表按块查询导演/编剧/演员/类型关联，展开为列表字段。
+导出先写入同级的临时目录，全部完成后再换到导出目录，失败时不留下半份数据集；
+导出目录已有内容时需要指定--overwrite，旧的分区文件整体替换，不会与新导出混在一起。
+导出Parquet需要额外安装pyarrow，只导出JSONL时不需要。
+
+用法:
+    python export.py --output export/ --format parquet,jsonl
+    python export.py --output export/ --since "2025-01-01 00:00:00" --overwrite
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import select, BIGINT, DECIMAL, Date, DateTime, Integer
+import database
+from database import Movie, Review, Director, Writer, Actor, Genre
+from database import MovieDirectorRelation, MovieWriterRelation, MovieActorRelation, MovieGenreRelation
+from utils import logger, setup_logging
+
+# 电影表展开的关联：列名前缀、实体表、关联表、豆瓣ID字段、名称字段
+MOVIE_RELATIONS = [
+    ('director', Director, MovieDirectorRelation, 'director_id', 'name'),
+    ('writer', Writer, MovieWriterRelation, 'writer_id', 'name'),
+    ('actor', Actor, MovieActorRelation, 'actor_id', 'name'),
+    ('genre', Genre, MovieGenreRelation, 'genre_id', 'genre_name'),
+]
+
+# 单独导出的表
+FLAT_TABLES = [Review, Director, Writer, Actor, Genre]
+
+FORMATS = ('parquet', 'jsonl')
+
+def iter_chunks(model, chunk_size, since=None):
+    """按自增ID顺序用服务端游标分块读取表，since不为空时只读取updated_at不早于since的行"""
+    table = model.__table__
+    stmt = select(table).order_by(table.c.id)
+    if since is not None:
+        stmt = stmt.where(table.c.updated_at >= since)
+    with database.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for partition in result.mappings().partitions(chunk_size):
+            yield [dict(row) for row in partition]
+
+def attach_relations(rows):
+    """为一块电影查询关联的人员和类型，写入 <前缀>_ids / <前缀>_names 列表字段"""
+    movie_ids = [row['movie_id'] for row in rows]
+    with database.engine.connect() as conn:
+        for prefix, entity, relation, key, name in MOVIE_RELATIONS:
+            stmt = (
+                select(relation.movie_id, getattr(entity, key), getattr(entity, name))
+                # 关联表中保存的是实体表的自增ID，导出时换成豆瓣ID
+                .join(entity, entity.id == getattr(relation, key))
+                .where(relation.movie_id.in_(movie_ids), relation.deleted_at == None)
+                .order_by(relation.movie_id, relation.id)
+            )
+            grouped = {}
+            for movie_id, entity_id, entity_name in conn.execute(stmt):
+                ids, names = grouped.setdefault(movie_id, ([], []))
+                ids.append(entity_id)
+                names.append(entity_name)
+            for row in rows:
+                ids, names = grouped.get(row['movie_id'], ([], []))
+                row[f'{prefix}_ids'] = ids
+                row[f'{prefix}_names'] = names
+    return rows
+
+def arrow_schema(model, with_relations=False):
+    """按模型字段类型生成Arrow表结构"""
+    import pyarrow as pa
+
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, (Integer, BIGINT)):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, DECIMAL):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us')
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    if with_relations:
+        for prefix, entity, _, key, _ in MOVIE_RELATIONS:
+            key_type = pa.int64() if isinstance(getattr(entity, key).type, Integer) else pa.string()
+            fields.append(pa.field(f'{prefix}_ids', pa.list_(key_type)))
+            fields.append(pa.field(f'{prefix}_names', pa.list_(pa.string())))
+    return pa.schema(fields)
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+class PartitionWriter:
+    """把一张表的分块依次写成 <output>/<格式>/<表名>/part-NNNNN.<格式> 分区文件"""
+    def __init__(self, output, name, formats, schema=None):
+        self.directories = {fmt: os.path.join(output, fmt, name) for fmt in formats}
+        self.formats = formats
+        self.schema = schema
+        self.parts = 0
+        self.rows = 0
+        for directory in self.directories.values():
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, fmt):
+        return os.path.join(self.directories[fmt], f'part-{self.parts:05d}.{fmt}')
+
+    def write(self, rows):
+        if 'jsonl' in self.formats:
+            with open(self._path('jsonl'), 'w', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+                    f.write('\n')
+        if 'parquet' in self.formats:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            for row in rows:
+                for name, value in row.items():
+                    if isinstance(value, Decimal):
+                        row[name] = float(value)
+            pq.write_table(pa.Table.from_pylist(rows, schema=self.schema), self._path('parquet'), compression='zstd')
+        self.parts += 1
+        self.rows += len(rows)
+
+def export_dataset(output, formats=FORMATS, since=None, chunk_size=10000, overwrite=False):
+    """导出电影(含展开的关联)、短评和实体表，返回各表的导出行数和分区数
+
+    output已存在且非空时，overwrite为False则抛出FileExistsError，为True则用新导出整体替换
+    """
+    if 'parquet' in formats:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("导出Parquet需要安装pyarrow: pip install pyarrow")
+    output = os.path.abspath(output)
+    if os.path.isdir(output) and os.listdir(output) and not overwrite:
+        raise FileExistsError(f"导出目录 {output} 不为空，指定 --overwrite 替换已有导出")
+    # 临时目录与导出目录在同一文件系统上，完成后改名即可
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{os.path.basename(output)}.', dir=os.path.dirname(output))
+    try:
+        tables = _export_tables(staging, formats, since, chunk_size)
+        _replace_directory(staging, output)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return tables
+
+def _replace_directory(source, target):
+    """用source目录替换target：target不存在或为空时直接改名，否则先把旧目录改名移走再换入，最后删除旧目录"""
+    if os.path.isdir(target) and not os.listdir(target):
+        os.rmdir(target)
+    if not os.path.exists(target):
+        os.replace(source, target)
+        return
+    previous = f'{source}.old'
+    os.replace(target, previous)
+    os.replace(source, target)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def _export_tables(output, formats, since, chunk_size):
+    manifest = {
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+        'since': since.isoformat() if since else None,
+        'formats': list(formats),
+        'tables': {}
+    }
+
+    for model, with_relations in [(Movie, True)] + [(model, False) for model in FLAT_TABLES]:
+        name = model.__tablename__
+        schema = arrow_schema(model, with_relations) if 'parquet' in formats else None
+        writer = PartitionWriter(output, name, formats, schema)
+        for rows in iter_chunks(model, chunk_size, since):
+            if with_relations:
+                attach_relations(rows)
+            writer.write(rows)
+            logger.info(f"导出 {name}: 第 {writer.parts} 块，累计 {writer.rows} 行")
+        manifest['tables'][name] = {'rows': writer.rows, 'parts': writer.parts}
+
+    with open(os.path.join(output, '_manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest['tables']
+
+def main():
+    parser = argparse.ArgumentParser(description='导出豆瓣电影数据集')
+    parser.add_argument('--output', required=True, help='导出目录')
+    parser.add_argument('--format', default='parquet,jsonl', help='导出格式，逗号分隔: parquet, jsonl(默认两者都导出)')
+    parser.add_argument('--since', default=None, help='增量导出：只导出updated_at不早于该时间的行，如 "2025-01-01 00:00:00"')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='每个分区文件的行数(默认10000)')
+    parser.add_argument('--overwrite', action='store_true', help='导出目录不为空时用新导出整体替换(默认拒绝导出)')
+    args = parser.parse_args()
+    setup_logging()
+
+    formats = [name.strip() for name in args.format.split(',') if name.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"不支持的导出格式: {', '.join(sorted(unknown))}")
+    since = datetime.fromisoformat(args.since) if args.since else None
+
+    try:
+        tables = export_dataset(args.output, formats, since, args.chunk_size, args.overwrite)
+    except FileExistsError as e:
+        parser.error(str(e))
+    for name, stats in tables.items():
+        logger.info(f"{name}: {stats['rows']} 行，{stats['parts']} 个分区")
+
+if __name__ == '__main__':
+    main()
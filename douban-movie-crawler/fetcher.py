@@ -0,0 +1,160 @@
+import time
+from collections import namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+from utils import get_random_user_agent, logger
+
+# 抓取结果：最终URL、HTTP状态码、页面源码、响应头、实际使用的后端；
+# 回退到备用后端时primary记录主后端的结果(PrimaryOutcome)，限速按它调整
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'html', 'headers', 'backend', 'primary'], defaults=(None,))
+# 主后端的请求结果：后端名称、状态码(请求异常时为None)、耗时、是否被拦截、是否请求异常
+PrimaryOutcome = namedtuple('PrimaryOutcome', ['backend', 'status', 'latency', 'blocked', 'error'])
+
+# 验证码/登录墙/JS校验页面的特征：被重定向到的地址和页面正文中的提示
+BLOCK_STATUS = (403, 418, 429)
+BLOCK_URL_MARKERS = (
+    'sec.douban.com',
+    'accounts.douban.com/passport/login',
+)
+BLOCK_MARKERS = (
+    '检测到有异常请求',
+    '请输入验证码',
+    'name="captcha-solution"',
+    '<noscript>请开启JavaScript',
+)
+
+def looks_blocked(result):
+    """判断页面是否被验证码、登录墙或JS校验拦截"""
+    if result.status == 304:
+        return False
+    if result.status in BLOCK_STATUS:
+        return True
+    if any(marker in (result.url or '') for marker in BLOCK_URL_MARKERS):
+        return True
+    html = result.html or ''
+    if not html.strip():
+        return True
+    return any(marker in html for marker in BLOCK_MARKERS)
+
+class HttpFetcher:
+    """基于requests.Session的轻量抓取后端，复用keep-alive连接池，可经由代理访问"""
+    name = 'http'
+    
+    def __init__(self, pool_size=10, timeout=15, proxy=None, user_agent=None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if proxy:
+            self.session.proxies = {'http': proxy, 'https': proxy}
+        self.session.headers.update({
+            'User-Agent': user_agent or get_random_user_agent(),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        
+    def fetch(self, url, headers=None):
+        """headers可携带If-None-Match/If-Modified-Since发起条件请求，未变化时返回304"""
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        # 响应头未声明编码时按UTF-8解码，避免requests默认的ISO-8859-1导致中文乱码
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = 'utf-8'
+        return FetchResult(response.url, response.status_code, response.text, dict(response.headers), self.name)
+        
+    def close(self):
+        self.session.close()
+
+class PooledHttpFetcher:
+    """按出口身份分别维护HttpFetcher的抓取后端：每个身份有自己的代理、User-Agent和cookie
+
+    请求使用identity_pool为当前线程选定的身份，需要配合把身份池作为限速器传给fetch_page
+    """
+    name = 'http'
+    
+    def __init__(self, identity_pool, pool_size=10, timeout=15):
+        self.identity_pool = identity_pool
+        self._fetchers = {
+            identity.name: HttpFetcher(pool_size, timeout, identity.proxy, identity.user_agent)
+            for identity in identity_pool.identities
+        }
+        
+    def fetch(self, url, headers=None):
+        return self._fetchers[self.identity_pool.current().name].fetch(url, headers)
+        
+    def close(self):
+        for fetcher in self._fetchers.values():
+            fetcher.close()
+
+class SeleniumFetcher:
+    """基于浏览器驱动池的抓取后端，用于需要执行JS的页面"""
+    name = 'selenium'
+    
+    def __init__(self, driver_pool):
+        self.driver_pool = driver_pool
+        
+    def fetch(self, url, headers=None):
+        # 浏览器无法发起条件请求，忽略headers
+        with self.driver_pool.acquire() as driver:
+            driver.get(url)
+            return FetchResult(driver.current_url, 200, driver.page_source, {}, self.name)
+            
+    def close(self):
+        self.driver_pool.quit()
+
+class FallbackFetcher:
+    """优先使用轻量后端，页面被拦截或请求异常时回退到备用后端
+
+    回退时在备用后端的结果中附带主后端的结果(primary)，拦截信号不会被回退得到的正常页面掩盖
+    """
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        
+    @property
+    def name(self):
+        return f"{self.primary.name}+{self.fallback.name}"
+        
+    def fetch(self, url, headers=None):
+        start = time.perf_counter()
+        try:
+            result = self.primary.fetch(url, headers)
+            if not looks_blocked(result):
+                return result
+            outcome = PrimaryOutcome(self.primary.name, result.status, time.perf_counter() - start, True, False)
+            logger.warning(f"{self.primary.name}后端页面疑似被拦截(状态码 {result.status})，回退到{self.fallback.name}: {url}")
+        except requests.RequestException as e:
+            outcome = PrimaryOutcome(self.primary.name, None, time.perf_counter() - start, False, True)
+            logger.warning(f"{self.primary.name}后端请求失败: {e}，回退到{self.fallback.name}: {url}")
+        return self.fallback.fetch(url, headers)._replace(primary=outcome)
+        
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+def create_fetcher(backend='http', workers=1, identity_pool=None):
+    """按配置创建抓取后端，指定identity_pool时HTTP请求分散到各出口身份
+
+    浏览器不经过出口身份的代理，使用身份池时不回退到Selenium，也不支持selenium后端
+    """
+    if identity_pool and backend == 'selenium':
+        raise ValueError("selenium后端不支持出口身份池")
+    http_fetcher = PooledHttpFetcher(identity_pool, pool_size=workers) if identity_pool else HttpFetcher(pool_size=workers)
+    if backend == 'http-only':
+        # 不回退到Selenium，被拦截的请求直接按失败重试(用于压测和无浏览器环境)
+        return http_fetcher
+    if identity_pool:
+        # 回退会绕过代理直连，拦截和健康分也记不到对应身份上，被拦截的请求改由其他身份重试
+        logger.info("使用出口身份池，页面被拦截时不回退到Selenium")
+        return http_fetcher
+    # 延迟导入，纯HTTP抓取时不必加载Selenium
+    from driver import DriverPool
+    
+    selenium_fetcher = SeleniumFetcher(DriverPool(workers))
+    if backend == 'selenium':
+        return selenium_fetcher
+    if backend == 'http':
+        return FallbackFetcher(http_fetcher, selenium_fetcher)
+    raise ValueError(f"未知的抓取后端: {backend}")
@@ -0,0 +1,362 @@
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+# 待抓取任务：URL、类型(list/detail)、豆瓣电影ID、列表页页码、已尝试次数、发现深度(种子为0)、列表页上的Top250排名
+Task = namedtuple('Task', ['url', 'kind', 'movie_id', 'page', 'attempts', 'depth', 'top250_rank'], defaults=(0, None))
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+def default_worker_id():
+    """worker标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def backoff_delay(attempts, base_delay, max_delay):
+    """第attempts次失败后的重试等待秒数：指数退避，带随机抖动"""
+    delay = min(max_delay, base_delay * 2 ** (attempts - 1))
+    return random.uniform(0.5, 1.0) * delay
+
+class Frontier:
+    """持久化的抓取队列(SQLite)
+
+    每个列表页和详情页URL一行，记录状态(pending/in_flight/done/failed)、尝试次数和
+    下次可重试时间。path为SQLite文件时进程崩溃后可从断点继续；为':memory:'时只在本次运行内有效。
+    领取时先回收租约已过期的任务，再按优先级(数值越小越先领取)、列表页页码、加入顺序领取待处理任务。
+
+    领取任务时加租约：租约在lease_seconds后到期，到期仍未完成的任务可被其他worker重新领取，
+    因此同一台机器上的多个进程可以共享同一个队列文件
+    """
+    def __init__(self, path=':memory:', max_attempts=3, base_delay=30.0, max_delay=3600.0,
+                 lease_seconds=600, owner=None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_worker_id()
+        self._lock = threading.Lock()
+        # 自行管理事务，领取时用BEGIN IMMEDIATE在进程间加写锁
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                movie_id INTEGER,
+                page INTEGER,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_eligible_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT NOT NULL DEFAULT '',
+                lease_expires_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT NOT NULL DEFAULT '',
+                priority REAL NOT NULL DEFAULT 0,
+                depth INTEGER NOT NULL DEFAULT 0,
+                top250_rank INTEGER,
+                updated_at REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_frontier_claim ON frontier (kind, state, next_eligible_at);
+        ''')
+        # 兼容旧版本创建的没有租约、优先级、排名字段的队列文件
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(frontier)')}
+        for name, ddl in (
+            ('lease_owner', "TEXT NOT NULL DEFAULT ''"), ('lease_expires_at', 'REAL NOT NULL DEFAULT 0'),
+            ('priority', 'REAL NOT NULL DEFAULT 0'), ('depth', 'INTEGER NOT NULL DEFAULT 0'),
+            ('top250_rank', 'INTEGER')
+        ):
+            if name not in columns:
+                self._db.execute(f'ALTER TABLE frontier ADD COLUMN {name} {ddl}')
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_frontier_priority ON frontier (kind, state, priority, page)')
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def add(self, url, kind, movie_id=None, page=None, priority=0, depth=0, top250_rank=None):
+        """加入新任务，URL已存在时忽略，返回是否新加入"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO frontier (url, kind, movie_id, page, priority, depth, top250_rank, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, kind, movie_id, page, priority, depth, top250_rank, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, kind, limit=1):
+        """领取租约已过期的任务和到期的待处理任务(按优先级)，标记为in_flight并加租约"""
+        now = time.time()
+        with self._transaction() as db:
+            # 分两次查询，各自按优先级索引的顺序扫描，避免对全部待处理任务排序
+            rows = db.execute('''
+                SELECT url, kind, movie_id, page, attempts, depth, top250_rank FROM frontier INDEXED BY idx_frontier_priority
+                WHERE kind = ? AND state = ? AND lease_expires_at <= ?
+                ORDER BY priority, page, rowid LIMIT ?
+            ''', (kind, IN_FLIGHT, now, limit)).fetchall()
+            if len(rows) < limit:
+                rows += db.execute('''
+                    SELECT url, kind, movie_id, page, attempts, depth, top250_rank FROM frontier INDEXED BY idx_frontier_priority
+                    WHERE kind = ? AND state = ? AND next_eligible_at <= ?
+                    ORDER BY priority, page, rowid LIMIT ?
+                ''', (kind, PENDING, now, limit - len(rows))).fetchall()
+            db.executemany(
+                'UPDATE frontier SET state = ?, lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE url = ?',
+                [(IN_FLIGHT, self.owner, now + self.lease_seconds, now, row[0]) for row in rows]
+            )
+        return [Task(*row) for row in rows]
+
+    def complete(self, url):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE frontier SET state = ?, lease_owner = '', updated_at = ? WHERE url = ?",
+                (DONE, time.time(), url)
+            )
+
+    def fail(self, url, error=''):
+        """记录一次失败：未超过最大尝试次数时按指数退避(带随机抖动)重新排队，否则标记为failed
+
+        租约已被其他worker接手的任务不做处理
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT attempts FROM frontier WHERE url = ? AND state = ? AND lease_owner = ?',
+                (url, IN_FLIGHT, self.owner)
+            ).fetchone()
+            if row is None:
+                return
+            attempts = row[0] + 1
+            if attempts >= self.max_attempts:
+                state, next_eligible_at = FAILED, now
+            else:
+                state, next_eligible_at = PENDING, now + backoff_delay(attempts, self.base_delay, self.max_delay)
+            db.execute('''
+                UPDATE frontier SET state = ?, attempts = ?, next_eligible_at = ?, lease_owner = '',
+                    last_error = ?, updated_at = ?
+                WHERE url = ?
+            ''', (state, attempts, next_eligible_at, str(error)[:500], now, url))
+
+    def recover(self):
+        """单机模式下把上次运行中断时仍为in_flight的任务放回待处理，返回恢复的数量
+
+        多个worker共享队列时不要调用，其他worker的任务由租约到期后自动回收
+        """
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE frontier SET state = ?, lease_owner = '' WHERE state = ?", (PENDING, IN_FLIGHT)
+            ).rowcount
+
+    def retry_failed(self):
+        """把已放弃的任务重新放回待处理并清零尝试次数"""
+        with self._transaction() as db:
+            return db.execute(
+                'UPDATE frontier SET state = ?, attempts = 0, next_eligible_at = 0 WHERE state = ?',
+                (PENDING, FAILED)
+            ).rowcount
+
+    def clear(self, state=None):
+        """删除全部任务，指定state时只删除该状态的任务"""
+        with self._transaction() as db:
+            if state is None:
+                db.execute('DELETE FROM frontier')
+            else:
+                db.execute('DELETE FROM frontier WHERE state = ?', (state,))
+
+    def seconds_until_eligible(self):
+        """距离最早一个任务可领取(待处理任务到期或租约到期)还需等待的秒数，队列已处理完时返回None"""
+        with self._lock:
+            row = self._db.execute('''
+                SELECT MIN(CASE WHEN state = ? THEN next_eligible_at ELSE lease_expires_at END)
+                FROM frontier WHERE state IN (?, ?)
+            ''', (PENDING, PENDING, IN_FLIGHT)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def counts(self):
+        """各状态的任务数量"""
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM frontier GROUP BY state').fetchall()
+        return dict(rows)
+
+    def failed(self):
+        """已放弃的任务，返回 [(url, last_error)]"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT url, last_error FROM frontier WHERE state = ? ORDER BY rowid', (FAILED,)
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class DatabaseFrontier:
+    """基于共享数据库(crawl_frontier表)的抓取队列，供多台机器上的worker共同使用
+
+    接口与Frontier相同。没有中心调度节点：各worker直接在数据库中领取一批任务并加租约，
+    MySQL 8上使用 SELECT ... FOR UPDATE SKIP LOCKED 避免多个worker领取到同一批任务；
+    worker宕机后其任务在租约到期后被其他worker重新领取
+    """
+    def __init__(self, max_attempts=3, base_delay=30.0, max_delay=3600.0, lease_seconds=600, owner=None):
+        # 延迟导入，单机模式不依赖数据库连接
+        from database import Session, CrawlTask, upsert
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_worker_id()
+        self._lock = threading.Lock()
+        self._session_factory = Session
+        self._model = CrawlTask
+        self._upsert = upsert
+
+    @contextmanager
+    def _session(self):
+        with self._lock:
+            session = self._session_factory()
+            try:
+                with session.begin():
+                    yield session
+            finally:
+                session.close()
+
+    def add(self, url, kind, movie_id=None, page=None, priority=0, depth=0, top250_rank=None):
+        """加入新任务，URL已存在时忽略，返回是否新加入"""
+        now = datetime.now()
+        with self._session() as session:
+            exists = session.query(self._model.id).filter(self._model.url == url).first()
+            if exists:
+                return False
+            # 并发加入同一URL时由唯一索引去重
+            self._upsert(session, self._model, [{
+                'url': url, 'kind': kind, 'movie_id': movie_id, 'page': page,
+                'priority': priority, 'depth': depth, 'top250_rank': top250_rank, 'created_at': now, 'updated_at': now
+            }], [])
+            return True
+
+    def claim(self, kind, limit=1):
+        """领取租约已过期的任务和到期的待处理任务(按优先级)，标记为in_flight并加租约"""
+        model = self._model
+        now = datetime.now()
+        with self._session() as session:
+            # 先回收租约过期的任务，再按优先级领取待处理任务，两次查询都可以按索引顺序扫描
+            rows = []
+            for condition in (
+                (model.state == IN_FLIGHT) & (model.lease_expires_at <= now),
+                (model.state == PENDING) & (model.next_eligible_at <= now),
+            ):
+                if len(rows) >= limit:
+                    break
+                rows += session.query(model).filter(model.kind == kind, condition).order_by(
+                    model.priority, model.page, model.id
+                ).limit(limit - len(rows)).with_for_update(skip_locked=True).all()
+            tasks = []
+            for row in rows:
+                row.state = IN_FLIGHT
+                row.lease_owner = self.owner
+                row.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+                row.updated_at = now
+                tasks.append(Task(row.url, row.kind, row.movie_id, row.page, row.attempts, row.depth, row.top250_rank))
+        return tasks
+
+    def complete(self, url):
+        with self._session() as session:
+            session.query(self._model).filter(self._model.url == url).update(
+                {'state': DONE, 'lease_owner': '', 'updated_at': datetime.now()}, synchronize_session=False
+            )
+
+    def fail(self, url, error=''):
+        """记录一次失败：未超过最大尝试次数时按指数退避(带随机抖动)重新排队，否则标记为failed
+
+        租约已被其他worker接手的任务不做处理
+        """
+        model = self._model
+        now = datetime.now()
+        with self._session() as session:
+            row = session.query(model).filter(
+                model.url == url, model.state == IN_FLIGHT, model.lease_owner == self.owner
+            ).with_for_update().first()
+            if row is None:
+                return
+            row.attempts += 1
+            if row.attempts >= self.max_attempts:
+                row.state, row.next_eligible_at = FAILED, now
+            else:
+                delay = backoff_delay(row.attempts, self.base_delay, self.max_delay)
+                row.state, row.next_eligible_at = PENDING, now + timedelta(seconds=delay)
+            row.lease_owner = ''
+            row.last_error = str(error)[:500]
+            row.updated_at = now
+
+    def recover(self):
+        """把所有in_flight任务放回待处理，只应在确认没有其他worker运行时调用"""
+        with self._session() as session:
+            return session.query(self._model).filter(self._model.state == IN_FLIGHT).update(
+                {'state': PENDING, 'lease_owner': ''}, synchronize_session=False
+            )
+
+    def retry_failed(self):
+        """把已放弃的任务重新放回待处理并清零尝试次数"""
+        with self._session() as session:
+            return session.query(self._model).filter(self._model.state == FAILED).update(
+                {'state': PENDING, 'attempts': 0, 'next_eligible_at': datetime(1970, 1, 1)},
+                synchronize_session=False
+            )
+
+    def clear(self, state=None):
+        """删除全部任务，指定state时只删除该状态的任务"""
+        with self._session() as session:
+            query = session.query(self._model)
+            if state is not None:
+                query = query.filter(self._model.state == state)
+            query.delete(synchronize_session=False)
+
+    def seconds_until_eligible(self):
+        """距离最早一个任务可领取(待处理任务到期或租约到期)还需等待的秒数，队列已处理完时返回None"""
+        model = self._model
+        with self._session() as session:
+            next_pending = session.query(func.min(model.next_eligible_at)).filter(model.state == PENDING).scalar()
+            next_lease = session.query(func.min(model.lease_expires_at)).filter(model.state == IN_FLIGHT).scalar()
+        candidates = [value for value in (next_pending, next_lease) if value is not None]
+        if not candidates:
+            return None
+        return max(0.0, (min(candidates) - datetime.now()).total_seconds())
+
+    def counts(self):
+        """各状态的任务数量"""
+        with self._session() as session:
+            rows = session.query(self._model.state, func.count()).group_by(self._model.state).all()
+        return dict(rows)
+
+    def failed(self):
+        """已放弃的任务，返回 [(url, last_error)]"""
+        with self._session() as session:
+            rows = session.query(self._model.url, self._model.last_error).filter(
+                self._model.state == FAILED
+            ).order_by(self._model.id).all()
+        return [tuple(row) for row in rows]
+
+    def close(self):
+        pass
+
+def create_frontier(backend='sqlite', path=None, **kwargs):
+    """创建抓取队列：sqlite为本地文件(或内存)队列，database为基于共享数据库的分布式队列"""
+    if backend == 'database':
+        return DatabaseFrontier(**kwargs)
+    return Frontier(path or ':memory:', **kwargs)
@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from config import CRAWL_CONFIG
+from utils import AdaptiveThrottle, logger
+import metrics
+
+class Identity:
+    """出口身份：一个代理(None为直连)搭配一个User-Agent，抓取后端为其维护独立的会话和cookie
+
+    每个身份有自己的自适应限速器(令牌桶)，以及按最近请求统计的健康分：
+    错误率和拦截率为指数滑动平均，距上次请求每过half_life秒衰减一半，被冷落的身份会逐渐恢复；
+    健康分 = (1 - 错误率) × (1 - 拦截率)²，拦截比普通错误扣分更多
+    """
+    def __init__(self, name, proxy=None, user_agent=None, throttle=None, half_life=300.0, alpha=0.2):
+        self.name = name
+        self.proxy = proxy
+        self.user_agent = user_agent
+        self.throttle = throttle or AdaptiveThrottle(report_rate=False)
+        self.half_life = half_life
+        self.alpha = alpha
+        self.latency = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.blocks = 0
+        self._error_rate = 0.0
+        self._block_rate = 0.0
+        self._updated = time.monotonic()
+
+    def _decay(self, now):
+        return 0.5 ** ((now - self._updated) / self.half_life) if self.half_life > 0 else 1.0
+
+    @property
+    def health(self):
+        decay = self._decay(time.monotonic())
+        return max(0.01, (1 - self._error_rate * decay) * (1 - self._block_rate * decay) ** 2)
+
+    def cost(self):
+        """预计完成一个新请求的时间(排队等待 + 并发请求的平均延迟)除以健康分，越小越优先"""
+        latency = self.latency or 0.0
+        return (self.throttle.expected_delay() + latency * (1 + self.in_flight)) / self.health
+
+    def record(self, latency=None, error=False, blocked=False):
+        """记录一次请求的结果，更新滑动平均"""
+        now = time.monotonic()
+        decay = self._decay(now)
+        self._updated = now
+        self._error_rate = (1 - self.alpha) * self._error_rate * decay + self.alpha * error
+        self._block_rate = (1 - self.alpha) * self._block_rate * decay + self.alpha * blocked
+        self.requests += 1
+        self.errors += error
+        self.blocks += blocked
+        if latency is not None and not error:
+            self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'blocks': self.blocks,
+            'health': round(self.health, 3),
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'rate': round(self.throttle.rate, 2),
+        }
+
+def proxy_name(proxy):
+    """日志和指标中使用的代理名称，去掉地址中的用户名和密码"""
+    if proxy is None:
+        return 'direct'
+    parts = urlsplit(proxy)
+    return f'{parts.hostname}:{parts.port}' if parts.port else (parts.hostname or proxy)
+
+class IdentityPool:
+    """出口身份池，可代替AdaptiveThrottle传给fetch_page
+
+    wait()为当前线程挑选代价(见Identity.cost)最小的身份，在该身份的令牌桶上取令牌并等待；
+    抓取后端通过current()取得当前线程的身份发出请求；feedback()把结果记到该身份上并调整其速率。
+    被拦截的身份由其限速器暂停block_cooldown秒，期间请求自动分配到其他身份
+    """
+    def __init__(self, identities):
+        if not identities:
+            raise ValueError("出口身份池不能为空")
+        self.identities = identities
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_proxies(cls, proxies, user_agents=None, half_life=None):
+        """每个代理地址创建一个身份，User-Agent从池中依次分配"""
+        user_agents = user_agents or CRAWL_CONFIG['user_agent_pool']
+        half_life = CRAWL_CONFIG['identity_health_half_life'] if half_life is None else half_life
+        offset = random.randrange(len(user_agents))
+        identities = []
+        names = set()
+        for i, proxy in enumerate(proxies):
+            proxy = None if proxy == 'direct' else proxy
+            name = proxy_name(proxy)
+            if name in names:
+                name = f'{name}#{i}'
+            names.add(name)
+            identities.append(Identity(name, proxy, user_agents[(offset + i) % len(user_agents)], half_life=half_life))
+        return cls(identities)
+
+    @property
+    def rate(self):
+        """所有身份当前允许的总请求速率"""
+        return sum(identity.throttle.rate for identity in self.identities)
+
+    def select(self):
+        """选出代价最小的身份，代价相同时选并发请求少的"""
+        return min(self.identities, key=lambda identity: (identity.cost(), identity.in_flight))
+
+    def wait(self):
+        """为当前线程挑选身份并等待取得该身份的令牌"""
+        with self._lock:
+            identity = self.select()
+            identity.in_flight += 1
+            delay = identity.throttle.reserve()
+        self._local.identity = identity
+        metrics.SLEEP_SECONDS.observe(delay)
+        if delay > 0:
+            time.sleep(delay)
+            logger.debug(f"出口 {identity.name} 请求排队等待: {delay:.2f}秒")
+
+    def current(self):
+        """当前线程正在使用的身份，未调用wait()时直接挑选一个"""
+        identity = getattr(self._local, 'identity', None)
+        if identity is None:
+            with self._lock:
+                identity = self._local.identity = self.select()
+        return identity
+
+    def feedback(self, latency=None, status=None, blocked=False, error=False):
+        """报告当前线程上一次请求的结果"""
+        identity = self.current()
+        blocked = blocked or status in (403, 429)
+        failed = error or (status is not None and status >= 500)
+        with self._lock:
+            identity.in_flight = max(0, identity.in_flight - 1)
+            identity.record(latency, failed, blocked)
+        identity.throttle.feedback(latency, status, blocked, error)
+        metrics.REQUEST_RATE.set(self.rate)
+        metrics.IDENTITY_HEALTH.set(identity.health, identity=identity.name)
+        metrics.IDENTITY_REQUESTS.inc(identity=identity.name, result='blocked' if blocked else 'error' if failed else 'ok')
+        if blocked:
+            logger.warning(f"出口 {identity.name} 被拦截，健康分降至 {identity.health:.2f}")
+
+    def stats(self):
+        return {identity.name: identity.stats() for identity in self.identities}
+
+    def log_stats(self):
+        for name, stats in self.stats().items():
+            logger.info(f"出口 {name}: {stats}")
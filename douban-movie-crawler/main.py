@@ -1,135 +1,623 @@
-from database import DatabaseHandler, Movie, Director, MovieDirectorRelation, Writer, MovieWriterRelation, Actor, MovieActorRelation, Genre, MovieGenreRelation, Review
-from driver import create_driver
-from parser import parse_movie_info, parse_directors, parse_writers, parse_actors, parse_genres, parse_reviews
-from utils import random_sleep, logger
+import metrics
+from utils import AdaptiveThrottle, logger, setup_logging, page_hash, content_hash
 from config import CRAWL_CONFIG
 from datetime import datetime
+from urllib.parse import urljoin
 import argparse
-from bs4 import BeautifulSoup
+import json
+import re
+import time
+
+# 数据库、抓取后端、解析器等依赖较重的模块在用到时才导入，
+# 使 --help 等命令不必加载SQLAlchemy、requests、BeautifulSoup和Selenium
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='豆瓣电影Top250爬虫')
     parser.add_argument('--pages', type=int, default=None, help='指定要爬取的页数')
     parser.add_argument('--start', type=int, default=0, help='从第几页开始爬取(默认为0)')
+    parser.add_argument('--workers', type=int, default=CRAWL_CONFIG['workers'], help='并发爬取详情页的worker数量(默认为1)')
+    parser.add_argument('--parse-workers', type=int, default=CRAWL_CONFIG['parse_workers'], help='解析详情页的进程数，0为不使用子进程(默认为0)')
+    parser.add_argument('--queue-size', type=int, default=CRAWL_CONFIG['pipeline_queue_size'], help='流水线抓取和解析队列的长度(默认为worker数的4倍)')
+    parser.add_argument('--backend', choices=['http', 'http-only', 'selenium'], default=CRAWL_CONFIG['fetch_backend'], help='抓取后端，http在页面被拦截时自动回退到selenium，http-only不回退(默认为http)')
+    parser.add_argument('--proxies', default=','.join(CRAWL_CONFIG['proxy_pool']), help='出口身份池：逗号分隔的代理地址，direct表示直连，请求按健康分和各自的限速分配到各出口；使用时不回退到selenium')
+    parser.add_argument('--warm-cache', action='store_true', default=CRAWL_CONFIG['entity_cache_warm'], help='启动时预加载导演/编剧/演员/类型的ID缓存')
+    parser.add_argument('--archive', default=CRAWL_CONFIG['archive_dir'], help='原始页面归档目录，指定后抓取的页面会被压缩保存')
+    parser.add_argument('--replay', action='store_true', help='不联网，从--archive归档重新解析并入库')
+    parser.add_argument('--frontier', default=CRAWL_CONFIG['frontier_path'], help='抓取队列SQLite文件，指定后可在中断后从断点继续')
+    parser.add_argument('--frontier-backend', choices=['sqlite', 'database'], default=CRAWL_CONFIG['frontier_backend'], help='抓取队列后端，database为多台机器共享的数据库队列(默认为sqlite)')
+    parser.add_argument('--distributed', action='store_true', help='分布式模式：多个worker共享抓取队列，中断的任务等租约到期后再被重新领取')
+    parser.add_argument('--fresh', action='store_true', help='清空--frontier中的已有进度重新爬取；不指定时中断的运行从断点继续，上次运行已结束时自动开始新一轮(失败任务重新排队)，共享队列(--distributed/database后端)不自动开始新一轮')
+    parser.add_argument('--retry-failed', action='store_true', help='把--frontier中已放弃的页面重新排队')
+    parser.add_argument('--refresh-ratings', action='store_true', help='评分刷新模式：只用列表页更新已入库电影的评分、评分人数和排名，只为未入库的电影抓取详情页；本次从第一页翻到列表末尾时，已不在榜单上的电影排名清零')
+    parser.add_argument('--discover', action='store_true', help='发现模式：按优先级继续抓取详情页中链接到的Top250之外的电影')
+    parser.add_argument('--discover-budget', type=int, default=CRAWL_CONFIG['discovery_budget'], help='发现模式下本次运行最多新加入的电影数(默认10000)')
+    parser.add_argument('--max-depth', type=int, default=CRAWL_CONFIG['discovery_max_depth'], help='发现模式下从Top250出发的最大链接深度(默认3)')
+    parser.add_argument('--reviews', action='store_true', help='短评模式：翻页抓取已入库电影(或--movie-ids指定电影)的全部短评')
+    parser.add_argument('--movie-ids', default=None, help='短评模式下要抓取的豆瓣电影ID，逗号分隔')
+    parser.add_argument('--max-reviews', type=int, default=CRAWL_CONFIG['review_max_per_movie'], help='短评模式下每次运行每部电影最多抓取的短评数，达到上限时下次运行继续(默认不限制)')
+    parser.add_argument('--profile-memory', action='store_true', help='内存分析模式：用tracemalloc按阶段统计每页的内存峰值和分配，结束时输出报告')
+    parser.add_argument('--metrics-port', type=int, default=CRAWL_CONFIG['metrics_port'], help='在本机该端口提供指标HTTP服务(/metrics 和 /metrics.json)')
+    parser.add_argument('--migrate', action='store_true', help='为已有数据库补建唯一索引和查询索引后退出')
     args = parser.parse_args()
+    if args.backend == 'selenium' and args.proxies.strip(' ,'):
+        parser.error('--backend selenium 的浏览器不经过代理，不能与 --proxies 同时使用')
+    setup_logging()
+    
+    from database import DatabaseHandler
+    from cache import entity_id_cache
+    
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+        logger.info(f"指标服务: http://127.0.0.1:{args.metrics_port}/metrics")
     
     # 初始化数据库
     db_handler = DatabaseHandler()
     db_handler.create_tables()
     
-    # 获取已有电影ID
-    existing_movie_ids = db_handler.get_existing_movie_ids()
-    logger.info(f"数据库中已有 {len(existing_movie_ids)} 部电影")
+    if args.migrate:
+        created = db_handler.migrate_schema()
+        logger.info(f"数据库迁移完成，新建 {len(created)} 个字段和索引")
+        db_handler.close()
+        return
+    if db_handler.missing_columns() or db_handler.missing_indexes():
+        logger.warning("数据库表结构不是最新，缺少字段或索引会导致写入失败或去重失效，请先运行 --migrate")
+    
+    # 预加载实体ID缓存
+    if args.warm_cache:
+        entity_id_cache.warm_up(db_handler.session, cached_entities())
+    
+    if args.replay:
+        if not args.archive:
+            parser.error('--replay 需要通过 --archive 或 ARCHIVE_DIR 指定归档目录')
+        from archive import PageArchive
+        replay_archive(PageArchive(args.archive))
+        db_handler.close()
+        return
+    
+    identity_pool = create_identity_pool(args.proxies)
+    
+    if args.reviews:
+        from fetcher import create_fetcher
+        movie_ids = [int(movie_id) for movie_id in args.movie_ids.split(',')] if args.movie_ids else None
+        crawl_reviews(db_handler, create_fetcher(args.backend, 1, identity_pool), movie_ids, args.max_reviews, identity_pool)
+        db_handler.close()
+        return
+    
+    from archive import PageArchive, ArchivingFetcher
+    from db_writer import DBWriter
+    from fetcher import create_fetcher
+    from frontier import DONE, create_frontier
+    from pipeline import DetailPipeline
+    from seen import load_seen_index
+    
+    # 加载已有电影ID索引
+    seen_movie_ids = load_seen_index(db_handler, CRAWL_CONFIG['seen_bloom_path'])
+    logger.info(f"数据库中已有 {len(seen_movie_ids)} 部电影")
+    
+    # 创建抓取后端和全局自适应限速，使用出口身份池时由各身份分别限速
+    fetcher = create_fetcher(args.backend, args.workers, identity_pool)
+    if args.archive:
+        fetcher = ArchivingFetcher(fetcher, PageArchive(args.archive))
+    throttle = identity_pool or AdaptiveThrottle()
+    
+    # 抓取队列：指定文件或使用数据库队列时可断点续爬，否则只在本次运行内有效
+    frontier = create_frontier(
+        args.frontier_backend, args.frontier,
+        max_attempts=CRAWL_CONFIG['retry_times'],
+        base_delay=CRAWL_CONFIG['retry_base_delay'],
+        lease_seconds=CRAWL_CONFIG['lease_seconds'],
+        owner=CRAWL_CONFIG['worker_id']
+    )
+    logger.info(f"抓取队列: {args.frontier_backend}，worker: {frontier.owner}")
+    if args.fresh:
+        frontier.clear()
+    if not args.distributed:
+        recovered = frontier.recover()
+        if recovered:
+            logger.info(f"恢复上次中断的 {recovered} 个任务")
+    if args.retry_failed:
+        logger.info(f"重新排队 {frontier.retry_failed()} 个失败任务")
+    # 没有待处理和进行中的任务说明上次运行已结束，清空已完成的记录开始新一轮，失败的任务重新排队；否则从断点继续。
+    # 共享队列上其他worker可能刚结束这一轮，不自动清空，需要显式指定--fresh
+    finished = frontier.counts() if frontier.seconds_until_eligible() is None else None
+    if finished and (args.distributed or args.frontier_backend == 'database'):
+        logger.info(f"共享抓取队列中没有待处理的任务({finished})，如需开始新一轮请指定 --fresh")
+    elif finished:
+        logger.info(f"上次运行已结束({finished})，开始新一轮爬取")
+        frontier.clear(DONE)
+        retried = frontier.retry_failed()
+        if retried:
+            logger.warning(f"上次运行失败的 {retried} 个任务重新排队")
+    frontier.add(list_page_url(args.start), 'list', page=args.start)
     
-    # 创建浏览器驱动
-    driver = create_driver()
+    # 内存分析模式下包装抓取、解析、写库函数，解析放在本进程以便跟踪
+    def fetch_func(task, fingerprint):
+        return fetch_movie_page(fetcher, throttle, task.movie_id, task.url, fingerprint)
+    profiler = None
+    parse_func = build_detail_record
+    save_func = save_movie
+    if args.profile_memory:
+        from memprofile import MemoryProfiler
+        if args.parse_workers:
+            logger.warning("内存分析模式不跟踪子进程，--parse-workers 改为0")
+            args.parse_workers = 0
+        profiler = MemoryProfiler()
+        profiler.start()
+        fetch_func = profiler.wrap('fetch', fetch_func)
+        parse_func = profiler.wrap('parse', parse_func)
+        save_func = profiler.wrap('save', save_func)
+    
+    # 后台写库线程，解析结果入队后由其批量提交，提交成功后才在队列中标记完成
+    def on_saved(record):
+        seen_movie_ids.add(record['movie_id'])
+        frontier.complete(record['url'])
+    db_writer = DBWriter(save_func, on_saved=on_saved, on_failed=lambda record, e: frontier.fail(record['url'], e))
+    db_writer.start()
+    
+    # 发现模式：解析出的电影链接按优先级加入抓取队列
+    discovery = None
+    if args.discover:
+        from discovery import DiscoveryScheduler
+        discovery = DiscoveryScheduler(frontier, seen_movie_ids, movie_detail_url, args.discover_budget, args.max_depth)
+        logger.info(f"发现模式: 预算 {args.discover_budget} 部，最大深度 {args.max_depth}")
+    
+    # 详情页流水线：抓取线程 → 解析进程 → 写库线程，失败的按退避时间放回队列
+    def on_parsed(task, record):
+        # 详情页上没有排名，使用列表页上的排名
+        record['top250_rank'] = task.top250_rank
+        if discovery:
+            discovery.schedule(task, record)
+    def on_unchanged(task):
+        logger.info(f"电影 {task.movie_id} 详情页未变化，跳过")
+        metrics.MOVIES.inc(result='unchanged')
+        frontier.complete(task.url)
+    def on_failed(task, e):
+        logger.warning(f"处理电影 {task.url} 失败({task.attempts + 1}/{frontier.max_attempts}): {e}")
+        metrics.ERRORS.inc(stage='detail')
+        metrics.RETRIES.inc(kind='detail')
+        frontier.fail(task.url, e)
+    pipeline = DetailPipeline(
+        fetch_func, parse_func, db_writer,
+        fetch_workers=args.workers,
+        parse_workers=args.parse_workers,
+        queue_size=args.queue_size,
+        on_parsed=on_parsed,
+        on_unchanged=on_unchanged,
+        on_failed=on_failed
+    )
+    pipeline.start()
     
     # 开始爬取
-    base_url = CRAWL_CONFIG['base_url']
-    current_page = args.start
-    total_movies = 0
-    failed_movies = []
+    last_page = None if args.pages is None else args.start + args.pages - 1
+    batch_size = pipeline.fetch_queue.maxsize
+    
+    # 评分刷新模式下记录本次翻过的列表页，完整翻完一遍后清除已不在榜单上的电影的排名
+    list_pass = ListPass() if args.refresh_ratings else None
     
     try:
         while True:
-            # 检查是否达到指定页数
-            if args.pages is not None and current_page >= args.start + args.pages:
-                logger.info(f"已达到指定页数 {args.pages}，爬取结束")
-                break
+            # 优先处理列表页，发现新的详情页任务
+            list_tasks = frontier.claim('list')
+            if list_tasks:
+                crawl_list_page(fetcher, throttle, frontier, list_tasks[0], last_page, seen_movie_ids,
+                                db_handler if args.refresh_ratings else None, skip_known=args.refresh_ratings,
+                                list_pass=list_pass)
+                continue
                 
-            page_url = f"{base_url}?start={current_page*25}"
-            logger.info(f"正在爬取第 {current_page+1} 页: {page_url}")
-            
-            # 请求页面
-            driver.get(page_url)
-            random_sleep()
-            
-            # 解析页面
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            movie_items = soup.select('div.item')
-            
-            if not movie_items:
-                logger.info("没有找到更多电影，爬取结束")
-                break
+            tasks = frontier.claim('detail', batch_size)
+            if not tasks:
+                wait = frontier.seconds_until_eligible()
+                if wait is None:
+                    logger.info("没有待爬取的页面，爬取结束")
+                    if list_pass and list_pass.complete:
+                        clear_stale_ranks(db_handler, list_pass.movie_ids)
+                    break
+                # 只剩流水线中、等待退避重试、写库中或其他worker持有租约的任务
+                if pipeline.pending:
+                    pipeline.wait_idle(timeout=min(wait, 1))
+                else:
+                    # 剩余的可能是写库线程中尚未提交的批次，立即提交，不必等到提交时限
+                    db_writer.flush()
+                    time.sleep(min(wait, 1))
+                continue
                 
-            # 处理每部电影
-            for item in movie_items:
-                try:
-                    # 提取电影基本信息
-                    link = item.find('a')['href']
-                    movie_id = int(link.split('/')[-2])
-                    
-                    # 检查是否已存在
-                    if CRAWL_CONFIG['mode'] == 'incremental' and movie_id in existing_movie_ids:
-                        logger.info(f"电影 {movie_id} 已存在，跳过")
-                        continue
-                        
-                    # 访问电影详情页
-                    logger.info(f"正在爬取电影 {movie_id} 详情: {link}")
-                    driver.get(link)
-                    random_sleep()
-                    
-                    # 解析电影详情
-                    detail_soup = BeautifulSoup(driver.page_source, 'html.parser')
-                    movie_info = parse_movie_info(detail_soup)
-                    
-                    # 获取封面URL
-                    cover_img = detail_soup.select_one('#mainpic img')
-                    cover_url = cover_img.get('src') if cover_img else ''
-                    
-                    # 保存电影信息到数据库
-                    save_movie_to_db(db_handler, movie_id, link, movie_info, cover_url)
-                    
-                    # 保存关联信息
-                    save_relations(db_handler, movie_id, detail_soup)
-                    
-                    total_movies += 1
-                    logger.info(f"成功保存电影 {movie_id}: {movie_info.get('title', '未知标题')}")
-                    
-                except Exception as e:
-                    logger.error(f"处理电影 {link} 失败: {e}")
-                    failed_movies.append(link)
+            # 全量模式下读取已有电影的指纹，用于条件请求和变更检测
+            fingerprints = {}
+            if CRAWL_CONFIG['mode'] != 'incremental':
+                fingerprints = db_handler.get_movie_fingerprints([task.movie_id for task in tasks])
+                
+            # 交给流水线，抓取队列满时在此阻塞
+            for task in tasks:
+                pipeline.submit(task, fingerprints.get(task.movie_id))
                     
-            # 下一页
-            current_page += 1
-            
     except Exception as e:
         logger.error(f"爬取过程中发生严重错误: {e}")
+        metrics.ERRORS.inc(stage='main')
     finally:
         # 清理资源
-        driver.quit()
+        pipeline.close()
+        fetcher.close()
+        db_writer.close()
+        seen_movie_ids.save()
         db_handler.close()
-        logger.info(f"爬取完成，共新增 {total_movies} 部电影")
-        if failed_movies:
-            logger.warning(f"共有 {len(failed_movies)} 部电影爬取失败")
-            for failed_url in failed_movies:
-                logger.warning(f"失败URL: {failed_url}")
+        logger.info(f"爬取完成，共新增或更新 {db_writer.saved_count} 部电影，{pipeline.unchanged_count} 部未变化")
+        logger.info(f"抓取队列状态: {frontier.counts()}")
+        if discovery:
+            logger.info(f"发现模式新加入 {discovery.scheduled} 部电影")
+        for name, stats in entity_id_cache.stats().items():
+            logger.info(f"实体缓存 {name}: {stats}")
+        if identity_pool:
+            identity_pool.log_stats()
+        failed_tasks = frontier.failed()
+        if failed_tasks:
+            logger.warning(f"共有 {len(failed_tasks)} 个页面爬取失败")
+            for failed_url, error in failed_tasks:
+                logger.warning(f"失败URL: {failed_url} ({error})")
+        frontier.close()
+        write_metrics_summary()
+        if profiler:
+            profiler.stop()
 
-def save_movie_to_db(db_handler, movie_id, url, movie_info, cover_url):
-    """保存电影信息到数据库"""
-    now = datetime.now()
+def list_page_url(page):
+    """Top250列表页URL"""
+    return f"{CRAWL_CONFIG['base_url']}?start={page*25}"
+
+def movie_detail_url(movie_id):
+    """电影详情页的规范URL，与列表页中的链接格式一致，抓取队列按此去重"""
+    return urljoin(CRAWL_CONFIG['base_url'], f'/subject/{movie_id}/')
+
+class ListPass:
+    """一次运行中成功解析的列表页和其中的电影，用于判断是否完整翻过一遍榜单"""
+    def __init__(self):
+        self.pages = set()
+        self.movie_ids = set()
+        self.end_page = None
+
+    def record(self, page, movie_items):
+        self.pages.add(page)
+        self.movie_ids.update(item['movie_id'] for item in movie_items)
+        if not movie_items:
+            self.end_page = page
+
+    @property
+    def complete(self):
+        """本次从第一页起逐页解析到了没有电影的末页"""
+        return self.end_page is not None and self.pages.issuperset(range(self.end_page + 1))
+
+def crawl_list_page(fetcher, throttle, frontier, task, last_page, seen_movie_ids, db_handler=None, skip_known=False,
+                    list_pass=None):
+    """爬取列表页，把需要爬取的详情页和下一页加入抓取队列
+    
+    指定db_handler时用列表页上的评分、评分人数和排名刷新已入库的电影；
+    skip_known为True时已入库的电影不再抓取详情页；list_pass记录成功解析的列表页
+    """
+    from parser import parse_list_page
+    
+    logger.info(f"正在爬取第 {task.page+1} 页: {task.url}")
+    try:
+        html = fetch_page(fetcher, throttle, task.url).html
+        with metrics.PARSE_SECONDS.time(page='list'):
+            movie_items = parse_list_page(html)
+    except Exception as e:
+        logger.warning(f"爬取列表页 {task.url} 失败({task.attempts + 1}/{frontier.max_attempts}): {e}")
+        metrics.ERRORS.inc(stage='list')
+        metrics.RETRIES.inc(kind='list')
+        frontier.fail(task.url, e)
+        return
+        
+    if list_pass is not None:
+        list_pass.record(task.page, movie_items)
+    if not movie_items:
+        logger.info(f"第 {task.page+1} 页没有找到更多电影")
+        frontier.complete(task.url)
+        return
+        
+    if db_handler is not None:
+        refresh_list_ratings(db_handler, movie_items)
+        
+    for item in movie_items:
+        # 检查是否已存在
+        if (skip_known or CRAWL_CONFIG['mode'] == 'incremental') and item['movie_id'] in seen_movie_ids:
+            logger.info(f"电影 {item['movie_id']} 已存在，跳过")
+            continue
+        frontier.add(item['url'], 'detail', movie_id=item['movie_id'], page=task.page, top250_rank=item['rank'])
+        
+    # 下一页
+    if last_page is None or task.page < last_page:
+        frontier.add(list_page_url(task.page + 1), 'list', page=task.page + 1)
+    elif last_page is not None:
+        logger.info("已达到指定页数，不再加入新的列表页")
+    frontier.complete(task.url)
+
+def refresh_list_ratings(db_handler, movie_items):
+    """用一页列表的评分、评分人数和排名更新已入库的电影，返回有变化的电影数
     
-    # 创建电影对象
-    movie = Movie(
-        movie_id=movie_id,
-        title=movie_info.get('title', ''),
-        release_date=movie_info.get('release_date'),
-        country=movie_info.get('country', ''),
-        language=movie_info.get('language', ''),
-        runtime=movie_info.get('runtime', 0),
-        rating=movie_info.get('rating', 0.0),
-        rating_count=movie_info.get('rating_count', 0),
-        cover_url=cover_url,
-        summary=movie_info.get('summary', ''),
-        url=url,
-        imdb=movie_info.get('imdb', ''),
-        aka=movie_info.get('aka', ''),
-        created_at=now,
-        updated_at=now
+    整页只执行一条UPDATE(按movie_id的CASE表达式)，只更新取值确实变化的行，未入库的电影不受影响
+    """
+    from sqlalchemy import case, or_, update
+    from database import Movie
+    
+    items = [
+        item for item in movie_items
+        if item['rank'] is not None and item['rating'] is not None and item['rating_count'] is not None
+    ]
+    if not items:
+        return 0
+    new_values = {
+        column: case({item['movie_id']: item[key] for item in items}, value=Movie.movie_id, else_=column)
+        for column, key in ((Movie.rating, 'rating'), (Movie.rating_count, 'rating_count'), (Movie.top250_rank, 'rank'))
+    }
+    stmt = (
+        update(Movie)
+        .where(
+            Movie.movie_id.in_([item['movie_id'] for item in items]),
+            Movie.deleted_at == None,
+            or_(*(column != value for column, value in new_values.items()))
+        )
+        .values({**{column.key: value for column, value in new_values.items()}, 'updated_at': datetime.now()})
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        updated = db_handler.session.execute(stmt).rowcount
+        db_handler.session.commit()
+    except Exception as e:
+        db_handler.session.rollback()
+        logger.warning(f"刷新列表页评分失败: {e}")
+        metrics.ERRORS.inc(stage='refresh')
+        return 0
+    if updated:
+        logger.info(f"列表页刷新了 {updated} 部电影的评分和排名")
+        metrics.MOVIES.inc(updated, result='refreshed')
+    return updated
+
+def clear_stale_ranks(db_handler, ranked_ids):
+    """完整翻过一遍榜单后，把不在本次列表页上的电影的排名重置为0(未知)，返回更新的电影数"""
+    from sqlalchemy import update
+    from database import Movie
+    
+    stmt = (
+        update(Movie)
+        .where(Movie.top250_rank != 0, Movie.deleted_at == None, Movie.movie_id.notin_(ranked_ids))
+        .values(top250_rank=0, updated_at=datetime.now())
+        .execution_options(synchronize_session=False)
     )
+    try:
+        cleared = db_handler.session.execute(stmt).rowcount
+        db_handler.session.commit()
+    except Exception as e:
+        db_handler.session.rollback()
+        logger.warning(f"清除已出榜电影的排名失败: {e}")
+        metrics.ERRORS.inc(stage='refresh')
+        return 0
+    if cleared:
+        logger.info(f"{cleared} 部电影已不在榜单上，排名清零")
+    return cleared
+
+def create_identity_pool(proxies):
+    """按逗号分隔的代理列表创建出口身份池，未配置时返回None"""
+    proxies = [proxy.strip() for proxy in (proxies or '').split(',') if proxy.strip()]
+    if not proxies:
+        return None
+    from identity import IdentityPool
+    identity_pool = IdentityPool.from_proxies(proxies)
+    logger.info(f"出口身份池: {', '.join(identity.name for identity in identity_pool.identities)}")
+    return identity_pool
+
+def crawl_reviews(db_handler, fetcher, movie_ids=None, max_reviews=None, throttle=None):
+    """逐部电影翻页抓取全部短评，movie_ids为空时抓取数据库中所有电影"""
+    from reviews import crawl_movie_reviews
+    
+    throttle = throttle or AdaptiveThrottle()
+    fetch = lambda url: fetch_page(fetcher, throttle, url).html
+    total = 0
+    try:
+        # 先取出全部ID，避免抓取期间长时间占用服务端游标
+        for movie_id in movie_ids or list(db_handler.iter_movie_ids()):
+            try:
+                total += crawl_movie_reviews(db_handler, fetch, movie_id, max_reviews=max_reviews)
+            except Exception as e:
+                logger.error(f"抓取电影 {movie_id} 的短评失败，下次从已保存的进度继续: {e}")
+                metrics.ERRORS.inc(stage='reviews')
+    finally:
+        fetcher.close()
+        logger.info(f"短评抓取结束，共新增 {total} 条")
+        write_metrics_summary()
+
+def replay_archive(archive):
+    """从归档中读取每部电影最近一次抓取的详情页，重新解析并入库"""
+    from db_writer import DBWriter
     
-    # 添加到数据库
-    db_handler.session.add(movie)
+    db_writer = DBWriter(save_movie)
+    db_writer.start()
+    replayed = 0
+    try:
+        for url, fetched_at, html in archive.iter_latest():
+            match = DETAIL_URL_PATTERN.search(url)
+            if not match:
+                continue
+            movie_id = int(match.group(1))
+            try:
+                db_writer.submit(build_detail_record(html, movie_id, url))
+                replayed += 1
+            except Exception as e:
+                logger.error(f"回放电影 {url} 失败: {e}")
+    finally:
+        db_writer.close()
+        archive.close()
+        logger.info(f"回放完成，共解析 {replayed} 部电影，入库 {db_writer.saved_count} 部")
+
+def write_metrics_summary():
+    """输出本次运行的指标JSON汇总，配置了METRICS_SUMMARY_PATH时同时写入文件"""
+    summary = json.dumps(metrics.registry.summary(), ensure_ascii=False, indent=2)
+    logger.info(f"运行指标汇总:\n{summary}")
+    if CRAWL_CONFIG['metrics_summary_path']:
+        with open(CRAWL_CONFIG['metrics_summary_path'], 'w', encoding='utf-8') as f:
+            f.write(summary)
+
+def fetch_page(fetcher, throttle, url, headers=None):
+    """通过抓取后端请求页面，返回FetchResult"""
+    from fetcher import looks_blocked
+    
+    throttle.wait()
+    start = time.perf_counter()
+    try:
+        result = fetcher.fetch(url, headers)
+    except Exception:
+        metrics.FETCHES.inc(backend=fetcher.name, status='error')
+        throttle.feedback(error=True)
+        raise
+    latency = time.perf_counter() - start
+    blocked = looks_blocked(result)
+    metrics.FETCH_SECONDS.observe(latency, backend=result.backend)
+    metrics.FETCHES.inc(backend=result.backend, status=result.status)
+    primary = result.primary
+    if primary:
+        # 主后端被拦截或出错后回退：按主后端的结果调整速率，不被回退得到的页面掩盖
+        metrics.FETCHES.inc(backend=primary.backend, status=primary.status or 'error')
+        throttle.feedback(primary.latency, primary.status, primary.blocked, primary.error)
+    else:
+        # 根据耗时、状态码和是否被拦截调整全局请求速率
+        throttle.feedback(latency, result.status, blocked)
+    if blocked:
+        raise RuntimeError(f"页面被拦截(状态码 {result.status}, 后端 {result.backend})")
+    if result.status >= 400:
+        raise RuntimeError(f"请求失败(状态码 {result.status}): {url}")
+    return result
+
+def fetch_movie_page(fetcher, throttle, movie_id, link, fingerprint=None):
+    """请求电影详情页（在抓取线程中执行），返回FetchResult
+    
+    已入库的电影会带上ETag/Last-Modified发起条件请求，服务端返回304表示未变化
+    """
+    logger.info(f"正在爬取电影 {movie_id} 详情: {link}")
+    headers = {}
+    if fingerprint:
+        if fingerprint['etag']:
+            headers['If-None-Match'] = fingerprint['etag']
+        if fingerprint['last_modified']:
+            headers['If-Modified-Since'] = fingerprint['last_modified']
+    return fetch_page(fetcher, throttle, link, headers or None)
+
+def build_detail_record(html, movie_id, url, headers=None, fingerprint=None):
+    """解析详情页并与已有指纹比较，record['change']取值：
+    new 新电影；changed 内容有变化；touched 页面有变化但解析字段不变，只刷新指纹；
+    unchanged 页面完全相同，无需入库
+    """
+    from parser import parse_detail_page
+    
+    new_page_hash = page_hash(html)
+    if fingerprint and fingerprint['page_hash'] == new_page_hash:
+        return {'movie_id': movie_id, 'url': url, 'change': 'unchanged'}
+    
+    with metrics.PARSE_SECONDS.time(page='detail'):
+        record = parse_detail_page(html, movie_id)
+    record['movie_id'] = movie_id
+    record['url'] = url
+    record['fingerprint'] = {
+        'page_hash': new_page_hash,
+        'content_hash': content_hash([record['movie_info'], record['cover_url'], record['relations']])
+    }
+    if headers is not None:
+        lowered = {key.lower(): value for key, value in headers.items()}
+        record['fingerprint']['etag'] = lowered.get('etag', '')
+        record['fingerprint']['last_modified'] = lowered.get('last-modified', '')
+        
+    if not fingerprint:
+        record['change'] = 'new'
+    elif fingerprint['content_hash'] == record['fingerprint']['content_hash']:
+        record['change'] = 'touched'
+    else:
+        record['change'] = 'changed'
+    return record
+
+# 电影详情页URL，用于从URL中提取豆瓣电影ID
+DETAIL_URL_PATTERN = re.compile(r'/subject/(\d+)/')
+
+# 重复写入电影时需要更新的字段
+MOVIE_UPDATE_COLUMNS = [
+    'title', 'release_date', 'country', 'language', 'runtime', 'rating', 'rating_count',
+    'cover_url', 'summary', 'url', 'imdb', 'aka', 'updated_at', 'deleted_at'
+]
+
+def cached_entities():
+    """使用进程级ID缓存的实体及其豆瓣ID字段"""
+    from database import Director, Writer, Actor, Genre
+    
+    return [
+        (Director, 'director_id'),
+        (Writer, 'writer_id'),
+        (Actor, 'actor_id'),
+        (Genre, 'genre_id'),
+    ]
+
+def save_movie(db_handler, record, commit=True):
+    """在同一个事务中保存电影及其关联信息，record为build_detail_record返回的解析结果
+    
+    解析字段未变化(touched)的电影只刷新指纹，不重写电影和关联数据
+    """
+    from sqlalchemy import update
+    from database import Movie
+    
+    try:
+        statements = metrics.thread_statement_count()
+        with metrics.SAVE_SECONDS.time():
+            if record.get('change') == 'touched':
+                db_handler.session.execute(
+                    update(Movie).where(Movie.movie_id == record['movie_id']).values(**record['fingerprint'])
+                )
+            else:
+                save_movie_to_db(db_handler, record['movie_id'], record['url'], record['movie_info'], record['cover_url'],
+                                 commit=False, fingerprint=record.get('fingerprint'), top250_rank=record.get('top250_rank'))
+                save_parsed_relations(db_handler, record['movie_id'], record['relations'], commit=False)
+        metrics.STATEMENTS_PER_MOVIE.observe(metrics.thread_statement_count() - statements)
+        if commit:
+            db_handler.session.commit()
+    except Exception as e:
+        db_handler.session.rollback()
+        logger.error(f"保存电影 {record['movie_id']} 失败: {e}")
+        raise
+
+def save_movie_to_db(db_handler, movie_id, url, movie_info, cover_url, commit=True, fingerprint=None, top250_rank=None):
+    """保存电影信息到数据库，fingerprint为变更检测指纹字段
+
+    top250_rank为列表页上的排名，为空(发现的电影)时新建的电影排名为0，已有电影保留原排名
+    """
+    from database import upsert, Movie
+    
+    now = datetime.now()
+    
+    # 电影数据
+    movie = {
+        'movie_id': movie_id,
+        'title': movie_info.get('title', ''),
+        'release_date': movie_info.get('release_date'),
+        'country': movie_info.get('country', ''),
+        'language': movie_info.get('language', ''),
+        'runtime': movie_info.get('runtime') or 0,
+        'rating': movie_info.get('rating', 0.0),
+        'rating_count': movie_info.get('rating_count', 0),
+        'cover_url': cover_url,
+        'summary': movie_info.get('summary', ''),
+        'url': url,
+        'imdb': movie_info.get('imdb', ''),
+        'aka': movie_info.get('aka', ''),
+        'created_at': now,
+        'updated_at': now,
+        'deleted_at': None
+    }
+    
+    update_columns = list(MOVIE_UPDATE_COLUMNS)
+    if top250_rank:
+        movie['top250_rank'] = top250_rank
+        update_columns.append('top250_rank')
+    if fingerprint:
+        movie.update(fingerprint)
+        update_columns.extend(fingerprint)
+    
+    # 按豆瓣电影ID写入，已存在时更新除创建时间外的所有字段
+    upsert(db_handler.session, Movie, [movie], update_columns)
+    if not commit:
+        return
     
     # 提交事务
     try:
@@ -139,152 +627,105 @@ def save_movie_to_db(db_handler, movie_id, url, movie_info, cover_url):
         logger.error(f"保存电影失败: {e}")
         raise
 
-def save_relations(db_handler, movie_id, detail_soup):
-    """保存电影关联信息到数据库"""
+def save_relations(db_handler, movie_id, detail_soup, commit=True):
+    """解析并保存电影关联信息到数据库"""
+    from parser import parse_relations
+    
+    save_parsed_relations(db_handler, movie_id, parse_relations(detail_soup, movie_id), commit)
+
+def save_parsed_relations(db_handler, movie_id, relations, commit=True):
+    """保存已解析的电影关联信息到数据库
+    
+    每类实体只执行固定次数的语句：一次批量upsert实体，一次IN查询取回自增ID，
+    一次批量upsert关联记录，一次UPDATE软删除页面上已不存在的旧关联(同一事务内)
+    """
+    from database import (upsert, Director, MovieDirectorRelation, Writer, MovieWriterRelation,
+                          Actor, MovieActorRelation, Genre, MovieGenreRelation, Review)
+    
+    session = db_handler.session
     now = datetime.now()
     
-    # 保存导演信息
-    directors = parse_directors(detail_soup)
-    for director in directors:
-        # 检查导演是否已存在
-        director_obj = db_handler.session.query(Director).filter(
-            Director.director_id == director['id']
-        ).first()
-        
-        if not director_obj:
-            # 创建新导演
-            director_obj = Director(
-                director_id=director['id'],
-                name=director['name'],
-                created_at=now,
-                updated_at=now
-            )
-            db_handler.session.add(director_obj)
-            db_handler.session.flush()  # 获取新创建的ID
-            
-        # 创建电影-导演关联
-        relation = MovieDirectorRelation(
-            movie_id=movie_id,
-            director_id=director_obj.id,
-            created_at=now,
-            updated_at=now
-        )
-        db_handler.session.add(relation)
-    
-    # 保存编剧信息
-    writers = parse_writers(detail_soup)
-    for writer in writers:
-        # 检查编剧是否已存在
-        writer_obj = db_handler.session.query(Writer).filter(
-            Writer.writer_id == writer['id']
-        ).first()
-        
-        if not writer_obj:
-            # 创建新编剧
-            writer_obj = Writer(
-                writer_id=writer['id'],
-                name=writer['name'],
-                created_at=now,
-                updated_at=now
-            )
-            db_handler.session.add(writer_obj)
-            db_handler.session.flush()  # 获取新创建的ID
-            
-        # 创建电影-编剧关联
-        relation = MovieWriterRelation(
-            movie_id=movie_id,
-            writer_id=writer_obj.id,
-            created_at=now,
-            updated_at=now
+    # 保存导演、编剧、演员、类型及其关联
+    entity_specs = [
+        (relations['directors'], Director, 'director_id', 'name', MovieDirectorRelation, int),
+        (relations['writers'], Writer, 'writer_id', 'name', MovieWriterRelation, int),
+        (relations['actors'], Actor, 'actor_id', 'name', MovieActorRelation, int),
+        (relations['genres'], Genre, 'genre_id', 'genre_name', MovieGenreRelation, str),
+    ]
+    for items, model, key_attr, name_attr, relation_model, key_type in entity_specs:
+        id_map = _resolve_entities(session, model, key_attr, name_attr, items, key_type, now)
+        relation_rows = [
+            {'movie_id': movie_id, key_attr: id_map[key], 'created_at': now, 'updated_at': now, 'deleted_at': None}
+            for key in dict.fromkeys(key_type(item['id']) for item in items)
+        ]
+        upsert(session, relation_model, relation_rows, ['deleted_at'])
+        # 页面上已移除的导演/演员/类型等，软删除对应的关联记录
+        key_column = getattr(relation_model, key_attr)
+        stale = session.query(relation_model).filter(
+            relation_model.movie_id == movie_id, relation_model.deleted_at == None
         )
-        db_handler.session.add(relation)
-    
-    # 保存演员信息
-    actors = parse_actors(detail_soup)
-    for actor in actors:
-        # 检查演员是否已存在
-        actor_obj = db_handler.session.query(Actor).filter(
-            Actor.actor_id == actor['id']
-        ).first()
-        
-        if not actor_obj:
-            # 创建新演员
-            actor_obj = Actor(
-                actor_id=actor['id'],
-                name=actor['name'],
-                created_at=now,
-                updated_at=now
-            )
-            db_handler.session.add(actor_obj)
-            db_handler.session.flush()  # 获取新创建的ID
-            
-        # 创建电影-演员关联
-        relation = MovieActorRelation(
-            movie_id=movie_id,
-            actor_id=actor_obj.id,
-            created_at=now,
-            updated_at=now
-        )
-        db_handler.session.add(relation)
-    
-    # 保存类型信息
-    genres = parse_genres(detail_soup)
-    for genre in genres:
-        # 检查类型是否已存在
-        genre_obj = db_handler.session.query(Genre).filter(
-            Genre.genre_id == genre['id']
-        ).first()
-        
-        if not genre_obj:
-            # 创建新类型
-            genre_obj = Genre(
-                genre_id=genre['id'],
-                genre_name=genre['name'],
-                created_at=now,
-                updated_at=now
-            )
-            db_handler.session.add(genre_obj)
-            db_handler.session.flush()  # 获取新创建的ID
-            
-        # 创建电影-类型关联
-        relation = MovieGenreRelation(
-            movie_id=movie_id,
-            genre_id=genre_obj.id,
-            created_at=now,
-            updated_at=now
-        )
-        db_handler.session.add(relation)
-    
-    # 保存评论信息
-    reviews = parse_reviews(detail_soup, movie_id)
-    for review in reviews:
-        # 检查评论是否已存在
-        review_obj = db_handler.session.query(Review).filter(
-            Review.review_id == review['review_id']
-        ).first()
-        
-        if not review_obj:
-            # 创建新评论
-            review_obj = Review(
-                review_id=review['review_id'],
-                movie_id=movie_id,
-                user_name=review['user_name'],
-                rating=review['rating'],
-                content=review['content'],
-                publish_date=review['publish_date'],
-                created_at=now,
-                updated_at=now
-            )
-            db_handler.session.add(review_obj)
+        if relation_rows:
+            stale = stale.filter(key_column.notin_([row[key_attr] for row in relation_rows]))
+        stale.update({'deleted_at': now, 'updated_at': now}, synchronize_session=False)
+    
+    # 保存评论信息，已存在的评论保持不变
+    reviews = {review['review_id']: review for review in relations['reviews']}
+    if reviews:
+        review_rows = [
+            {
+                'review_id': review['review_id'],
+                'movie_id': movie_id,
+                'user_name': review['user_name'],
+                'rating': review['rating'] or 0,
+                'content': review['content'],
+                'publish_date': review['publish_date'],
+                'created_at': now,
+                'updated_at': now
+            }
+            for review in reviews.values()
+        ]
+        upsert(session, Review, review_rows, [])
+    
+    if not commit:
+        return
     
     # 提交所有关联数据
     try:
-        db_handler.session.commit()
+        session.commit()
     except Exception as e:
-        db_handler.session.rollback()
+        session.rollback()
         logger.error(f"保存关联数据失败: {e}")
         raise
 
+def _resolve_entities(session, model, key_attr, name_attr, items, key_type, now):
+    """批量写入实体，返回 豆瓣ID -> 本地自增ID 的映射
+    
+    先查进程级ID缓存，只有未命中的实体才访问数据库
+    """
+    from database import upsert
+    from cache import entity_id_cache
+    
+    names = {}
+    for item in items:
+        names.setdefault(key_type(item['id']), item['name'])
+    if not names:
+        return {}
+    
+    id_map, missing = entity_id_cache.lookup(model, names)
+    if not missing:
+        return id_map
+    
+    # 已存在的实体只刷新名称并撤销软删除
+    upsert(session, model, [
+        {key_attr: key, name_attr: names[key], 'created_at': now, 'updated_at': now, 'deleted_at': None}
+        for key in missing
+    ], [name_attr, 'deleted_at'])
+    key_column = getattr(model, key_attr)
+    fetched = dict(session.query(key_column, model.id).filter(key_column.in_(missing)).all())
+    entity_id_cache.stage(session, model, fetched)
+    id_map.update(fetched)
+    return id_map
+
 if __name__ == "__main__":
     main()
     
\ No newline at end of file
@@ -0,0 +1,96 @@
+import functools
+import linecache
+import sys
+import threading
+import tracemalloc
+from utils import logger
+
+class MemoryProfiler:
+    """--profile-memory模式下按阶段统计内存分配
+
+    wrap(stage, func)包装各阶段的处理函数，每次调用前后读取tracemalloc的当前占用和峰值：
+    峰值增量为处理一页时额外需要的内存，保留增量为调用结束后仍未释放的内存。
+    为了让峰值可以归属到具体阶段，被包装的调用在全局锁内串行执行，运行会变慢；
+    开始和结束时各取一次快照，报告中列出增长最多的分配位置。
+    lxml(libxml2)在C层分配的文档树内存不在tracemalloc统计范围内，报告另附进程的最大常驻内存
+    """
+    def __init__(self, frames=1, top=10):
+        self.frames = frames
+        self.top = top
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._baseline = tracemalloc.take_snapshot()
+        logger.info("内存分析已开启，各阶段的处理将串行执行")
+
+    def wrap(self, stage, func):
+        """返回统计stage阶段内存的func包装函数"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    after, peak = tracemalloc.get_traced_memory()
+                    self._record(stage, peak - before, after - before)
+        return wrapper
+
+    def _record(self, stage, peak, retained):
+        state = self.stages.setdefault(stage, {'calls': 0, 'peak_sum': 0, 'peak_max': 0, 'retained_sum': 0})
+        state['calls'] += 1
+        state['peak_sum'] += peak
+        state['peak_max'] = max(state['peak_max'], peak)
+        state['retained_sum'] += retained
+
+    def report(self):
+        """返回各阶段统计、整体峰值和增长最多的分配位置，单位KB"""
+        _, peak = tracemalloc.get_traced_memory()
+        stages = {
+            stage: {
+                'calls': state['calls'],
+                'peak_avg_kb': round(state['peak_sum'] / state['calls'] / 1024, 1),
+                'peak_max_kb': round(state['peak_max'] / 1024, 1),
+                'retained_per_call_kb': round(state['retained_sum'] / state['calls'] / 1024, 1)
+            }
+            for stage, state in self.stages.items()
+        }
+        top = []
+        if self._baseline is not None:
+            for stat in tracemalloc.take_snapshot().compare_to(self._baseline, 'lineno')[:self.top]:
+                frame = stat.traceback[0]
+                top.append({
+                    'location': f'{frame.filename}:{frame.lineno}',
+                    'code': linecache.getline(frame.filename, frame.lineno).strip(),
+                    'size_diff_kb': round(stat.size_diff / 1024, 1),
+                    'count_diff': stat.count_diff
+                })
+        return {'peak_kb': round(peak / 1024, 1), 'max_rss_kb': _max_rss_kb(), 'stages': stages, 'top_allocations': top}
+
+    def stop(self):
+        """停止跟踪并输出报告"""
+        report = self.report()
+        tracemalloc.stop()
+        logger.info(f"内存峰值: {report['peak_kb']}KB(tracemalloc)，进程最大常驻内存: {report['max_rss_kb']}KB")
+        for stage, stats in report['stages'].items():
+            logger.info(
+                f"阶段 {stage}: {stats['calls']} 次，每页峰值 {stats['peak_avg_kb']}KB(最大 {stats['peak_max_kb']}KB)，"
+                f"每页保留 {stats['retained_per_call_kb']}KB"
+            )
+        for item in report['top_allocations']:
+            logger.info(f"内存增长 {item['size_diff_kb']:+}KB ({item['count_diff']:+} 个对象) {item['location']} {item['code']}")
+        return report
+
+def _max_rss_kb():
+    """进程最大常驻内存(KB)，不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS上单位为字节，Linux上为KB
+    return round(max_rss / 1024, 1) if sys.platform == 'darwin' else max_rss
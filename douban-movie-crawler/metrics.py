@@ -0,0 +1,268 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认的耗时分桶(秒)
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _summary_key(self, key):
+        return ','.join(f'{name}={value}' for name, value in zip(self.labelnames, key)) or '_'
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}_total{self._format_labels(key)} {value}' for key, value in items]
+
+    def summary(self):
+        with self._lock:
+            return {self._summary_key(key): value for key, value in sorted(self._values.items())}
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in items]
+
+    def summary(self):
+        with self._lock:
+            return {self._summary_key(key): value for key, value in sorted(self._values.items())}
+
+class Histogram(_Metric):
+    """分桶直方图，记录观测值的分布、总和、次数和最大值"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'max': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+            state['max'] = max(state['max'], value)
+
+    def quantile(self, q, **labels):
+        """按分桶线性插值估算分位数(与Prometheus的histogram_quantile相同)，没有观测值时返回None
+        超出最后一个分桶的部分在分桶上界和最大值之间插值"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if not state or not state['count']:
+                return None
+            buckets, count, maximum = list(state['buckets']), state['count'], state['max']
+        rank = q * count
+        cumulative, lower = 0, 0.0
+        for bound, n in zip(self.buckets, buckets):
+            if n and cumulative + n >= rank:
+                return min(maximum, lower + (bound - lower) * (rank - cumulative) / n)
+            cumulative += n
+            lower = bound
+        return lower + (maximum - lower) * (rank - cumulative) / (count - cumulative)
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块耗时(秒)，代码块抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, dict(state, buckets=list(state['buckets']))) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{self._format_labels(key, ("le", _format_number(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{self._format_labels(key, ("le", "+Inf"))} {state["count"]}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {state["sum"]}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {state["count"]}')
+        return lines
+
+    def summary(self):
+        with self._lock:
+            return {
+                self._summary_key(key): {
+                    'count': state['count'],
+                    'sum': round(state['sum'], 6),
+                    'avg': round(state['sum'] / state['count'], 6) if state['count'] else 0,
+                    'max': round(state['max'], 6)
+                }
+                for key, state in sorted(self._values.items())
+            }
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_number(value):
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+class Registry:
+    """指标注册表，按Prometheus文本格式或JSON汇总输出"""
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """所有指标的JSON汇总"""
+        return {metric.name: metric.summary() for metric in self._metrics}
+
+registry = Registry()
+
+FETCH_SECONDS = registry.histogram('crawler_fetch_seconds', '页面请求耗时(秒)', ['backend'])
+FETCHES = registry.counter('crawler_fetches', '页面请求次数', ['backend', 'status'])
+SLEEP_SECONDS = registry.histogram('crawler_sleep_seconds', '请求前节流等待时间(秒)')
+REQUEST_RATE = registry.gauge('crawler_request_rate', '自适应限速当前允许的请求速率(次/秒)')
+IDENTITY_HEALTH = registry.gauge('crawler_identity_health', '出口身份的健康分(0~1)', ['identity'])
+IDENTITY_REQUESTS = registry.counter('crawler_identity_requests', '各出口身份的请求数', ['identity', 'result'])
+PARSE_SECONDS = registry.histogram('crawler_parse_seconds', '页面解析耗时(秒)', ['page'])
+SAVE_SECONDS = registry.histogram('crawler_save_seconds', '单部电影写库耗时(秒，不含提交)')
+STATEMENTS_PER_MOVIE = registry.histogram(
+    'crawler_db_statements_per_movie', '单部电影执行的SQL语句数', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+COMMIT_SECONDS = registry.histogram('crawler_db_commit_seconds', '写库线程每次合并提交的耗时(秒)')
+MOVIES_PER_COMMIT = registry.histogram(
+    'crawler_db_movies_per_commit', '每次合并提交包含的电影数', buckets=(1, 2, 5, 10, 20, 50, 100)
+)
+DB_STATEMENTS = registry.counter('crawler_db_statements', '执行的SQL语句数')
+DB_COMMITS = registry.counter('crawler_db_commits', '数据库事务提交次数')
+MOVIES = registry.counter('crawler_movies', '处理的电影数', ['result'])
+ERRORS = registry.counter('crawler_errors', '错误次数', ['stage'])
+RETRIES = registry.counter('crawler_retries', '重试次数', ['kind'])
+DISCOVERED = registry.counter('crawler_discovered_links', '发现模式新加入抓取队列的电影数')
+QUEUE_DEPTH = registry.gauge('crawler_queue_depth', '详情页流水线各阶段队列中等待的任务数', ['stage'])
+
+# 按线程统计SQL语句数，用于计算单部电影的语句数
+_local = threading.local()
+
+def thread_statement_count():
+    """当前线程累计执行的SQL语句数"""
+    return getattr(_local, 'statements', 0)
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    _local.statements = thread_statement_count() + 1
+    DB_STATEMENTS.inc()
+
+def _count_commit(session):
+    DB_COMMITS.inc()
+
+_instrumented = False
+
+def instrument_sqlalchemy():
+    """注册SQLAlchemy事件统计SQL语句数和提交次数，由database模块在创建引擎时调用"""
+    global _instrumented
+    if _instrumented:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+
+    event.listen(Engine, 'before_cursor_execute', _count_statement)
+    event.listen(Session, 'after_commit', _count_commit)
+    _instrumented = True
+
+def _render_response(path):
+    """返回指标接口路径对应的 (响应体, Content-Type)，未知路径返回None"""
+    if path == '/metrics':
+        return registry.render().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+    if path == '/metrics.json':
+        return json.dumps(registry.summary(), ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+    return None
+
+def start_http_server(port, host='127.0.0.1'):
+    """在后台线程中启动指标HTTP服务，/metrics为Prometheus文本格式，/metrics.json为JSON汇总"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            response = _render_response(self.path)
+            if response is None:
+                self.send_error(404)
+                return
+            body, content_type = response
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -1,4 +1,6 @@
 from datetime import datetime
+import re
+import lxml.html
 from utils import logger
 
 def parse_movie_info(detail_soup):
@@ -132,6 +134,145 @@ def parse_reviews(detail_soup, movie_id):
         logger.error(f"解析评论信息失败: {e}")
     return reviews
 
+def parse_detail_page(html, movie_id):
+    """一次遍历解析电影详情页，返回电影信息、封面URL、关联信息和页面中链接到的其他电影ID(links)
+    
+    基于lxml构建文档树，只做一次先序遍历收集所需节点，再按节点取值；
+    结果与parse_movie_info、parse_directors等BeautifulSoup版本的函数保持一致
+    """
+    root = lxml.html.fromstring(html)
+    nodes = {}
+    directors, actors, genres, comments = [], [], [], []
+    links = {}
+    writer_section = writer_span = None
+    mainpic_seen = False
+    cover_img = None
+    
+    for element in root.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+        if tag == 'span':
+            # find_next('span')：编剧标签之后文档顺序上的第一个span
+            if writer_section is not None and writer_span is None:
+                writer_span = element
+            prop = element.get('property')
+            if prop == 'v:genre':
+                genres.append(element)
+            elif prop in _FIRST_SPAN_PROPERTIES:
+                nodes.setdefault(prop, element)
+            if writer_section is None and _string(element) == '编剧':
+                writer_section = element
+        elif tag == 'a':
+            rel = ' '.join(element.get('rel', '').split())
+            if rel == 'v:directedBy':
+                directors.append(element)
+            elif rel == 'v:starring':
+                actors.append(element)
+            linked_id = canonical_movie_id(element.get('href', ''))
+            if linked_id is not None and linked_id != movie_id:
+                links.setdefault(linked_id, None)
+        elif tag == 'div':
+            if element.get('id') == 'info':
+                nodes.setdefault('info', element)
+            if _has_class(element, 'comment-item'):
+                comments.append(element)
+        elif tag == 'strong':
+            if element.get('property') == 'v:average':
+                nodes.setdefault('v:average', element)
+        elif tag == 'img':
+            if mainpic_seen and cover_img is None and _has_mainpic_ancestor(element):
+                cover_img = element
+        if not mainpic_seen and element.get('id') == 'mainpic':
+            mainpic_seen = True
+            
+    writers = []
+    try:
+        if writer_section is not None:
+            for element in writer_span.iterdescendants('a'):
+                writers.append({'id': element.attrib['href'].split('/')[-2], 'name': _text(element)})
+    except Exception as e:
+        logger.error(f"解析编剧信息失败: {e}")
+        
+    return {
+        'movie_info': _build_movie_info(nodes),
+        'cover_url': cover_img.get('src') if cover_img is not None else '',
+        'relations': {
+            'directors': _build_people(directors, '导演'),
+            'writers': writers,
+            'actors': _build_people(actors, '演员'),
+            'genres': [{'id': _text(element), 'name': _text(element)} for element in genres],
+            'reviews': _build_reviews(comments, movie_id)
+        },
+        'links': list(links)
+    }
+
+def parse_relations(detail_soup, movie_id):
+    """解析电影的导演、编剧、演员、类型和短评"""
+    return {
+        'directors': parse_directors(detail_soup),
+        'writers': parse_writers(detail_soup),
+        'actors': parse_actors(detail_soup),
+        'genres': parse_genres(detail_soup),
+        'reviews': parse_reviews(detail_soup, movie_id)
+    }
+
+def canonical_movie_id(url):
+    """把指向豆瓣电影条目的链接规范化为电影ID，其他链接返回None
+    
+    支持绝对、协议相对和站内相对地址以及移动版地址，忽略查询参数、锚点和条目下的子页面
+    """
+    match = _MOVIE_LINK_PATTERN.match(url.strip())
+    return int(match.group(1)) if match else None
+
+def parse_list_page(html):
+    """解析Top250列表页的div.item，返回每部电影的ID、详情页URL、排名、标题、评分和评分人数
+    
+    排名、评分或评分人数缺失时对应字段为None
+    """
+    root = lxml.html.fromstring(html)
+    items = []
+    for element in root.iter('div'):
+        if not _has_class(element, 'item'):
+            continue
+        try:
+            url = _select_one(element, 'a').attrib['href']
+            movie_id = int(url.split('/')[-2])
+        except Exception as e:
+            logger.error(f"解析电影条目失败: {e}")
+            continue
+        rank = _select_one(element, 'em')
+        title = _select_one(element, 'span', 'title')
+        rating = _select_one(element, 'span', 'rating_num')
+        votes = None
+        for span in element.iterdescendants('span'):
+            match = _VOTES_PATTERN.fullmatch(_text(span).strip())
+            if match:
+                votes = int(match.group(1))
+                break
+        items.append({
+            'movie_id': movie_id,
+            'url': url,
+            'rank': int(_text(rank)) if rank is not None and _text(rank).strip().isdigit() else None,
+            'title': _text(title).strip() if title is not None else '',
+            'rating': float(_text(rating)) if rating is not None and _text(rating).strip() else None,
+            'rating_count': votes
+        })
+    return items
+
+def parse_comments_page(html, movie_id):
+    """解析短评分页(/subject/<id>/comments)的一页，返回 (短评列表, 是否还有下一页)"""
+    root = lxml.html.fromstring(html)
+    comments = []
+    has_next = False
+    for element in root.iter('div', 'a'):
+        if element.tag == 'div':
+            if _has_class(element, 'comment-item'):
+                comments.append(element)
+        elif _has_class(element, 'next') and element.get('href'):
+            has_next = True
+    return _build_reviews(comments, movie_id), has_next
+
 def _extract_info(text, keyword):
     """辅助函数：从文本中提取指定关键词后内容"""
     if keyword in text:
@@ -151,4 +292,140 @@ def _extract_runtime(soup):
         except (ValueError, TypeError):
             pass
     return None
-    
\ No newline at end of file
+
+# 单次遍历解析时只取第一个匹配节点的span属性
+_FIRST_SPAN_PROPERTIES = {'v:itemreviewed', 'v:initialReleaseDate', 'v:runtime', 'v:votes', 'v:summary'}
+# 与BeautifulSoup的get_text一致，不计入这些标签内的文本
+_NON_TEXT_TAGS = {'script', 'style', 'template'}
+# 电影条目链接：movie.douban.com/subject/<id>、m.douban.com/movie/subject/<id> 及站内相对地址/subject/<id>
+_MOVIE_LINK_PATTERN = re.compile(r'(?:(?:https?:)?//(?:movie\.douban\.com|m\.douban\.com/movie))?/subject/(\d+)(?:[/?#]|$)')
+# 列表页评分人数，如 "3141592人评价"
+_VOTES_PATTERN = re.compile(r'(\d+)人评价')
+_RATING_MAP = {'力荐': 5, '推荐': 4, '还行': 3, '较差': 2, '很差': 1}
+
+def _iter_strings(element):
+    """按文档顺序遍历元素内的文本节点，跳过注释和脚本"""
+    if element.text and element.tag not in _NON_TEXT_TAGS:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from _iter_strings(child)
+        if child.tail:
+            yield child.tail
+
+def _text(element, strip=False):
+    """等价于BeautifulSoup的 .text / get_text(strip=True)"""
+    if strip:
+        return ''.join(text.strip() for text in _iter_strings(element))
+    return ''.join(_iter_strings(element))
+
+def _string(element):
+    """等价于BeautifulSoup的 .string：只有唯一子节点时返回其文本"""
+    children = [child for child in element]
+    if element.text:
+        return element.text if not children else None
+    if len(children) != 1 or children[0].tail:
+        return None
+    child = children[0]
+    if not isinstance(child.tag, str):
+        return None
+    return _string(child)
+
+def _has_mainpic_ancestor(element):
+    return any(ancestor.get('id') == 'mainpic' for ancestor in element.iterancestors())
+
+def _has_class(element, class_name):
+    return class_name in element.get('class', '').split()
+
+def _select_one(element, tag, class_name=None, within=None):
+    """等价于 select_one('tag.class') 或 select_one('within_tag.within_class tag.class')，不含元素自身"""
+    for child in element.iterdescendants(tag):
+        if class_name is not None and not _has_class(child, class_name):
+            continue
+        if within is None:
+            return child
+        within_tag, within_class = within
+        for ancestor in child.iterancestors():
+            if ancestor is element:
+                break
+            if ancestor.tag == within_tag and _has_class(ancestor, within_class):
+                return child
+    return None
+
+def _build_movie_info(nodes):
+    try:
+        info = {}
+        info['title'] = _text(nodes['v:itemreviewed']).strip()
+        
+        release_date_element = nodes.get('v:initialReleaseDate')
+        if release_date_element is not None:
+            release_date_str = release_date_element.get('content', '').split('(')[0]
+            try:
+                info['release_date'] = datetime.strptime(release_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                info['release_date'] = None
+        else:
+            info['release_date'] = None
+            
+        info_div = nodes.get('info')
+        if info_div is not None:
+            info_text = _text(info_div, strip=True)
+            info['country'] = _extract_info(info_text, '制片国家/地区:')
+            info['language'] = _extract_info(info_text, '语言:')
+            runtime_span = nodes.get('v:runtime')
+            info['runtime'] = None
+            if runtime_span is not None:
+                try:
+                    info['runtime'] = int(runtime_span.get('content'))
+                except (ValueError, TypeError):
+                    pass
+            info['imdb'] = _extract_info(info_text, 'IMDb:')
+            info['aka'] = _extract_info(info_text, '又名:')
+            
+        rating_num = nodes.get('v:average')
+        info['rating'] = float(_text(rating_num).strip()) if rating_num is not None else 0.0
+        
+        rating_count = nodes.get('v:votes')
+        info['rating_count'] = int(_text(rating_count).strip()) if rating_count is not None else 0
+        
+        summary = nodes.get('v:summary')
+        info['summary'] = _text(summary, strip=True) if summary is not None else ''
+        
+        return info
+    except Exception as e:
+        logger.error(f"解析电影信息失败: {e}")
+        return {}
+
+def _build_people(elements, label):
+    people = []
+    try:
+        for element in elements:
+            people.append({'id': element.attrib['href'].split('/')[-2], 'name': _text(element)})
+    except Exception as e:
+        logger.error(f"解析{label}信息失败: {e}")
+    return people
+
+def _build_reviews(comments, movie_id):
+    reviews = []
+    try:
+        for element in comments:
+            user_name = _text(_select_one(element, 'a', within=('span', 'comment-info')))
+            rating_element = _select_one(element, 'span', 'rating', within=('span', 'comment-info'))
+            rating = None
+            if rating_element is not None:
+                rating = _RATING_MAP.get(rating_element.get('title'))
+            content = _text(_select_one(element, 'span', 'short'))
+            date_str = _select_one(element, 'span', 'comment-time').get('title').strip()
+            date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
+            
+            reviews.append({
+                'review_id': element.get('data-cid'),
+                'movie_id': movie_id,
+                'user_name': user_name,
+                'rating': rating,
+                'content': content,
+                'publish_date': date
+            })
+    except Exception as e:
+        logger.error(f"解析评论信息失败: {e}")
+    return reviews
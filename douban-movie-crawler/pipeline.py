@@ -0,0 +1,182 @@
+import queue
+import signal
+import threading
+import time
+from utils import logger
+import metrics
+
+# 通知阶段线程退出的哨兵
+_STOP = object()
+
+def _init_parse_worker():
+    """解析子进程初始化：忽略Ctrl+C(由主进程统一处理)，预先导入解析器"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import parser  # noqa: F401
+
+class DetailPipeline:
+    """详情页流水线：抓取(线程) → 解析(进程池) → 入库(DBWriter写库线程)
+
+    主循环通过submit把任务放入抓取队列，fetch_workers个线程请求页面后把原始HTML放入解析队列，
+    parse_workers个解析线程各自占用进程池中的一个进程解析(传入HTML，返回普通dict记录)，
+    再交给写库线程批量提交。阶段之间都是有界队列，下游跟不上时上游在put上阻塞形成背压；
+    各阶段队列深度上报到指标crawler_queue_depth。parse_workers为0时在解析线程内直接解析，不使用子进程
+
+    fetch_func(task, fingerprint)返回FetchResult，状态码304表示未变化；
+    parse_func(html, movie_id, url, headers, fingerprint)返回待保存记录，必须是模块级函数以便传给子进程；
+    解析完成的记录先调用on_parsed(task, record)再交给写库线程；
+    未变化的任务调用on_unchanged(task)，抓取或解析失败调用on_failed(task, exception)
+    """
+    def __init__(self, fetch_func, parse_func, db_writer, fetch_workers=1, parse_workers=0, queue_size=None,
+                 on_parsed=None, on_unchanged=None, on_failed=None):
+        self.fetch_func = fetch_func
+        self.parse_func = parse_func
+        self.db_writer = db_writer
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(0, parse_workers)
+        self.on_parsed = on_parsed
+        self.on_unchanged = on_unchanged
+        self.on_failed = on_failed
+        queue_size = queue_size or self.fetch_workers * 4
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.parse_queue = queue.Queue(maxsize=queue_size)
+        self._executor = None
+        self._threads = []
+        self._pending = 0
+        self.unchanged_count = 0
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+
+    def start(self):
+        if self.parse_workers:
+            # 延迟导入；spawn方式启动子进程，避免在已有多个线程的进程中fork
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_parse_worker
+            )
+        for i in range(self.fetch_workers):
+            self._spawn(self._fetch_loop, f'fetch-{i}')
+        for i in range(max(1, self.parse_workers)):
+            self._spawn(self._parse_loop, f'parse-{i}')
+        logger.info(f"流水线启动: 抓取线程 {self.fetch_workers}，解析进程 {self.parse_workers or '无(线程内解析)'}")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, task, fingerprint=None):
+        """提交一个详情页任务，抓取队列满时阻塞"""
+        with self._pending_lock:
+            self._pending += 1
+        self.fetch_queue.put((task, fingerprint))
+        self.report_depth()
+
+    @property
+    def pending(self):
+        """已提交但尚未交给写库线程(或判定为未变化/失败)的任务数"""
+        with self._pending_lock:
+            return self._pending
+
+    def wait_idle(self, timeout=None):
+        """等待已提交的任务全部离开抓取和解析阶段，返回是否已空闲"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        """处理完队列中剩余的任务后停止各阶段线程和解析进程"""
+        for _ in range(self.fetch_workers):
+            self.fetch_queue.put(_STOP)
+        for thread in self._threads[:self.fetch_workers]:
+            thread.join()
+        for _ in range(max(1, self.parse_workers)):
+            self.parse_queue.put(_STOP)
+        for thread in self._threads[self.fetch_workers:]:
+            thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self.report_depth()
+
+    def report_depth(self):
+        """上报各阶段等待中的任务数"""
+        metrics.QUEUE_DEPTH.set(self.fetch_queue.qsize(), stage='fetch')
+        metrics.QUEUE_DEPTH.set(self.parse_queue.qsize(), stage='parse')
+        metrics.QUEUE_DEPTH.set(self.db_writer.queue.qsize(), stage='save')
+
+    def _done(self, unchanged=False):
+        with self._idle:
+            self._pending -= 1
+            if unchanged:
+                self.unchanged_count += 1
+            self._idle.notify_all()
+        self.report_depth()
+
+    def _fail(self, task, e):
+        try:
+            if self.on_failed:
+                self.on_failed(task, e)
+        finally:
+            self._done()
+
+    def _fetch_loop(self):
+        while True:
+            item = self.fetch_queue.get()
+            if item is _STOP:
+                return
+            task, fingerprint = item
+            try:
+                result = self.fetch_func(task, fingerprint)
+            except Exception as e:
+                self._fail(task, e)
+                continue
+            if result.status == 304:
+                self._unchanged(task)
+                continue
+            # 解析跟不上时在此阻塞
+            self.parse_queue.put((task, result.html, result.headers, fingerprint))
+            # 页面已交给解析阶段，等待下一个任务时不再持有
+            result = None
+            self.report_depth()
+
+    def _parse_loop(self):
+        while True:
+            item = self.parse_queue.get()
+            if item is _STOP:
+                return
+            task, html, headers, fingerprint = item
+            item = None
+            try:
+                if self._executor:
+                    start = time.perf_counter()
+                    record = self._executor.submit(self.parse_func, html, task.movie_id, task.url, headers, fingerprint).result()
+                    # 子进程中记录的指标不会回到主进程，在这里统计(含进程间传输)
+                    metrics.PARSE_SECONDS.observe(time.perf_counter() - start, page='detail')
+                else:
+                    record = self.parse_func(html, task.movie_id, task.url, headers, fingerprint)
+            except Exception as e:
+                self._fail(task, e)
+                continue
+            finally:
+                # 解析完成后立即释放页面HTML，等待写库队列或下一个任务时不再持有
+                html = headers = None
+            if record['change'] == 'unchanged':
+                self._unchanged(task)
+                continue
+            try:
+                if self.on_parsed:
+                    self.on_parsed(task, record)
+                # 写库线程队列满时在此阻塞
+                self.db_writer.submit(record)
+            except Exception as e:
+                self._fail(task, e)
+                continue
+            self._done()
+
+    def _unchanged(self, task):
+        try:
+            if self.on_unchanged:
+                self.on_unchanged(task)
+        finally:
+            self._done(unchanged=True)
@@ -0,0 +1,127 @@
+from datetime import datetime
+from urllib.parse import urljoin
+from database import upsert, Review, ReviewCrawlProgress
+from parser import parse_comments_page
+from utils import logger
+import metrics
+from config import CRAWL_CONFIG
+
+# 短评按时间倒序翻页：新增短评只会让已抓取的短评后移，续抓时会重复读到(按review_id去重)而不会漏掉
+COMMENTS_PATH = '/subject/{movie_id}/comments?start={start}&limit={limit}&status=P&sort=time'
+
+def comments_url(movie_id, start, limit=20):
+    return urljoin(CRAWL_CONFIG['base_url'], COMMENTS_PATH.format(movie_id=movie_id, start=start, limit=limit))
+
+def iter_review_pages(fetch, movie_id, start=0, page_size=20):
+    """从start开始逐页抓取并解析短评，产出 (下一页偏移, 本页短评, 是否还有下一页)
+
+    fetch(url)返回页面HTML；生成器每次只持有一页的数据
+    """
+    while True:
+        html = fetch(comments_url(movie_id, start, page_size))
+        with metrics.PARSE_SECONDS.time(page='comments'):
+            reviews, has_next = parse_comments_page(html, movie_id)
+        start += page_size
+        yield start, reviews, has_next and bool(reviews)
+        if not has_next or not reviews:
+            return
+
+def crawl_movie_reviews(db_handler, fetch, movie_id, batch_size=None, page_size=20, max_reviews=None):
+    """抓取一部电影的短评，返回本次新入库的短评数
+
+    短评累计到batch_size条时与抓取进度在同一事务中提交，内存占用与短评总数无关。
+    首次抓取逐页翻到最后一页，中断后从已提交的偏移继续；翻页结束后再次运行时做增量刷新：
+    从第一页开始，抓到发布时间早于上次记录的最新短评的页面为止。
+    max_reviews为本次运行每部电影最多抓取的短评数，达到上限时保存进度，下次运行继续。
+    进度中的fetched_count只累计实际新入库的短评，重复读到的已有短评不计入
+    """
+    batch_size = batch_size or CRAWL_CONFIG['review_batch_size']
+    session = db_handler.session
+    progress = session.query(ReviewCrawlProgress).filter_by(movie_id=movie_id).first()
+    refresh = bool(progress and progress.finished_at)
+    watermark = progress.newest_publish_date if progress else None
+    if refresh:
+        # 已翻到最后一页：只抓取上次之后发布的短评，翻页偏移保持不变
+        start = 0
+        logger.info(f"电影 {movie_id} 的短评增量刷新，抓取 {watermark or '最早'} 之后发布的短评")
+    else:
+        start = progress.next_start if progress else 0
+        if start:
+            logger.info(f"电影 {movie_id} 的短评从偏移 {start} 继续抓取")
+    fetched = progress.fetched_count if progress else 0
+    saved_start = progress.next_start if refresh else start
+    newest = watermark
+
+    batch = {}
+    crawled = 0
+    inserted = 0
+    finished = False
+    next_start = start
+    try:
+        for next_start, reviews, has_next in iter_review_pages(fetch, movie_id, start, page_size):
+            for review in reviews:
+                batch[review['review_id']] = review
+            crawled += len(reviews)
+            dates = [review['publish_date'] for review in reviews if review['publish_date']]
+            newest = max((date for date in (newest, *dates) if date), default=None)
+            finished = not has_next
+            if refresh and watermark and dates and min(dates) < watermark:
+                # 本页已出现上次抓取过的短评，更早的页面无需再翻
+                finished = True
+            capped = bool(max_reviews and crawled >= max_reviews and not finished)
+            if not refresh:
+                saved_start = next_start
+            if len(batch) >= batch_size or finished or capped:
+                # 增量刷新完成前不推进最新发布时间，中断或被上限截断时下次刷新仍能补齐
+                inserted += _flush(session, movie_id, batch, saved_start, fetched + inserted, finished or refresh,
+                                   newest if finished or not refresh else watermark)
+                batch = {}
+            if finished or capped:
+                if capped:
+                    logger.info(f"电影 {movie_id} 本次已抓取 {crawled} 条短评，达到上限，下次运行继续")
+                break
+        logger.info(f"电影 {movie_id} 的短评抓取结束，本次读取 {crawled} 条，新增 {inserted} 条")
+    finally:
+        # 出错时保存已抓取的部分，下次从此处继续
+        if batch:
+            inserted += _flush(session, movie_id, batch, saved_start, fetched + inserted, refresh,
+                               watermark if refresh else newest)
+    return inserted
+
+def _flush(session, movie_id, batch, next_start, fetched_before, finished, newest_publish_date):
+    """写入一批短评并更新抓取进度，已存在的短评保持不变，返回新入库的短评数
+
+    fetched_before为本批之前已入库的短评数，进度中的fetched_count加上本批新增的条数
+    """
+    now = datetime.now()
+    try:
+        existing = session.query(Review.review_id).filter(Review.review_id.in_(list(batch))).count()
+        new_count = len(batch) - existing
+        review_rows = [
+            {
+                'review_id': review['review_id'],
+                'movie_id': movie_id,
+                'user_name': review['user_name'],
+                'rating': review['rating'] or 0,
+                'content': review['content'],
+                'publish_date': review['publish_date'],
+                'created_at': now,
+                'updated_at': now
+            }
+            for review in batch.values()
+        ]
+        upsert(session, Review, review_rows, [])
+        upsert(session, ReviewCrawlProgress, [{
+            'movie_id': movie_id,
+            'next_start': next_start,
+            'fetched_count': fetched_before + new_count,
+            'finished_at': now if finished else None,
+            'newest_publish_date': newest_publish_date,
+            'created_at': now,
+            'updated_at': now
+        }], ['next_start', 'fetched_count', 'finished_at', 'newest_publish_date', 'updated_at'])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return new_count
@@ -0,0 +1,144 @@
+import hashlib
+import heapq
+import math
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from utils import logger
+
+class SeenIndex:
+    """已入库电影ID的紧凑索引
+    
+    启动时加载的ID按升序存放在array('q')中（每个ID 8字节），用二分查找判断；
+    运行期间新增的ID放在小集合里，超过阈值时合并进数组
+    """
+    def __init__(self, sorted_ids=(), merge_threshold=4096):
+        self._base = array('q', sorted_ids)
+        self._added = set()
+        self._merge_threshold = merge_threshold
+        self._lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self._base) + len(self._added)
+        
+    def __contains__(self, movie_id):
+        if movie_id in self._added:
+            return True
+        base = self._base
+        idx = bisect_left(base, movie_id)
+        return idx < len(base) and base[idx] == movie_id
+        
+    def add(self, movie_id):
+        if movie_id in self:
+            return
+        with self._lock:
+            self._added.add(movie_id)
+            if len(self._added) >= self._merge_threshold:
+                self._base = _merge_sorted(self._base, sorted(self._added))
+                self._added = set()
+                
+    def save(self):
+        """内存索引无需持久化"""
+
+def _merge_sorted(base, added):
+    """线性合并两个升序序列为新的array('q')，跳过重复ID，不创建整个索引的集合"""
+    merged = array('q')
+    last = None
+    for movie_id in heapq.merge(base, added):
+        if movie_id != last:
+            merged.append(movie_id)
+            last = movie_id
+    return merged
+
+class BloomFilter:
+    """可持久化到文件的布隆过滤器，用于超大规模ID集合的近似判重
+    
+    只会误判"已存在"（概率约为error_rate），不会漏判；不支持删除
+    """
+    MAGIC = b'DBBF'
+    HEADER = struct.Struct('<4sQIQ')
+    
+    def __init__(self, capacity, error_rate=0.001, path=None):
+        self.path = path
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+        
+    @classmethod
+    def load(cls, path):
+        """从文件加载，文件格式不正确时抛出ValueError"""
+        with open(path, 'rb') as f:
+            magic, num_bits, num_hashes, count = cls.HEADER.unpack(f.read(cls.HEADER.size))
+            if magic != cls.MAGIC:
+                raise ValueError(f"不是有效的布隆过滤器文件: {path}")
+            bloom = cls.__new__(cls)
+            bloom.path = path
+            bloom.num_bits = num_bits
+            bloom.num_hashes = num_hashes
+            bloom.count = count
+            bloom._bits = bytearray(f.read())
+            bloom._lock = threading.Lock()
+        if len(bloom._bits) != (num_bits + 7) // 8:
+            raise ValueError(f"布隆过滤器文件已损坏: {path}")
+        return bloom
+        
+    def save(self):
+        """原子地写回文件"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with self._lock, open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes, self.count))
+            f.write(self._bits)
+        os.replace(tmp_path, self.path)
+        
+    def __len__(self):
+        return self.count
+        
+    def _positions(self, key):
+        # 双重哈希：h1 + i*h2 生成num_hashes个位置
+        digest = hashlib.blake2b(str(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+        
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+        
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            bits = self._bits
+            new = False
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    new = True
+            if new:
+                self.count += 1
+
+def load_seen_index(db_handler, bloom_path=None, bloom_capacity=10_000_000):
+    """加载已入库电影ID索引
+    
+    指定bloom_path时优先从布隆过滤器文件加载，文件不存在则从数据库流式构建并保存；
+    否则从数据库流式读取movie_id列构建SeenIndex
+    """
+    if bloom_path:
+        if os.path.exists(bloom_path):
+            try:
+                return BloomFilter.load(bloom_path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning(f"加载布隆过滤器失败: {e}，从数据库重建")
+        bloom = BloomFilter(bloom_capacity, path=bloom_path)
+        for movie_id in db_handler.iter_movie_ids():
+            bloom.add(movie_id)
+        bloom.save()
+        return bloom
+    # movie_id按升序返回，可直接作为有序数组
+    return SeenIndex(db_handler.iter_movie_ids())
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试不读取真实环境，为config.py中的必填项提供占位值，不会实际连接MySQL
+for _key, _value in {
+    'DB_HOST': 'localhost', 'DB_PORT': '3306', 'DB_USER': 'test', 'DB_PASSWORD': '',
+    'DB_NAME': 'test', 'DB_CHARSET': 'utf8mb4', 'BASE_URL': 'https://movie.douban.com/top250',
+    'CRAWL_MODE': 'full', 'SLEEP_MIN': '0', 'SLEEP_MAX': '0', 'RETRY_TIMES': '3',
+}.items():
+    os.environ.setdefault(_key, _value)
+
+import database
+
+@pytest.fixture
+def db():
+    """绑定到进程内SQLite的DatabaseHandler，各线程共用同一个连接，测试结束后丢弃"""
+    database.bind_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    handler = database.DatabaseHandler()
+    handler.create_tables()
+    yield handler
+    handler.close()
@@ -0,0 +1,67 @@
+import time
+
+import metrics
+from db_writer import DBWriter
+
+def record(movie_id):
+    return {'movie_id': movie_id, 'url': f'https://movie.douban.com/subject/{movie_id}/', 'movie_info': {}}
+
+def run_writer(records, save_func, **callbacks):
+    writer = DBWriter(save_func, batch_size=len(records), interval=60, **callbacks)
+    writer.start()
+    for item in records:
+        writer.submit(item)
+    writer.close()
+    return writer
+
+def test_batch_is_committed_once(db):
+    calls = []
+    saved = []
+    def save(db_handler, item, commit=True):
+        calls.append((item['movie_id'], commit))
+    writer = run_writer([record(1), record(2)], save, on_saved=lambda item: saved.append(item['movie_id']))
+    assert calls == [(1, False), (2, False)]
+    assert saved == [1, 2]
+    assert writer.saved_count == 2
+
+def test_failed_batch_falls_back_to_one_record_at_a_time(db):
+    saved, failed = [], []
+    def save(db_handler, item, commit=True):
+        if item['movie_id'] == 2:
+            raise ValueError('bad row')
+    writer = run_writer(
+        [record(1), record(2), record(3)], save,
+        on_saved=lambda item: saved.append(item['movie_id']),
+        on_failed=lambda item, e: failed.append((item['movie_id'], str(e)))
+    )
+    assert saved == [1, 3]
+    assert failed == [(2, 'bad row')]
+    assert writer.saved_count == 2
+
+def test_on_saved_error_does_not_resave_committed_batch(db):
+    calls = []
+    saved_before = metrics.MOVIES.summary().get('result=saved', 0)
+    errors_before = metrics.ERRORS.summary().get('stage=writer_callback', 0)
+    def save(db_handler, item, commit=True):
+        calls.append(item['movie_id'])
+    def on_saved(item):
+        raise RuntimeError('database is locked')
+    writer = run_writer([record(1), record(2)], save, on_saved=on_saved)
+    assert calls == [1, 2]
+    assert writer.saved_count == 2
+    assert metrics.MOVIES.summary()['result=saved'] - saved_before == 2
+    assert metrics.ERRORS.summary()['stage=writer_callback'] - errors_before == 2
+
+def test_flush_commits_partial_batch_without_waiting(db):
+    saved = []
+    writer = DBWriter(lambda db_handler, item, commit=True: None, batch_size=100, interval=60,
+                      on_saved=lambda item: saved.append(item['movie_id']))
+    writer.start()
+    writer.submit(record(1))
+    writer.flush()
+    # 提交时限为60秒，只有flush能让这一条提前提交
+    deadline = time.monotonic() + 5
+    while not saved and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert saved == [1]
+    writer.close()
@@ -0,0 +1,115 @@
+import pytest
+
+from frontier import DONE, FAILED, IN_FLIGHT, PENDING, DatabaseFrontier, Frontier, backoff_delay
+
+@pytest.fixture(params=['sqlite', 'database'])
+def make_frontier(request, tmp_path):
+    """按owner创建共享同一个队列的抓取队列实例"""
+    if request.param == 'database':
+        db = request.getfixturevalue('db')
+        yield lambda owner='a', **kwargs: DatabaseFrontier(owner=owner, **kwargs)
+        db.session.close()
+        return
+    frontiers = []
+    def make(owner='a', **kwargs):
+        frontier = Frontier(str(tmp_path / 'frontier.db'), owner=owner, **kwargs)
+        frontiers.append(frontier)
+        return frontier
+    yield make
+    for frontier in frontiers:
+        frontier.close()
+
+def test_add_ignores_existing_url(make_frontier):
+    frontier = make_frontier()
+    assert frontier.add('u1', 'detail', movie_id=1, top250_rank=3)
+    assert not frontier.add('u1', 'detail', movie_id=1)
+    [task] = frontier.claim('detail', 10)
+    assert (task.url, task.movie_id, task.top250_rank, task.attempts) == ('u1', 1, 3, 0)
+
+def test_claim_orders_by_priority_then_page(make_frontier):
+    frontier = make_frontier()
+    frontier.add('late', 'detail', page=0, priority=5)
+    frontier.add('p1', 'detail', page=1)
+    frontier.add('p0', 'detail', page=0)
+    assert [task.url for task in frontier.claim('detail', 10)] == ['p0', 'p1', 'late']
+    assert frontier.claim('detail', 10) == []
+
+def test_lease_blocks_other_workers_until_expired(make_frontier):
+    a = make_frontier('a', lease_seconds=600)
+    b = make_frontier('b', lease_seconds=600)
+    a.add('u1', 'detail')
+    assert len(a.claim('detail')) == 1
+    assert b.claim('detail') == []
+    assert b.seconds_until_eligible() > 500
+
+    short = make_frontier('c', lease_seconds=0)
+    short.add('u2', 'detail')
+    assert [task.url for task in short.claim('detail')] == ['u2']
+    # 租约已到期，其他worker可以接手
+    assert [task.url for task in b.claim('detail')] == ['u2']
+
+def test_fail_from_previous_lease_holder_is_ignored(make_frontier):
+    a = make_frontier('a', lease_seconds=0)
+    b = make_frontier('b')
+    a.add('u1', 'detail')
+    a.claim('detail')
+    b.claim('detail')
+    a.fail('u1', 'timeout')
+    assert b.counts() == {IN_FLIGHT: 1}
+    b.complete('u1')
+    assert b.counts() == {DONE: 1}
+
+def test_fail_backs_off_then_gives_up(make_frontier):
+    frontier = make_frontier(max_attempts=2, base_delay=600)
+    frontier.add('u1', 'detail')
+    frontier.claim('detail')
+    frontier.fail('u1', 'boom')
+    assert frontier.counts() == {PENDING: 1}
+    # 退避期间不能领取
+    assert frontier.claim('detail') == []
+    assert 300 - 1 <= frontier.seconds_until_eligible() <= 600
+
+    fast = make_frontier(max_attempts=2, base_delay=0)
+    fast.add('u2', 'detail')
+    fast.claim('detail')
+    fast.fail('u2', 'boom')
+    [task] = fast.claim('detail')
+    assert task.attempts == 1
+    fast.fail('u2', 'boom again')
+    assert fast.failed() == [('u2', 'boom again')]
+
+def test_retry_failed_and_clear_by_state(make_frontier):
+    frontier = make_frontier(max_attempts=1)
+    frontier.add('bad', 'detail')
+    frontier.add('good', 'detail')
+    for task in frontier.claim('detail', 10):
+        if task.url == 'bad':
+            frontier.fail(task.url, 'boom')
+        else:
+            frontier.complete(task.url)
+    assert frontier.counts() == {DONE: 1, FAILED: 1}
+    assert frontier.seconds_until_eligible() is None
+
+    frontier.clear(DONE)
+    assert frontier.counts() == {FAILED: 1}
+    assert frontier.retry_failed() == 1
+    [task] = frontier.claim('detail')
+    assert (task.url, task.attempts) == ('bad', 0)
+    frontier.clear()
+    assert frontier.counts() == {}
+
+def test_recover_requeues_in_flight_tasks(tmp_path):
+    path = str(tmp_path / 'frontier.db')
+    crashed = Frontier(path, owner='a')
+    crashed.add('u1', 'detail')
+    crashed.claim('detail')
+    crashed.close()
+    frontier = Frontier(path, owner='a')
+    assert frontier.recover() == 1
+    assert [task.url for task in frontier.claim('detail')] == ['u1']
+    frontier.close()
+
+def test_backoff_delay_is_capped():
+    for attempts in range(1, 20):
+        delay = backoff_delay(attempts, 30, 3600)
+        assert 0.5 * min(3600, 30 * 2 ** (attempts - 1)) <= delay <= min(3600, 30 * 2 ** (attempts - 1))
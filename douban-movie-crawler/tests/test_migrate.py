@@ -0,0 +1,45 @@
+from sqlalchemy import inspect, text
+
+from database import CrawlTask, Director, MovieDirectorRelation
+
+def index_names(db, table):
+    return {index['name'] for index in inspect(db.session.get_bind()).get_indexes(table)}
+
+def test_migrate_merges_duplicate_entities_before_creating_unique_indexes(db):
+    session = db.session
+    session.execute(text('DROP INDEX uk_director_id'))
+    session.execute(text('DROP INDEX uk_movie_director'))
+    session.add_all([
+        Director(id=1, director_id=100, name='A'),
+        Director(id=2, director_id=100, name='A'),
+        Director(id=3, director_id=200, name='B'),
+        # 关联表引用导演表的自增ID，重复导演合并后两行指向同一导演
+        MovieDirectorRelation(movie_id=1, director_id=1),
+        MovieDirectorRelation(movie_id=1, director_id=2),
+        MovieDirectorRelation(movie_id=2, director_id=2),
+    ])
+    session.commit()
+    assert {index.name for index in db.missing_indexes()} == {'uk_director_id', 'uk_movie_director'}
+
+    created = db.migrate_schema()
+    assert set(created) == {'directors.uk_director_id', 'movie_director_relation.uk_movie_director'}
+    session.expire_all()
+    assert sorted((row.id, row.director_id) for row in session.query(Director)) == [(1, 100), (3, 200)]
+    assert sorted((row.movie_id, row.director_id) for row in session.query(MovieDirectorRelation)) == [(1, 1), (2, 1)]
+    assert {'uk_director_id'} <= index_names(db, 'directors')
+    assert db.missing_indexes() == []
+
+def test_migrate_adds_missing_nullable_columns(db):
+    session = db.session
+    session.execute(text('ALTER TABLE crawl_frontier DROP COLUMN top250_rank'))
+    session.commit()
+    assert [column.name for column in db.missing_columns()] == ['top250_rank']
+
+    assert db.migrate_schema() == ['crawl_frontier.top250_rank']
+    assert db.missing_columns() == []
+    session.add(CrawlTask(url='u1', kind='detail', top250_rank=7))
+    session.commit()
+    assert session.query(CrawlTask.top250_rank).scalar() == 7
+
+def test_migrate_is_a_no_op_on_current_schema(db):
+    assert db.migrate_schema() == []
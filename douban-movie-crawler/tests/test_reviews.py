@@ -0,0 +1,99 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Review, ReviewCrawlProgress
+from reviews import crawl_movie_reviews
+
+MOVIE_ID = 1292052
+
+class FakeComments:
+    """按发布时间倒序分页的短评页面，记录每次请求的偏移"""
+    def __init__(self, count):
+        self.reviews = []
+        self.requests = []
+        self.publish(count)
+
+    def publish(self, count):
+        start = datetime(2024, 1, 1) + timedelta(hours=len(self.reviews))
+        new = [(f'{len(self.reviews) + i}', start + timedelta(hours=i)) for i in range(count)]
+        self.reviews = list(reversed(new)) + self.reviews
+
+    def fetch(self, url):
+        start, limit = map(int, re.search(r'start=(\d+)&limit=(\d+)', url).groups())
+        self.requests.append(start)
+        items = ''.join(
+            f'<div class="comment-item" data-cid="{review_id}"><div class="comment"><h3><span class="comment-info">'
+            f'<a href="#">user{review_id}</a><span class="allstar40 rating" title="推荐"></span>'
+            f'<span class="comment-time" title="{date:%Y-%m-%d %H:%M:%S}">{date:%Y-%m-%d}</span></span></h3>'
+            f'<p><span class="short">短评{review_id}</span></p></div></div>'
+            for review_id, date in self.reviews[start:start + limit]
+        )
+        has_next = start + limit < len(self.reviews)
+        paginator = f'<a href="?start={start + limit}" class="next">后页</a>' if has_next else '<span class="next">后页</span>'
+        return f'<html><body>{items}<div id="paginator">{paginator}</div></body></html>'
+
+def progress(db):
+    db.session.expire_all()
+    return db.session.query(ReviewCrawlProgress).filter_by(movie_id=MOVIE_ID).one()
+
+def review_count(db):
+    return db.session.query(Review).filter_by(movie_id=MOVIE_ID).count()
+
+@pytest.fixture
+def site():
+    return FakeComments(45)
+
+def test_first_crawl_reads_every_page(db, site):
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, batch_size=10, page_size=20) == 45
+    assert site.requests == [0, 20, 40]
+    assert review_count(db) == 45
+    state = progress(db)
+    assert (state.fetched_count, state.finished_at is not None) == (45, True)
+    assert state.newest_publish_date == site.reviews[0][1]
+
+def test_refresh_without_new_reviews_does_not_inflate_counts(db, site):
+    crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20)
+    site.requests.clear()
+    for _ in range(3):
+        assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20) == 0
+    assert progress(db).fetched_count == 45
+    assert review_count(db) == 45
+    # 第一页最早的短评已早于上次记录的最新发布时间，每次刷新只读一页
+    assert site.requests == [0, 0, 0]
+
+def test_refresh_picks_up_new_reviews_and_advances_watermark(db, site):
+    crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20)
+    site.publish(25)
+    site.requests.clear()
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20) == 25
+    assert site.requests == [0, 20]
+    state = progress(db)
+    assert (state.fetched_count, state.next_start) == (70, 60)
+    assert state.newest_publish_date == site.reviews[0][1]
+    assert review_count(db) == 70
+
+def test_max_reviews_caps_one_run_and_resumes(db, site):
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20, max_reviews=20) == 20
+    state = progress(db)
+    assert (state.next_start, state.finished_at) == (20, None)
+    site.requests.clear()
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20, max_reviews=20) == 20
+    assert site.requests == [20]
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20, max_reviews=20) == 5
+    state = progress(db)
+    assert (state.fetched_count, state.finished_at is not None) == (45, True)
+
+def test_failed_page_keeps_progress_for_next_run(db, site):
+    def flaky(url):
+        if 'start=20&' in url:
+            raise RuntimeError('blocked')
+        return site.fetch(url)
+    with pytest.raises(RuntimeError):
+        crawl_movie_reviews(db, flaky, MOVIE_ID, batch_size=100, page_size=20)
+    state = progress(db)
+    assert (state.next_start, state.fetched_count, state.finished_at) == (20, 20, None)
+    site.requests.clear()
+    assert crawl_movie_reviews(db, site.fetch, MOVIE_ID, page_size=20) == 25
+    assert site.requests == [20, 40]
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from database import Movie
+from seen import BloomFilter, SeenIndex, _merge_sorted, load_seen_index
+
+def test_seen_index_lookup_and_merge():
+    index = SeenIndex([2, 5, 9], merge_threshold=3)
+    assert 5 in index and 4 not in index
+    for movie_id in (7, 5, 1, 7):
+        index.add(movie_id)
+    assert len(index) == 5
+    index.add(12)
+    # 达到阈值后新增的ID合并进有序数组
+    assert list(index._base) == [1, 2, 5, 7, 9, 12]
+    assert not index._added
+    assert all(movie_id in index for movie_id in (1, 2, 5, 7, 9, 12))
+    assert 3 not in index
+
+def test_merge_sorted_skips_duplicates():
+    assert list(_merge_sorted([1, 3, 5], [1, 2, 5, 6])) == [1, 2, 3, 5, 6]
+    assert list(_merge_sorted([], [4, 4])) == [4]
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for movie_id in range(0, 2000, 2):
+        bloom.add(movie_id)
+    assert len(bloom) == 1000
+    assert all(movie_id in bloom for movie_id in range(0, 2000, 2))
+    false_positives = sum(movie_id in bloom for movie_id in range(1, 2000, 2))
+    assert false_positives < 50
+
+def test_bloom_filter_round_trip(tmp_path):
+    path = str(tmp_path / 'seen.bloom')
+    bloom = BloomFilter(100, path=path)
+    bloom.add(1292052)
+    bloom.save()
+    loaded = BloomFilter.load(path)
+    assert 1292052 in loaded and len(loaded) == 1
+
+    with open(path, 'r+b') as f:
+        f.truncate(BloomFilter.HEADER.size + 1)
+    with pytest.raises(ValueError):
+        BloomFilter.load(path)
+
+def test_load_seen_index_from_database(db, tmp_path):
+    db.session.add_all([Movie(movie_id=movie_id, title='', url='') for movie_id in (30, 10, 20)])
+    db.session.add(Movie(movie_id=40, title='', url='', deleted_at=datetime.now()))
+    db.session.commit()
+
+    index = load_seen_index(db)
+    assert isinstance(index, SeenIndex)
+    assert list(index._base) == [10, 20, 30]
+
+    path = str(tmp_path / 'seen.bloom')
+    bloom = load_seen_index(db, bloom_path=path, bloom_capacity=1000)
+    assert isinstance(bloom, BloomFilter) and 20 in bloom
+    # 已有的布隆过滤器文件直接加载，不再读取数据库
+    db.session.add(Movie(movie_id=50, title='', url=''))
+    db.session.commit()
+    assert 50 not in load_seen_index(db, bloom_path=path)
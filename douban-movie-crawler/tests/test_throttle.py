@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from utils import AdaptiveThrottle
+
+def make_throttle(**kwargs):
+    options = dict(rate=10, min_rate=1, max_rate=20, burst=2, target_latency=1, block_cooldown=0.5,
+                   increase_step=1, decrease_factor=0.5, jitter=0, report_rate=False)
+    options.update(kwargs)
+    return AdaptiveThrottle(**options)
+
+def test_burst_then_spaced_at_rate():
+    throttle = make_throttle()
+    assert throttle.reserve() == pytest.approx(0, abs=0.01)
+    assert throttle.reserve() == pytest.approx(0, abs=0.01)
+    # 令牌用完后按1/rate排队
+    assert throttle.reserve() == pytest.approx(0.1, abs=0.01)
+    assert throttle.reserve() == pytest.approx(0.2, abs=0.01)
+
+def test_expected_delay_does_not_take_a_token():
+    throttle = make_throttle(burst=1)
+    assert throttle.expected_delay() == pytest.approx(0, abs=0.01)
+    assert throttle.expected_delay() == pytest.approx(0, abs=0.01)
+    throttle.reserve()
+    assert throttle.expected_delay() == pytest.approx(0.1, abs=0.01)
+
+def test_block_pauses_and_spaces_queued_requests_after_cooldown():
+    throttle = make_throttle()
+    throttle.feedback(status=403)
+    assert throttle.rate == 5
+    delays = [throttle.reserve() for _ in range(4)]
+    # 暂停结束后按新的速率依次放行，不会在同一时刻一起发出
+    assert delays == pytest.approx([0.7, 0.9, 1.1, 1.3], abs=0.02)
+    assert throttle.expected_delay() == pytest.approx(1.5, abs=0.02)
+
+def test_captcha_page_counts_as_block():
+    throttle = make_throttle()
+    throttle.feedback(status=200, blocked=True)
+    assert throttle.rate == 5
+    assert throttle.expected_delay() >= 0.5
+
+def test_slow_or_failed_responses_decrease_once_per_window():
+    throttle = make_throttle()
+    throttle.feedback(latency=2.0, status=200)
+    throttle.feedback(status=500)
+    throttle.feedback(error=True)
+    assert throttle.rate == 5
+
+def test_fast_responses_increase_up_to_max_rate():
+    throttle = make_throttle(rate=18)
+    for _ in range(5):
+        throttle.feedback(latency=0.1, status=200)
+    assert throttle.rate == 20
+
+def test_rate_never_drops_below_min_rate(monkeypatch):
+    throttle = make_throttle(rate=1.5)
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    for _ in range(5):
+        now[0] += 10
+        throttle.feedback(status=500)
+    assert throttle.rate == 1
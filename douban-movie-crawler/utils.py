@@ -1,43 +1,147 @@
+import functools
+import hashlib
+import json
 import random
 import logging
+import threading
 import time
 from config import CRAWL_CONFIG, LOG_CONFIG
+import metrics
 
-# 配置日志
-logging.basicConfig(
-    level=LOG_CONFIG['level'],
-    format=LOG_CONFIG['format'],
-    handlers=[
-        logging.FileHandler(LOG_CONFIG['file_path']),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger('douban_crawler')
 
+def setup_logging():
+    """配置日志输出到文件和控制台，由命令入口调用；日志文件在第一次写入时才创建"""
+    logging.basicConfig(
+        level=LOG_CONFIG['level'],
+        format=LOG_CONFIG['format'],
+        handlers=[
+            logging.FileHandler(LOG_CONFIG['file_path'], delay=True),
+            logging.StreamHandler()
+        ]
+    )
+
 def get_random_user_agent():
     """获取随机User-Agent"""
     return random.choice(CRAWL_CONFIG['user_agent_pool'])
 
-def random_sleep():
-    """随机延时"""
-    delay = random.uniform(CRAWL_CONFIG['sleep_min'], CRAWL_CONFIG['sleep_max'])
-    time.sleep(delay)
-    logger.debug(f"随机延时: {delay:.2f}秒")
+class AdaptiveThrottle:
+    """全局自适应限速：所有worker共享的令牌桶，速率按AIMD调整
+
+    每个请求前调用wait()取令牌，请求后调用feedback()报告结果：
+    响应正常且耗时低于target_latency时速率加性增加increase_step(请求/秒)；
+    响应变慢、出错或5xx时速率乘以decrease_factor；
+    被拦截(验证码/登录页/403/429)时速率减半并暂停block_cooldown秒。
+    同一时间窗口内的多次失败只降速一次，避免并发失败把速率降到底。
+    出口身份池中每个身份各有一个限速器，report_rate为False时不上报全局速率指标
+    """
+    def __init__(self, rate=None, min_rate=None, max_rate=None, burst=None, target_latency=None,
+                 block_cooldown=None, increase_step=0.05, decrease_factor=0.7, jitter=0.2, report_rate=True):
+        sleep_min, sleep_max = CRAWL_CONFIG['sleep_min'], CRAWL_CONFIG['sleep_max']
+        self.min_rate = min_rate or CRAWL_CONFIG['rate_min']
+        # 未配置时按SLEEP_MIN/SLEEP_MAX推算上限和初始速率
+        self.max_rate = max_rate or CRAWL_CONFIG['rate_max'] or (1 / sleep_min if sleep_min > 0 else 20.0)
+        initial = rate or CRAWL_CONFIG['rate_initial'] or (2 / (sleep_min + sleep_max) if sleep_min + sleep_max > 0 else self.max_rate)
+        self.rate = min(self.max_rate, max(self.min_rate, initial))
+        self.burst = burst or CRAWL_CONFIG['rate_burst']
+        self.target_latency = target_latency or CRAWL_CONFIG['rate_target_latency']
+        self.block_cooldown = CRAWL_CONFIG['block_cooldown'] if block_cooldown is None else block_cooldown
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.jitter = jitter
+        self.report_rate = report_rate
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        if self.report_rate:
+            metrics.REQUEST_RATE.set(self.rate)
+        
+    def wait(self):
+        """等待直到取得一个令牌"""
+        delay = self.reserve()
+        metrics.SLEEP_SECONDS.observe(delay)
+        if delay > 0:
+            time.sleep(delay)
+            logger.debug(f"请求排队等待: {delay:.2f}秒")
+            
+    def reserve(self):
+        """取走一个令牌，返回使用前需要等待的秒数(不等待)
+
+        暂停期间_last为暂停结束时间，不补充令牌；排队的请求从暂停结束起按1/rate的间隔依次放行
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now > self._last:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+            # 令牌为负表示前面已有请求在排队
+            self._tokens -= 1
+            delay = (self._last - now) + max(0.0, -self._tokens / self.rate)
+            return delay + random.uniform(0, self.jitter / self.rate)
+            
+    def expected_delay(self):
+        """现在取令牌需要等待的秒数(不取走令牌)"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._tokens
+            if now > self._last:
+                tokens = min(self.burst, tokens + (now - self._last) * self.rate)
+            return max(0.0, self._last - now) + max(0.0, (1 - tokens) / self.rate)
+            
+    def feedback(self, latency=None, status=None, blocked=False, error=False):
+        """报告一次请求的结果，据此调整速率"""
+        blocked = blocked or status in (403, 429)
+        slow = error or (status is not None and status >= 500) or (latency is not None and latency > self.target_latency)
+        with self._lock:
+            now = time.monotonic()
+            if blocked:
+                # 令牌桶的时钟拨到暂停结束，之后的请求从那时起按当前速率依次放行
+                self._last = max(self._last, now + self.block_cooldown)
+                self._tokens = min(self._tokens, 0.0)
+                self._decrease(now, 0.5)
+            elif slow:
+                self._decrease(now, self.decrease_factor)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+            if self.report_rate:
+                metrics.REQUEST_RATE.set(self.rate)
+        if blocked:
+            logger.warning(f"请求被拦截，暂停 {self.block_cooldown:.0f} 秒，速率降至 {self.rate:.2f} 次/秒")
+            
+    def _decrease(self, now, factor):
+        # 每个窗口(至少1秒或一个请求间隔)只降速一次
+        if now - self._last_decrease < max(1.0, 1 / self.rate):
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
 
-def retry(tries=3, delay=1):
-    """重试装饰器"""
+def retry(tries=3, delay=1, backoff=2, max_delay=60, exceptions=(Exception,)):
+    """重试装饰器：只重试exceptions中的异常，第n次重试前等待 delay*backoff^(n-1) 秒(上限max_delay)，带随机抖动"""
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             attempt = 0
             while attempt < tries:
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
+                except exceptions as e:
                     attempt += 1
                     if attempt == tries:
                         raise
-                    logger.warning(f"尝试失败 {attempt}/{tries}: {e}，{delay}秒后重试")
-                    time.sleep(delay)
+                    wait = min(max_delay, delay * backoff ** (attempt - 1))
+                    wait = random.uniform(wait / 2, wait)
+                    logger.warning(f"尝试失败 {attempt}/{tries}: {e}，{wait:.1f}秒后重试")
+                    metrics.RETRIES.inc(kind=func.__name__)
+                    time.sleep(wait)
         return wrapper
     return decorator
-    
\ No newline at end of file
+
+def page_hash(html):
+    """原始页面内容摘要"""
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+def content_hash(data):
+    """解析结果摘要：按键排序序列化后计算，日期等对象按字符串处理"""
+    serialized = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()